@@ -15,6 +15,16 @@
 #include <string>
 #include <sstream>
 #include <cstdlib>
+#include <cstring>
+#include <iostream>
+#include <vector>
+
+#ifndef _WIN32
+#  include <cerrno>
+#  include <fcntl.h>
+#  include <sys/wait.h>
+#  include <unistd.h>
+#endif
 
 #include "llvm/Support/raw_ostream.h"
 #include "TransformationManager.h"
@@ -60,7 +70,9 @@ static void PrintHelpMessage()
 
   llvm::outs() << "  --query-instances=<name>: ";
   llvm::outs() << "query available transformation instances for a given ";
-  llvm::outs() << "transformation\n";
+  llvm::outs() << "transformation; with the name all, print a ";
+  llvm::outs() << "\"<transformation>: <instances>\" line for every ";
+  llvm::outs() << "transformation (<instances> is error if the query failed)\n";
 
   llvm::outs() << "  --counter=<number>: ";
   llvm::outs() << "specify the instance of the transformation to perform\n";
@@ -72,6 +84,14 @@ static void PrintHelpMessage()
   llvm::outs() << "simultaneously. Note that currently only ";
   llvm::outs() << "replace-function-def-with-decl supports this feature.)\n";
 
+  llvm::outs() << "  --counters=<list>: ";
+  llvm::outs() << "render the variant of every counter in a comma-separated ";
+  llvm::outs() << "list of counters and ranges (e.g. 1,4-7) from a single ";
+  llvm::outs() << "parse; the variant of a counter is written to ";
+  llvm::outs() << "<output_filename>.<counter> and stdout gets a ";
+  llvm::outs() << "\"counter <counter> exit <code>\" line for each one ";
+  llvm::outs() << "(requires --output)\n";
+
   llvm::outs() << "  --replacement=<string>: ";
   llvm::outs() << "instead of performing normal rewriting, the candidate ";
   llvm::outs() << "pointed by the counter will be replaced by the passed ";
@@ -100,6 +120,13 @@ static void PrintHelpMessage()
   llvm::outs() << "make only warning when a counter is out of bounds ";
   llvm::outs() << "(replace-function-def-with-decl and remove-unused-function are supported)";
   llvm::outs() << "\n";
+
+  llvm::outs() << "  --server: ";
+  llvm::outs() << "run the requests read from stdin, one per line: the files ";
+  llvm::outs() << "receiving stdout and stderr followed by the usual arguments, ";
+  llvm::outs() << "all separated by tabs; replies with \"pid <pid>\" and ";
+  llvm::outs() << "\"exit <code>\" lines (must be the only option)";
+  llvm::outs() << "\n";
 }
 
 static void DieOnBadCmdArg(const std::string &ArgStr)
@@ -118,6 +145,30 @@ static void Die(const std::string &Message)
   exit(ErrorCode);
 }
 
+static bool ParseCounters(const std::string &Str, std::vector<int> &Counters)
+{
+  std::stringstream SS(Str);
+  std::string Item;
+  while (std::getline(SS, Item, ',')) {
+    std::stringstream ItemSS(Item);
+    int From, To;
+    char Dash;
+    if (!(ItemSS >> From) || (From <= 0))
+      return false;
+    To = From;
+    if (ItemSS >> Dash) {
+      if ((Dash != '-') || !(ItemSS >> To) || (To < From))
+        return false;
+    }
+    std::string Rest;
+    if (ItemSS >> Rest)
+      return false;
+    for (int Counter = From; Counter <= To; ++Counter)
+      Counters.push_back(Counter);
+  }
+  return !Counters.empty();
+}
+
 static void HandleOneArgValue(const std::string &ArgValueStr, size_t SepPos)
 {
   if ((SepPos < 1) || (SepPos >= ArgValueStr.length())) {
@@ -135,6 +186,10 @@ static void HandleOneArgValue(const std::string &ArgValueStr, size_t SepPos)
     }
   }
   else if (!ArgName.compare("query-instances")) {
+    if (!ArgValue.compare("all")) {
+      TransMgr->setQueryAllFlag(true);
+      return;
+    }
     if (TransMgr->setTransformation(ArgValue)) {
       Die("Invalid transformation[" + ArgValue + "]");
     }
@@ -163,6 +218,15 @@ static void HandleOneArgValue(const std::string &ArgValueStr, size_t SepPos)
 
     TransMgr->setToCounter(Val);
   }
+  else if (!ArgName.compare("counters")) {
+    std::vector<int> Counters;
+    if (!ParseCounters(ArgValue, Counters)) {
+      ErrorCode = TransformationManager::ErrorInvalidCounter;
+      Die("Invalid counters[" + ArgValueStr + "]");
+    }
+
+    TransMgr->setBatchCounters(Counters);
+  }
   else if (!ArgName.compare("output")) {
     TransMgr->setOutputFileName(ArgValue);
   }
@@ -232,7 +296,7 @@ static void HandleOneArg(const char *Arg)
   }
 }
 
-int main(int argc, char **argv)
+static int Run(int argc, char **argv)
 {
   TransMgr = TransformationManager::GetInstance();
   for (int i = 1; i < argc; i++) {
@@ -243,6 +307,20 @@ int main(int argc, char **argv)
   if (!TransMgr->verify(ErrorMsg, ErrorCode))
     Die(ErrorMsg);
 
+  if (TransMgr->getQueryAllFlag()) {
+    if (!TransMgr->doQueryAllTransformations(ErrorMsg))
+      Die(ErrorMsg);
+    TransformationManager::Finalize();
+    return 0;
+  }
+
+  if (TransMgr->isBatch()) {
+    if (!TransMgr->doBatchTransformation(ErrorMsg))
+      Die(ErrorMsg);
+    TransformationManager::Finalize();
+    return 0;
+  }
+
   if (!TransMgr->initializeCompilerInstance(ErrorMsg))
     Die(ErrorMsg);
 
@@ -260,3 +338,88 @@ int main(int argc, char **argv)
   return 0;
 }
 
+#ifndef _WIN32
+static int OpenOutput(const std::string &FileName)
+{
+  return open(FileName.c_str(), O_WRONLY | O_CREAT | O_TRUNC, 0644);
+}
+
+// Every request runs in a forked child of a process that is already loaded
+// and initialized, so that a request costs a fork instead of starting a new
+// clang_delta. The translation unit is still parsed for every request because
+// the transformations collect their instances while the parser calls them.
+static int RunServer()
+{
+  std::cout << "ready" << std::endl;
+
+  std::string Line;
+  while (std::getline(std::cin, Line)) {
+    std::vector<std::string> Fields;
+    std::stringstream LineSS(Line);
+    std::string Field;
+    while (std::getline(LineSS, Field, '\t'))
+      Fields.push_back(Field);
+
+    if (Fields.size() < 2) {
+      std::cout << "error bad request" << std::endl;
+      continue;
+    }
+
+    // the outputs are opened before the fork so that a failure is an error
+    // reply and not an exit code of the request
+    int OutFD = OpenOutput(Fields[0]);
+    int ErrFD = OutFD < 0 ? -1 : OpenOutput(Fields[1]);
+    if (ErrFD < 0) {
+      std::cout << "error " << strerror(errno) << std::endl;
+      if (OutFD >= 0)
+        close(OutFD);
+      continue;
+    }
+
+    std::cout.flush();
+    pid_t Pid = fork();
+    if (Pid < 0) {
+      std::cout << "error " << strerror(errno) << std::endl;
+      close(OutFD);
+      close(ErrFD);
+      continue;
+    }
+
+    if (Pid == 0) {
+      // lead a process group that can be killed without the server
+      setsid();
+      dup2(OutFD, STDOUT_FILENO);
+      dup2(ErrFD, STDERR_FILENO);
+      close(OutFD);
+      close(ErrFD);
+
+      std::vector<char *> Args;
+      Args.push_back(const_cast<char *>("clang_delta"));
+      for (size_t I = 2; I < Fields.size(); ++I)
+        Args.push_back(const_cast<char *>(Fields[I].c_str()));
+      Args.push_back(nullptr);
+      exit(Run(Args.size() - 1, Args.data()));
+    }
+
+    close(OutFD);
+    close(ErrFD);
+    std::cout << "pid " << Pid << std::endl;
+
+    int Status;
+    while (waitpid(Pid, &Status, 0) < 0 && errno == EINTR)
+      ;
+    int Code = WIFEXITED(Status) ? WEXITSTATUS(Status) : -WTERMSIG(Status);
+    std::cout << "exit " << Code << std::endl;
+  }
+  return 0;
+}
+#endif
+
+int main(int argc, char **argv)
+{
+#ifndef _WIN32
+  if (argc == 2 && !strcmp(argv[1], "--server"))
+    return RunServer();
+#endif
+  return Run(argc, argv);
+}
@@ -85,7 +85,8 @@ public:
       ToCounter(-1),
       DoReplacement(false),
       CheckReference(false),
-      WarnOnCounterOutOfBounds(false)
+      WarnOnCounterOutOfBounds(false),
+      CounterUsedWhileParsing(false)
   {
     // Nothing to do
   }
@@ -107,7 +108,8 @@ public:
       ToCounter(-1),
       DoReplacement(false),
       CheckReference(false),
-      WarnOnCounterOutOfBounds(false)
+      WarnOnCounterOutOfBounds(false),
+      CounterUsedWhileParsing(false)
   {
     // Nothing to do
   }
@@ -182,6 +184,16 @@ public:
     return false;
   }
 
+  // Transformations handling top-level declarations can consult the
+  // counter while the parser runs, so their variants cannot share a parse
+  void setCounterUsedWhileParsing(bool Flag) {
+    CounterUsedWhileParsing = Flag;
+  }
+
+  bool isCounterUsedWhileParsing() {
+    return CounterUsedWhileParsing;
+  }
+
 protected:
 
   typedef llvm::SmallVector<unsigned int, 10> IndexVector;
@@ -348,6 +360,8 @@ protected:
   std::string ReferenceValue;
 
   bool WarnOnCounterOutOfBounds;
+
+  bool CounterUsedWhileParsing;
 };
 
 class TransNameQueryVisitor;
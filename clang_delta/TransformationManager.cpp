@@ -17,12 +17,22 @@
 #include <iostream>
 #include <sstream>
 
+#ifndef _WIN32
+#  include <algorithm>
+#  include <cerrno>
+#  include <thread>
+#  include <sys/mman.h>
+#  include <sys/wait.h>
+#  include <unistd.h>
+#endif
+
 #include "clang/Basic/Builtins.h"
 #include "clang/Basic/Diagnostic.h"
 #include "clang/Basic/FileManager.h"
 #include "clang/Basic/TargetInfo.h"
 #include "clang/Lex/Preprocessor.h"
 #include "clang/Frontend/CompilerInstance.h"
+#include "clang/Frontend/MultiplexConsumer.h"
 #include "clang/Parse/ParseAST.h"
 
 #include "Transformation.h"
@@ -32,6 +42,116 @@ using namespace clang;
 
 int TransformationManager::ErrorInvalidCounter = 1;
 
+namespace {
+
+// Forwards the parser callbacks to the transformation, but hands the
+// complete translation unit to a handler instead
+class BatchConsumer : public MultiplexConsumer {
+public:
+  BatchConsumer(std::vector<std::unique_ptr<ASTConsumer>> Consumers,
+                std::function<void(ASTContext &)> Handler)
+    : MultiplexConsumer(std::move(Consumers)),
+      Handler(Handler)
+  {
+    // Nothing to do
+  }
+
+  void HandleTranslationUnit(ASTContext &Ctx) override {
+    Handler(Ctx);
+  }
+
+private:
+  std::function<void(ASTContext &)> Handler;
+};
+
+}
+
+#ifndef _WIN32
+namespace {
+
+// Runs functions in forked children, at most MaxRunning at the same time;
+// the children write their messages on stderr
+class ChildProcesses {
+public:
+  explicit ChildProcesses(size_t MaxRunning)
+    : MaxRunning(MaxRunning),
+      Running(0)
+  {
+    // Nothing to do
+  }
+
+  // returns a negative pid if fork fails
+  pid_t start(const std::function<int()> &Run) {
+    while ((Running >= MaxRunning) && reap(-1))
+      ;
+
+    llvm::outs().flush();
+    llvm::errs().flush();
+    pid_t Pid = fork();
+    if (Pid == 0) {
+      dup2(STDERR_FILENO, STDOUT_FILENO);
+      int Code = Run();
+      llvm::outs().flush();
+      llvm::errs().flush();
+      _exit(Code);
+    }
+    if (Pid > 0)
+      ++Running;
+    return Pid;
+  }
+
+  // returns the exit code of the child, negative for a signal
+  int wait(pid_t Pid) {
+    while (!Codes.count(Pid)) {
+      if (!reap(Pid))
+        return -1;
+    }
+    return Codes[Pid];
+  }
+
+private:
+  bool reap(pid_t Pid) {
+    int Status;
+    pid_t Done;
+    while (((Done = waitpid(Pid, &Status, 0)) < 0) && (errno == EINTR))
+      ;
+    if (Done < 0)
+      return false;
+
+    --Running;
+    Codes[Done] = WIFEXITED(Status) ? WEXITSTATUS(Status) : -WTERMSIG(Status);
+    return true;
+  }
+
+  size_t MaxRunning;
+
+  size_t Running;
+
+  std::map<pid_t, int> Codes;
+};
+
+}
+
+// Renders every counter in a child process, all at the same time, and
+// reports the exit code of each child on stdout in the order of the counters
+static void forkBatch(const std::vector<int> &Counters,
+                      const std::function<int(int)> &Render)
+{
+  ChildProcesses Children(Counters.size());
+  std::vector<pid_t> Pids;
+  for (int Counter : Counters)
+    Pids.push_back(Children.start([&]() { return Render(Counter); }));
+
+  for (size_t I = 0; I < Counters.size(); ++I) {
+    llvm::outs() << "counter " << Counters[I];
+    if (Pids[I] < 0)
+      llvm::outs() << " error fork failed\n";
+    else
+      llvm::outs() << " exit " << Children.wait(Pids[I]) << "\n";
+  }
+}
+#endif
+
 TransformationManager* TransformationManager::Instance;
 
 std::map<std::string, Transformation *> *
@@ -228,9 +348,16 @@ bool TransformationManager::initializeCompilerInstance(std::string &ErrorMsg)
   if (CheckReference)
     CurrentTransformationImpl->setReferenceValue(ReferenceValue);
 
-  assert(CurrentTransformationImpl && "Bad transformation instance!");
-  ClangInstance->setASTConsumer(
-    std::unique_ptr<ASTConsumer>(CurrentTransformationImpl));
+  assert((CurrentTransformationImpl || BatchHandler) &&
+         "Bad transformation instance!");
+  std::unique_ptr<ASTConsumer> Consumer(CurrentTransformationImpl);
+  if (BatchHandler) {
+    std::vector<std::unique_ptr<ASTConsumer>> Consumers;
+    if (Consumer)
+      Consumers.push_back(std::move(Consumer));
+    Consumer.reset(new BatchConsumer(std::move(Consumers), BatchHandler));
+  }
+  ClangInstance->setASTConsumer(std::move(Consumer));
   Preprocessor &PP = ClangInstance->getPreprocessor();
   PP.getBuiltinInfo().initializeBuiltins(PP.getIdentifierTable(),
                                          PP.getLangOpts());
@@ -279,7 +406,7 @@ void TransformationManager::closeOutStream(llvm::raw_ostream *OutStream)
     delete OutStream;
 }
 
-bool TransformationManager::doTransformation(std::string &ErrorMsg, int &ErrorCode)
+bool TransformationManager::parseSource(std::string &ErrorMsg)
 {
   ErrorMsg = "";
 
@@ -288,29 +415,46 @@ bool TransformationManager::doTransformation(std::string &ErrorMsg, int &ErrorCo
   Diag.setSuppressAllDiagnostics(true);
   Diag.setIgnoreAllWarnings(true);
 
-  CurrentTransformationImpl->setWarnOnCounterOutOfBounds(WarnOnCounterOutOfBounds);
-  CurrentTransformationImpl->setQueryInstanceFlag(QueryInstanceOnly);
-  CurrentTransformationImpl->setTransformationCounter(TransformationCounter);
-  if (ToCounter > 0) {
-    if (CurrentTransformationImpl->isMultipleRewritesEnabled()) {
-      CurrentTransformationImpl->setToCounter(ToCounter);
-    }
-    else {
-      ErrorMsg = "current transformation[";
-      ErrorMsg += CurrentTransName; 
-      ErrorMsg += "] does not support multiple rewrites!";
-      return false;
+  // the transformations of a query of all instances are handed the
+  // translation unit once it is parsed
+  if (CurrentTransformationImpl) {
+    CurrentTransformationImpl->setWarnOnCounterOutOfBounds(WarnOnCounterOutOfBounds);
+    CurrentTransformationImpl->setQueryInstanceFlag(QueryInstanceOnly);
+    CurrentTransformationImpl->setTransformationCounter(TransformationCounter);
+    if (ToCounter > 0) {
+      if (CurrentTransformationImpl->isMultipleRewritesEnabled()) {
+        CurrentTransformationImpl->setToCounter(ToCounter);
+      }
+      else {
+        ErrorMsg = "current transformation[";
+        ErrorMsg += CurrentTransName; 
+        ErrorMsg += "] does not support multiple rewrites!";
+        return false;
+      }
     }
   }
 
   ParseAST(ClangInstance->getSema());
 
   ClangInstance->getDiagnosticClient().EndSourceFile();
+  return true;
+}
+
+bool TransformationManager::doTransformation(std::string &ErrorMsg, int &ErrorCode)
+{
+  if (!parseSource(ErrorMsg))
+    return false;
 
   if (QueryInstanceOnly) {
     return true;
   }
 
+  return outputTransformation(ErrorMsg, ErrorCode);
+}
+
+bool TransformationManager::outputTransformation(std::string &ErrorMsg,
+                                                 int &ErrorCode)
+{
   llvm::raw_ostream *OutStream = getOutStream();
   bool RV;
   if (CurrentTransformationImpl->transSuccess()) {
@@ -331,13 +475,152 @@ bool TransformationManager::doTransformation(std::string &ErrorMsg, int &ErrorCo
   return RV;
 }
 
+bool TransformationManager::doBatchTransformation(std::string &ErrorMsg)
+{
+#ifdef _WIN32
+  ErrorMsg = "--counters is not supported on Windows!";
+  return false;
+#else
+  // the children render single variants
+  std::vector<int> Counters;
+  Counters.swap(BatchCounters);
+  std::string OutputPrefix = OutputFileName;
+
+  auto RenderError = [](const std::string &Msg, int Code) {
+    llvm::errs() << "Error: " << Msg << "\n";
+    return Code;
+  };
+
+  if (CurrentTransformationImpl->isCounterUsedWhileParsing()) {
+    // every variant needs its own parse
+    forkBatch(Counters, [&](int Counter) {
+      TransformationCounter = Counter;
+      OutputFileName = OutputPrefix + "." + std::to_string(Counter);
+      std::string Msg;
+      int Code = -1;
+      if (!initializeCompilerInstance(Msg) || !doTransformation(Msg, Code))
+        return RenderError(Msg, Code);
+      return 0;
+    });
+    return true;
+  }
+
+  // the children share the parse and only run the transformation
+  // on the complete translation unit
+  BatchHandler = [&](ASTContext &Ctx) {
+    forkBatch(Counters, [&](int Counter) {
+      CurrentTransformationImpl->setTransformationCounter(Counter);
+      CurrentTransformationImpl->HandleTranslationUnit(Ctx);
+      OutputFileName = OutputPrefix + "." + std::to_string(Counter);
+      std::string Msg;
+      int Code = -1;
+      if (!outputTransformation(Msg, Code))
+        return RenderError(Msg, Code);
+      return 0;
+    });
+  };
+
+  return initializeCompilerInstance(ErrorMsg) && parseSource(ErrorMsg);
+#endif
+}
+
+bool TransformationManager::doQueryAllTransformations(std::string &ErrorMsg)
+{
+#ifdef _WIN32
+  ErrorMsg = "--query-instances=all is not supported on Windows!";
+  return false;
+#else
+  std::vector<std::string> Names;
+  std::vector<Transformation *> Impls;
+  for (auto &Entry : TransformationsMap) {
+    Names.push_back(Entry.first);
+    Impls.push_back(Entry.second);
+  }
+
+  // the children write their counts into shared memory
+  size_t Size = Impls.size() * sizeof(int);
+  void *Shared = mmap(nullptr, Size, PROT_READ | PROT_WRITE,
+                      MAP_SHARED | MAP_ANONYMOUS, -1, 0);
+  if (Shared == MAP_FAILED) {
+    ErrorMsg = "Cannot map shared memory!";
+    return false;
+  }
+  int *Counts = static_cast<int *>(Shared);
+
+  ChildProcesses Children(std::max(1u, std::thread::hardware_concurrency()));
+  std::vector<pid_t> Pids(Impls.size(), 0);
+  QueryInstanceOnly = true;
+  TransformationCounter = 1;
+
+  // transformations consulting the counter while parsing need their own parse
+  for (size_t I = 0; I < Impls.size(); ++I) {
+    if (!Impls[I]->isCounterUsedWhileParsing())
+      continue;
+    Pids[I] = Children.start([&, I]() {
+      CurrentTransName = Names[I];
+      CurrentTransformationImpl = Impls[I];
+      std::string Msg;
+      int Code = -1;
+      if (!initializeCompilerInstance(Msg) || !doTransformation(Msg, Code)) {
+        llvm::errs() << "Error: " << Msg << "\n";
+        return Code;
+      }
+      Counts[I] = CurrentTransformationImpl->getNumTransformationInstances();
+      return 0;
+    });
+  }
+
+  // the others share a single parse
+  BatchHandler = [&](ASTContext &Ctx) {
+    for (size_t I = 0; I < Impls.size(); ++I) {
+      if (Impls[I]->isCounterUsedWhileParsing())
+        continue;
+      Pids[I] = Children.start([&, I]() {
+        Transformation *Impl = Impls[I];
+        Impl->setQueryInstanceFlag(true);
+        Impl->setTransformationCounter(1);
+        static_cast<ASTConsumer *>(Impl)->Initialize(Ctx);
+        Impl->HandleTranslationUnit(Ctx);
+        Counts[I] = Impl->getNumTransformationInstances();
+        return 0;
+      });
+    }
+  };
+  bool RV = initializeCompilerInstance(ErrorMsg) && parseSource(ErrorMsg);
+
+  for (size_t I = 0; I < Impls.size(); ++I) {
+    llvm::outs() << Names[I] << ": ";
+    if ((Pids[I] > 0) && (Children.wait(Pids[I]) == 0))
+      llvm::outs() << Counts[I] << "\n";
+    else
+      llvm::outs() << "error\n";
+  }
+  munmap(Shared, Size);
+  return RV;
+#endif
+}
+
 bool TransformationManager::verify(std::string &ErrorMsg, int &ErrorCode)
 {
+  if (QueryAllTransformations)
+    return true;
+
   if (!CurrentTransformationImpl) {
     ErrorMsg = "Empty transformation instance!";
     return false;
   }
 
+  if (isBatch()) {
+    if (OutputFileName.empty()) {
+      ErrorMsg = "--counters requires --output!";
+      return false;
+    }
+    if ((ToCounter > 0) || QueryInstanceOnly) {
+      ErrorMsg = "--counters cannot be used with --to-counter or --query-instances!";
+      return false;
+    }
+  }
+
   if (CurrentTransformationImpl->skipCounter())
     return true;
 
@@ -420,6 +703,7 @@ TransformationManager::TransformationManager()
     CurrentTransName(""),
     ClangInstance(NULL),
     QueryInstanceOnly(false),
+    QueryAllTransformations(false),
     DoReplacement(false),
     Replacement(""),
     CheckReference(false),
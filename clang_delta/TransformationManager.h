@@ -13,13 +13,19 @@
 
 #include <string>
 #include <map>
+#include <vector>
+#include <functional>
+#include <type_traits>
 #include <cassert>
 
 #include "llvm/Support/raw_ostream.h"
 
 class Transformation;
 namespace clang {
+  class ASTConsumer;
+  class ASTContext;
   class CompilerInstance;
+  class DeclGroupRef;
   class Preprocessor;
 }
 
@@ -46,6 +52,10 @@ public:
 
   bool doTransformation(std::string &ErrorMsg, int &ErrorCode);
 
+  bool doBatchTransformation(std::string &ErrorMsg);
+
+  bool doQueryAllTransformations(std::string &ErrorMsg);
+
   bool verify(std::string &ErrorMsg, int &ErrorCode);
 
   int setTransformation(const std::string &Trans) {
@@ -66,6 +76,16 @@ public:
     ToCounter = Counter;
   }
 
+  void setBatchCounters(const std::vector<int> &Counters) {
+    assert(!Counters.empty() && "Empty batch!");
+    BatchCounters = Counters;
+    TransformationCounter = Counters.front();
+  }
+
+  bool isBatch() {
+    return !BatchCounters.empty();
+  }
+
   void setSrcFileName(const std::string &FileName) {
     assert(SrcFileName.empty() && "Could only process one file each time");
     SrcFileName = FileName;
@@ -93,6 +113,14 @@ public:
     return QueryInstanceOnly;
   }
 
+  void setQueryAllFlag(bool Flag) {
+    QueryAllTransformations = Flag;
+  }
+
+  bool getQueryAllFlag() {
+    return QueryAllTransformations;
+  }
+
   void setCXXStandard(const std::string &Str) {
     CXXStandard = Str;
     SetCXXStandard = true;
@@ -130,6 +158,10 @@ private:
 
   void closeOutStream(llvm::raw_ostream *OutStream);
 
+  bool parseSource(std::string &ErrorMsg);
+
+  bool outputTransformation(std::string &ErrorMsg, int &ErrorCode);
+
   static TransformationManager *Instance;
 
   static std::map<std::string, Transformation *> *TransformationsMapPtr;
@@ -142,6 +174,11 @@ private:
 
   int ToCounter;
 
+  std::vector<int> BatchCounters;
+
+  // handles the parsed translation unit instead of the transformation
+  std::function<void(clang::ASTContext &)> BatchHandler;
+
   std::string SrcFileName;
 
   std::string OutputFileName;
@@ -152,6 +189,8 @@ private:
 
   bool QueryInstanceOnly;
 
+  bool QueryAllTransformations;
+
   bool DoReplacement;
 
   std::string Replacement;
@@ -180,8 +219,14 @@ class RegisterTransformation {
 
 public:
   RegisterTransformation(const char *TransName, const char *Desc) {
-    Transformation *TransImpl = new TransformationClass(TransName, Desc);
+    TransformationClass *TransImpl = new TransformationClass(TransName, Desc);
     assert(TransImpl && "Fail to create TransformationClass");
+
+    // the counter is only used once the whole translation unit is parsed
+    // unless the transformation handles the top-level declarations
+    TransImpl->setCounterUsedWhileParsing(!std::is_same<
+      decltype(&TransformationClass::HandleTopLevelDecl),
+      bool (clang::ASTConsumer::*)(clang::DeclGroupRef)>::value);
  
     TransformationManager::registerTransformation(TransName, TransImpl);
   }
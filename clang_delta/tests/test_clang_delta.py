@@ -1,5 +1,6 @@
 import os
 import subprocess
+import tempfile
 import unittest
 
 
@@ -525,3 +526,58 @@ class TestClangDelta(unittest.TestCase):
         run = subprocess.run(cmd, shell=True, encoding='utf8', stderr=subprocess.PIPE, stdout=subprocess.PIPE)
         assert 'Available transformation instances: 1' in run.stderr
         assert 'Warning: number of transformation instances exceeded' in run.stderr
+
+    def test_server(self):
+        current = os.path.dirname(__file__)
+        binary = os.path.join(current, '../clang_delta')
+        server = subprocess.Popen([binary, '--server'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, encoding='utf8')
+        assert server.stdout.readline() == 'ready\n'
+        with tempfile.TemporaryDirectory() as folder:
+            stdout = os.path.join(folder, 'stdout')
+            stderr = os.path.join(folder, 'stderr')
+            for testcase in ('aggregate-to-scalar/test1.c', 'aggregate-to-scalar/test2.c'):
+                args = [stdout, stderr, '--transformation=aggregate-to-scalar', '--counter=1',
+                        os.path.join(current, testcase)]
+                server.stdin.write('\t'.join(args) + '\n')
+                server.stdin.flush()
+                assert server.stdout.readline().startswith('pid ')
+                assert server.stdout.readline() == 'exit 0\n'
+                expected = open(os.path.join(current, os.path.splitext(testcase)[0] + '.output')).read()
+                assert open(stdout).read() == expected
+        server.stdin.close()
+        assert server.wait() == 0
+
+    @classmethod
+    def check_counters(cls, testcase, transformation, counters, output_files):
+        current = os.path.dirname(__file__)
+        binary = os.path.join(current, '../clang_delta')
+        with tempfile.TemporaryDirectory() as folder:
+            prefix = os.path.join(folder, 'variant')
+            output = subprocess.check_output([binary, '--transformation=' + transformation, '--counters=' + counters,
+                                              '--output=' + prefix, os.path.join(current, testcase)], encoding='utf8')
+            assert output == ''.join('counter {} exit 0\n'.format(i + 1) for i in range(len(output_files)))
+            for (i, output_file) in enumerate(output_files):
+                expected = open(os.path.join(current, output_file)).read()
+                assert open('{}.{}'.format(prefix, i + 1)).read() == expected
+
+    def test_counters(self):
+        self.check_counters('remove-unused-function/delete2.cc', 'remove-unused-function', '1,2-4',
+                            ['remove-unused-function/delete2.output', 'remove-unused-function/delete2.output2',
+                             'remove-unused-function/delete2.output3', 'remove-unused-function/delete2.output4'])
+
+    def test_counters_top_level_decl(self):
+        # remove-namespace handles the top-level declarations while parsing
+        self.check_counters('remove-namespace/macro.cpp', 'remove-namespace', '1-3',
+                            ['remove-namespace/macro.output', 'remove-namespace/macro.output2',
+                             'remove-namespace/macro.output3'])
+
+    def test_query_all(self):
+        current = os.path.dirname(__file__)
+        binary = os.path.join(current, '../clang_delta')
+        testcase = os.path.join(current, 'remove-namespace/macro.cpp')
+        output = subprocess.check_output([binary, '--query-instances=all', testcase], encoding='utf8')
+        counts = dict(line.split(': ') for line in output.splitlines())
+        # remove-namespace handles the top-level declarations while parsing
+        for transformation in ('remove-namespace', 'remove-unused-function', 'rename-class', 'rename-fun'):
+            single = subprocess.check_output([binary, '--query-instances=' + transformation, testcase], encoding='utf8')
+            assert single.strip() == 'Available transformation instances: ' + counts[transformation]
@@ -3,6 +3,7 @@
 import argparse
 import datetime
 import importlib.util
+import json
 import logging
 import os
 import os.path
@@ -154,6 +155,8 @@ if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='C-Vise', formatter_class=argparse.RawDescriptionHelpFormatter, epilog=EPILOG_TEXT)
     parser.add_argument('--n', '-n', type=int, default=core_count, help='Number of cores to use; C-Vise tries to automatically pick a good setting but its choice may be too low or high for your situation')
+    parser.add_argument('--adaptive', action='store_true', default=False, help='Adjust the number of parallel tests at runtime (up to --n) from the duration of the tests, the CPU load and the free memory')
+    parser.add_argument('--speculative', action='store_true', default=False, help='Keep one pool of workers for the whole reduction and let running interestingness tests continue after a success if their transformations do not conflict with it')
     parser.add_argument('--tidy', action='store_true', default=False, help='Do not make a backup copy of each file to reduce as file.orig')
     parser.add_argument('--shaddap', action='store_true', default=False, help='Suppress output about non-fatal internal errors')
     parser.add_argument('--die-on-pass-bug', action='store_true', default=False, help='Terminate C-Vise if a pass encounters an otherwise non-fatal problem')
@@ -164,14 +167,19 @@ if __name__ == '__main__':
     parser.add_argument('--log-file', type=str, help='Log events into LOG_FILE instead of stderr. New events are appended to the end of the file')
     parser.add_argument('--no-give-up', action='store_true', default=False, help="Don't give up on a pass that hasn't made progress for {} iterations".format(testing.TestManager.GIVEUP_CONSTANT))
     parser.add_argument('--print-diff', action='store_true', default=False, help='Show changes made by transformations, for debugging')
+    parser.add_argument('--work-root', metavar='DIR', help='Create the temporary directories of the interestingness tests in DIR; by default a RAM-backed location (tmpfs such as /dev/shm) is used when the test cases fit into it')
     parser.add_argument('--save-temps', action='store_true', default=False, help="Don't delete /tmp/cvise-xxxxxx directories on termination")
+    parser.add_argument('--reorder-passes', action='store_true', default=False, help='Order the main passes in each iteration by bytes removed per CPU second and success ratio so far and temporarily skip passes that keep failing; the reduction still ends with a run of all main passes')
     parser.add_argument('--skip-initial-passes', action='store_true', default=False, help='Skip initial passes (useful if input is already partially reduced)')
     parser.add_argument('--remove-pass', help='Remove all instances of the specified passes from the schedule (comma-separated)')
     parser.add_argument('--start-with-pass', help='Start with the specified pass')
+    parser.add_argument('--statistics-json', metavar='FILE', help='Write the pass statistics (including lines removed, timeouts and transform, test and test CPU time) as JSON to FILE')
     parser.add_argument('--no-timing', action='store_true', default=False, help='Do not print timestamps about reduction progress')
     parser.add_argument('--timestamp', action='store_true', default=False, help='Print timestamps instead of relative time from a reduction start')
     parser.add_argument('--timeout', type=int, nargs='?', default=300, help='Interestingness test timeout in seconds')
-    parser.add_argument('--no-cache', action='store_true', default=False, help="Don't cache behavior of passes")
+    parser.add_argument('--no-cache', action='store_true', default=False, help="Don't cache behavior of passes and results of the interestingness test")
+    parser.add_argument('--pass-cache-size', metavar='MB', type=int, default=256, help='Memory budget of the cache of pass results; least recently used entries are moved to disk when it is exceeded')
+    parser.add_argument('--test-cache-dir', metavar='DIR', help='Keep results of the interestingness test (keyed by content of the test script and the test cases) in DIR so that later runs can reuse them')
     parser.add_argument('--skip-key-off', action='store_true', default=False, help="Disable skipping the rest of the current pass when 's' is pressed")
     parser.add_argument('--max-improvement', metavar='BYTES', type=int, help='Largest improvement in file size from a single transformation that C-Vise should accept (useful only to slow C-Vise down)')
     passes_group = parser.add_mutually_exclusive_group()
@@ -270,11 +278,13 @@ if __name__ == '__main__':
     test_manager = testing.TestManager(pass_statistic, args.interestingness_test, args.timeout,
                                        args.save_temps, args.test_cases, args.n, args.no_cache, args.skip_key_off, args.shaddap,
                                        args.die_on_pass_bug, args.print_diff, args.max_improvement, args.no_give_up, args.also_interesting,
-                                       args.start_with_pass)
+                                       args.start_with_pass, args.test_cache_dir, args.pass_cache_size * 1024 * 1024,
+                                       args.speculative, args.work_root, args.adaptive)
 
     reducer = CVise(test_manager)
 
     reducer.tidy = args.tidy
+    reducer.reorder_passes = args.reorder_passes
 
     # Track runtime
     time_start = time.monotonic()
@@ -287,15 +297,21 @@ if __name__ == '__main__':
     else:
         time_stop = time.monotonic()
         print('===< PASS statistics >===')
-        print('  %-54s %8s %8s %8s %8s %15s' % ('pass name', 'time (s)', 'time (%)', 'worked',
-              'failed', 'total executed'))
+        print('  %-54s %8s %8s %8s %8s %15s %11s %13s %13s %10s %11s' % ('pass name', 'time (s)', 'time (%)', 'worked',
+              'failed', 'total executed', 'cache hits', 'cache misses', 'bytes removed', 'bytes/s', 'success (%)'))
 
         for pass_name, pass_data in pass_statistic.sorted_results:
-            print('  %-54s %8.2f %8.2f %8d %8d %15d' % (pass_name, pass_data.total_seconds,
+            print('  %-54s %8.2f %8.2f %8d %8d %15d %11d %13d %13d %10.1f %11.1f' % (pass_name, pass_data.total_seconds,
                   100.0 * pass_data.total_seconds / (time_stop - time_start),
-                pass_data.worked, pass_data.failed, pass_data.totally_executed))
+                pass_data.worked, pass_data.failed, pass_data.totally_executed,
+                pass_data.cache_hits, pass_data.cache_misses, pass_data.bytes_removed,
+                pass_data.bytes_per_second, 100.0 * pass_data.success_ratio))
         print()
 
+        if args.statistics_json:
+            with open(args.statistics_json, 'w') as statistics_file:
+                json.dump(pass_statistic.as_json(), statistics_file, indent=2)
+
         if not args.no_timing:
             print('Runtime: {} seconds'.format(round((time_stop - time_start))))
 
@@ -306,5 +322,7 @@ if __name__ == '__main__':
                 print(test_case_file.read())
         if script:
             os.remove(script.name)
+    finally:
+        test_manager.cleanup()
 
     logging.shutdown()
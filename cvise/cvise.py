@@ -1,11 +1,14 @@
+import hashlib
 import json
 import logging
+import math
 import os
 
 from cvise.passes.abstract import AbstractPass
 from cvise.passes.balanced import BalancedPass
 from cvise.passes.blank import BlankPass
 from cvise.passes.clang import ClangPass
+from cvise.passes.clang_delta import query_all_instances
 from cvise.passes.clangbinarysearch import ClangBinarySearchPass
 from cvise.passes.clex import ClexPass
 from cvise.passes.comments import CommentsPass
@@ -55,9 +58,17 @@ class CVise:
         'unifdef': UnIfDefPass,
     }
 
+    # with reorder_passes, a main pass without success in this many
+    # consecutive runs is skipped, but only for a few iterations in a row
+    FRUITLESS_RUNS = 2
+    MAX_SKIPPED_ITERATIONS = 3
+
     def __init__(self, test_manager):
         self.test_manager = test_manager
         self.tidy = False
+        self.reorder_passes = False
+        self.fruitless_runs = {}
+        self.skipped_iterations = {}
 
     @classmethod
     def load_pass_group_file(cls, path):
@@ -117,6 +128,17 @@ class CVise:
                 elif not renaming and 'renaming' in pass_dict and pass_dict['renaming']:
                     continue
 
+                if 'chunked' in pass_dict:
+                    if not hasattr(pass_instance, 'chunked'):
+                        raise CViseError('Pass {} cannot be chunked'.format(pass_dict['pass']))
+                    pass_instance.chunked = pass_dict['chunked']
+
+                if 'strategy' in pass_dict:
+                    strategy = pass_dict['strategy']
+                    if strategy not in getattr(pass_instance, 'strategies', ()):
+                        raise CViseError('Pass {} does not support the {} strategy'.format(pass_dict['pass'], strategy))
+                    pass_instance.strategy = strategy
+
                 pass_instance.clang_delta_std = clang_delta_std
                 pass_group[category].append(pass_instance)
 
@@ -127,8 +149,9 @@ class CVise:
         self.test_manager.check_sanity(True)
 
         logging.info('===< {} >==='.format(os.getpid()))
-        logging.info('running {} interestingness test{} in parallel'.format(self.test_manager.parallel_tests,
-                                                                            '' if self.test_manager.parallel_tests == 1 else 's'))
+        logging.info('running {} interestingness test{} in parallel in {} ({})'.format(
+                     self.test_manager.parallel_tests, '' if self.test_manager.parallel_tests == 1 else 's',
+                     self.test_manager.work_root, self.test_manager.work_root_type))
 
         if not self.tidy:
             self.test_manager.backup_test_cases()
@@ -160,17 +183,86 @@ class CVise:
             else:
                 self.test_manager.run_pass(p)
 
+    def _schedule_passes(self, passes):
+        stats = self.test_manager.pass_statistic.stats
+
+        def priority(p):
+            pass_data = stats.get(repr(p))
+            # passes without statistics go first
+            if pass_data is None or not pass_data.cpu_seconds:
+                return (-math.inf, 0)
+            # CPU time and not wall-clock time, the latter depends on the parallelism
+            return (-pass_data.bytes_per_cpu_second, -pass_data.success_ratio)
+
+        scheduled = []
+        for p in passes:
+            name = repr(p)
+            if (self.fruitless_runs.get(name, 0) >= self.FRUITLESS_RUNS
+                    and self.skipped_iterations.get(name, 0) < self.MAX_SKIPPED_ITERATIONS):
+                self.skipped_iterations[name] = self.skipped_iterations.get(name, 0) + 1
+                logging.info('Skipping fruitless pass {}'.format(p))
+            else:
+                self.skipped_iterations[name] = 0
+                scheduled.append(p)
+
+        return sorted(scheduled, key=priority)
+
+    def _lacks_instances(self, p, instance_counts):
+        # a clang pass without instances in every test case has nothing to do; a single
+        # clang_delta parse per content and C++ standard counts all the transformations
+        if not isinstance(p, (ClangPass, ClangBinarySearchPass)) or not p.external_programs.get('clang_delta'):
+            return False
+        program = p.external_programs['clang_delta']
+
+        for test_case in self.test_manager.test_cases:
+            with open(test_case, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            for std in p.get_query_standards(test_case):
+                # the extension selects the language
+                key = (program, os.path.splitext(test_case)[1], digest, std)
+                if key not in instance_counts:
+                    instance_counts[key] = query_all_instances(program, test_case, std)
+                if instance_counts[key].get(p.arg) != 0:
+                    return False
+        return True
+
+    def _run_main_pass(self, p):
+        name = repr(p)
+        stats = self.test_manager.pass_statistic.stats
+        worked = stats[name].worked if name in stats else 0
+        self.test_manager.run_pass(p)
+
+        if name in stats and stats[name].worked > worked:
+            self.fruitless_runs[name] = 0
+        else:
+            self.fruitless_runs[name] = self.fruitless_runs.get(name, 0) + 1
+
     def _run_main_passes(self, passes):
+        full_sweep = True
         while True:
             total_file_size = self.test_manager.total_file_size
 
-            for p in passes:
+            if full_sweep:
+                scheduled = passes
+            else:
+                scheduled = self._schedule_passes(passes)
+
+            instance_counts = {}
+            for p in scheduled:
                 if not p.check_prerequisites():
                     logging.error('Skipping pass {}'.format(p))
+                elif self._lacks_instances(p, instance_counts):
+                    logging.info('Skipping pass {} without transformation instances'.format(p))
                 else:
-                    self.test_manager.run_pass(p)
+                    self._run_main_pass(p)
 
             logging.info('Termination check: size was {}; now {}'.format(total_file_size, self.test_manager.total_file_size))
 
             if self.test_manager.total_file_size >= total_file_size:
-                break
+                # only an iteration over all passes proves the fixpoint
+                if full_sweep:
+                    break
+                logging.info('Running a full sweep of the main passes')
+                full_sweep = True
+            else:
+                full_sweep = not self.reorder_passes
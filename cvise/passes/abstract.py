@@ -1,7 +1,10 @@
+import contextlib
 import copy
 from enum import auto, Enum, unique
 import logging
+import os
 import shutil
+import signal
 import subprocess
 
 
@@ -14,6 +17,9 @@ class PassResult(Enum):
 
 
 class BinaryState:
+    # removes every instance except the chunk
+    complement = False
+
     def __init__(self):
         pass
 
@@ -21,10 +27,10 @@ class BinaryState:
         return 'BinaryState: %d-%d of %d instances' % (self.index, self.end(), self.instances)
 
     @staticmethod
-    def create(instances):
+    def create(instances, strategy='binary'):
         if not instances:
             return None
-        self = BinaryState()
+        self = STRATEGIES[strategy]()
         self.instances = instances
         self.chunk = instances
         self.index = 0
@@ -39,6 +45,12 @@ class BinaryState:
     def real_chunk(self):
         return self.end() - self.index
 
+    def ranges(self):
+        # the (start, end) ranges of the instances to transform
+        if self.complement:
+            return [r for r in [(0, self.index), (self.end(), self.instances)] if r[0] < r[1]]
+        return [(self.index, self.end())]
+
     def advance(self):
         self = self.copy()
         original_index = self.index
@@ -53,7 +65,11 @@ class BinaryState:
             logging.debug('***ADVANCE*** from {} to {} with chunk {}'.format(original_index, self.index, self.chunk))
         return self
 
-    def advance_on_success(self, instances):
+    def advance_on_success(self, instances=None, removed=None):
+        # without a new count, the instances removed by the transformation
+        # (by default the whole chunk) are subtracted from the current one
+        if instances is None:
+            instances = self.instances - (self.real_chunk() if removed is None else removed)
         if not instances:
             return None
         self.instances = instances
@@ -62,6 +78,127 @@ class BinaryState:
         else:
             return self
 
+    def rebase(self, other):
+        # translate the state onto the test case where the instances
+        # of other were removed; None if the two chunks overlap
+        if self.complement or other.complement:
+            return None
+        elif self.end() <= other.index:
+            shift = 0
+        elif self.index >= other.end():
+            shift = other.real_chunk()
+        else:
+            return None
+
+        self = self.copy()
+        self.index -= shift
+        self.instances -= other.real_chunk()
+        if self.index >= self.instances:
+            return None
+        return self
+
+
+class GrowingBinaryState(BinaryState):
+    # the chunk doubles after this many successes in a row; with --speculative
+    # the test manager continues with the rebased state instead of calling
+    # advance_on_success, so the chunk does not grow there
+    GROW_AFTER = 2
+
+    successes = 0
+
+    def advance(self):
+        self = super().advance()
+        if self is not None:
+            self.successes = 0
+        return self
+
+    def advance_on_success(self, instances=None, removed=None):
+        successes = self.successes + 1
+        state = super().advance_on_success(instances, removed)
+        if state is self:
+            state.successes = successes
+            if successes >= self.GROW_AFTER:
+                state.chunk = min(state.chunk * 2, state.instances)
+                state.successes = 0
+                logging.debug('granularity increased to {}'.format(state.chunk))
+        return state
+
+
+class ReverseBinaryState(BinaryState):
+    # visits the chunks from the last one: code usually depends on the code
+    # before it, which can only go once its users are removed
+
+    @staticmethod
+    def last_index(instances, chunk):
+        return (instances - 1) // chunk * chunk
+
+    def advance(self):
+        self = self.copy()
+        self.index -= self.chunk
+        if self.index < 0:
+            self.chunk = int(self.chunk / 2)
+            if self.chunk < 1:
+                return None
+            logging.debug('granularity reduced to {}'.format(self.chunk))
+            self.index = self.last_index(self.instances, self.chunk)
+        return self
+
+    def advance_on_success(self, instances=None, removed=None):
+        if instances is None:
+            instances = self.instances - (self.real_chunk() if removed is None else removed)
+        if not instances:
+            return None
+        self.instances = instances
+        # the chunks that followed the removed one were already tried
+        return self.advance()
+
+
+class DDMinBinaryState(BinaryState):
+    # also tries to keep nothing but each chunk before removing the chunks
+    # (the subsets and complements of ddmin)
+
+    def __repr__(self):
+        if self.complement:
+            return 'BinaryState: all but %d-%d of %d instances' % (self.index, self.end(), self.instances)
+        return super().__repr__()
+
+    def advance(self):
+        if self.complement:
+            self = self.copy()
+            self.index += self.chunk
+            if self.index >= self.instances:
+                self.complement = False
+                self.index = 0
+            return self
+
+        self = super().advance()
+        # a new granularity starts with the subsets, with two chunks they
+        # are the same as the complements
+        if self is not None and self.index == 0 and self.chunk * 2 < self.instances:
+            self.complement = True
+        return self
+
+    def advance_on_success(self, instances=None, removed=None):
+        if not self.complement:
+            return super().advance_on_success(instances, removed)
+
+        if instances is None:
+            instances = self.real_chunk() if removed is None else self.instances - removed
+        if not instances:
+            return None
+        # continue with two halves of the kept chunk
+        self.instances = instances
+        self.chunk = (instances + 1) // 2
+        self.index = 0
+        self.complement = False
+        return self
+
+
+STRATEGIES = {'binary': BinaryState,
+              'grow': GrowingBinaryState,
+              'reverse': ReverseBinaryState,
+              'ddmin': DDMinBinaryState}
+
 
 class AbstractPass:
     @unique
@@ -69,6 +206,17 @@ class AbstractPass:
         slow = 'slow'
         windows = 'windows'
 
+    # successful variants of one round can be combined when the pass
+    # makes small, independent edits
+    mergeable = False
+
+    # passes implementing transform_data can create their variants in
+    # memory, the test manager then only hands the edits to the workers
+    in_memory = False
+
+    # the number of tests the test manager runs in parallel
+    parallel_tests = 1
+
     def __init__(self, arg=None, external_programs=None):
         self.external_programs = external_programs
         self.arg = arg
@@ -101,32 +249,115 @@ class AbstractPass:
         raise NotImplementedError("Class {} has not implemented 'advance_on_success'!".format(type(self).__name__))
 
     def transform(self, test_case, state, process_event_notifier):
-        raise NotImplementedError("Class {} has not implemented 'transform'!".format(type(self).__name__))
+        if not self.in_memory:
+            raise NotImplementedError("Class {} has not implemented 'transform'!".format(type(self).__name__))
 
+        with open(test_case, 'r') as in_file:
+            data = in_file.read()
 
-@unique
-class ProcessEventType(Enum):
-    STARTED = auto()
-    FINISHED = auto()
+        (result, state, patch) = self.transform_data(data, state)
 
+        if result == PassResult.OK:
+            with open(test_case, 'w') as out_file:
+                out_file.write(patch.apply(data))
 
-class ProcessEvent:
-    def __init__(self, pid, event_type):
-        self.pid = pid
-        self.type = event_type
+        return (result, state)
+
+    def transform_data(self, data, state):
+        # return (result, state, patch); the patch edits the data by character offsets,
+        # without a patch the worker creates the variant with transform
+        raise NotImplementedError("Class {} has not implemented 'transform_data'!".format(type(self).__name__))
+
+    def rebase(self, state, accepted_state):
+        # passes whose transformations commute can translate a state created
+        # for the same test case as accepted_state onto the accepted variant
+        return None
+
+    def get_edits(self, test_case, state):
+        # the (start, end, replacement) byte offset edits that the variant of
+        # state makes to test_case, mergeable passes without transform_data
+        # need them to combine their successful variants
+        return None
 
 
 class ProcessEventNotifier:
-    def __init__(self, pid_queue):
-        self.pid_queue = pid_queue
+    # an entry of the pid table holds the token of the variant that owns the
+    # slot above the pid of its running process, tokens are positive
+    TOKEN_SHIFT = 32
+    MAX_TOKEN = (1 << 31) - 1
+
+    def __init__(self, pid_table, slot=None, token=0):
+        self.pid_table = pid_table
+        self.slot = slot
+        self.token = token
+
+    @classmethod
+    def pack(cls, token, pid):
+        return (token << cls.TOKEN_SHIFT) | pid
+
+    @classmethod
+    def unpack(cls, entry):
+        return (entry >> cls.TOKEN_SHIFT, entry & ((1 << cls.TOKEN_SHIFT) - 1))
+
+    @staticmethod
+    @contextlib.contextmanager
+    def lock_table(pid_table):
+        # pebble stops a worker with SIGTERM and an immediate exit, which
+        # must not happen while the worker holds the lock of the table
+        mask = None
+        if hasattr(signal, 'pthread_sigmask'):
+            mask = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+        try:
+            with pid_table.get_lock():
+                yield
+        finally:
+            if mask is not None:
+                signal.pthread_sigmask(signal.SIG_SETMASK, mask)
 
     def run_process(self, cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=False):
         if shell:
             assert isinstance(cmd, str)
-        proc = subprocess.Popen(cmd, stdout=stdout, stderr=stderr, universal_newlines=True, encoding='utf8', shell=shell)
-        if self.pid_queue:
-            self.pid_queue.put(ProcessEvent(proc.pid, ProcessEventType.STARTED))
-        stdout, stderr = proc.communicate()
-        if self.pid_queue:
-            self.pid_queue.put(ProcessEvent(proc.pid, ProcessEventType.FINISHED))
+        # a registered process leads its own process group so that
+        # the whole subtree can be killed at once
+        register = self.pid_table is not None
+        proc = subprocess.Popen(cmd, stdout=stdout, stderr=stderr, universal_newlines=True, encoding='utf8', shell=shell,
+                                start_new_session=register)
+        if not self.register_pid(proc.pid):
+            # the test manager gave up on the variant while it was starting
+            # the process, nobody else can kill it
+            if hasattr(os, 'killpg'):
+                os.killpg(proc.pid, signal.SIGTERM)
+            else:
+                proc.terminate()
+        try:
+            stdout, stderr = proc.communicate()
+        finally:
+            self.unregister_pid()
         return (stdout, stderr, proc.returncode)
+
+    def owns_slot(self):
+        # the test manager clears the slot of a variant that it gave up on
+        if self.pid_table is None:
+            return True
+        with self.lock_table(self.pid_table):
+            return self.unpack(self.pid_table[self.slot])[0] == self.token
+
+    def register_pid(self, pid):
+        # pid must lead its own process group; returns False when the
+        # variant does not own its slot anymore
+        return self.__set_pid(pid)
+
+    def unregister_pid(self):
+        self.__set_pid(0)
+
+    def __set_pid(self, pid):
+        # the worker of a cancelled variant can still be running after its
+        # slot got a new owner, it must not touch the entry of that owner;
+        # the check and the write are atomic as the slot can change hands
+        if self.pid_table is None:
+            return True
+        with self.lock_table(self.pid_table):
+            if self.unpack(self.pid_table[self.slot])[0] != self.token:
+                return False
+            self.pid_table[self.slot] = self.pack(self.token, pid)
+            return True
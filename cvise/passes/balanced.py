@@ -1,113 +1,201 @@
-from cvise.passes.abstract import AbstractPass, PassResult
+import os
+
+from cvise.passes.abstract import AbstractPass, BinaryState, PassResult, STRATEGIES
 from cvise.utils import nestedmatcher
 from cvise.utils.error import UnknownArgumentError
+from cvise.utils.patch import Patch
 
 
 class BalancedPass(AbstractPass):
+    # remove all matches at once and bisect them like the lines pass does
+    # instead of trying one match per variant; set by the pass group
+    chunked = False
+    strategy = 'binary'
+    strategies = tuple(STRATEGIES)
+    in_memory = True
+
+    # the test case as last read in the main process, see __get_prog
+    current = None
+    # (prog, matches) of the chunked pass for the last accepted version
+    matches = None
+
     def check_prerequisites(self):
         return True
 
-    def __get_next_match(self, test_case, pos):
-        with open(test_case, 'r') as in_file:
-            prog = in_file.read()
+    def __getstate__(self):
+        # the text only lives in the main process
+        state = self.__dict__.copy()
+        state['current'] = None
+        state['matches'] = None
+        return state
+
+    def __get_prog(self, test_case, reread):
+        # the test case only changes with an accepted variant, a different size
+        # means that it was replaced in the meantime; the same string object
+        # keeps hitting the fast path of the bracket index
+        current = self.current
+        if (reread or current is None or current['test_case'] != test_case
+                or current['size'] != os.path.getsize(test_case)):
+            with open(test_case, 'r') as in_file:
+                prog = in_file.read()
+            current = self.current = {'test_case': test_case, 'size': os.path.getsize(test_case), 'prog': prog}
+        return current['prog']
+
+    def __get_next_match(self, test_case, pos, reread, accepted=None):
+        prog = self.__get_prog(test_case, reread)
 
         config = self.__get_config()
-        m = nestedmatcher.find(config['search'], prog, pos=pos, prefix=config['prefix'])
+        if accepted is not None and config['replacement'] is not None:
+            # update the bracket index of the previous test case instead of rescanning
+            nestedmatcher.get_bracket_index(prog, edit=(accepted[0], accepted[1], config['replacement']))
+
+        return nestedmatcher.find(config['search'], prog, pos=pos, prefix=config['prefix'])
+
+    def __get_all_matches(self, prog):
+        config = self.__get_config()
+        matches = []
+
+        m = nestedmatcher.find(config['search'], prog, pos=0, prefix=config['prefix'])
+        while m is not None:
+            matches.append(m)
+            m = nestedmatcher.find(config['search'], prog, pos=m[0] + 1, prefix=config['prefix'])
+
+        return matches
 
-        return m
+    def __get_matches(self, prog):
+        # the variants of a chunked pass all select from the matches of the
+        # same version, callers pass an equal string but not the same object
+        if self.matches is None or (self.matches[0] is not prog and self.matches[0] != prog):
+            self.matches = (prog, self.__get_all_matches(prog))
+        return self.matches[1]
+
+    def __count_instances(self, test_case):
+        prog = self.__get_prog(test_case, reread=True)
+        self.matches = (prog, self.__get_all_matches(prog))
+        return len(self.matches[1])
 
     def new(self, test_case, _=None):
-        return self.__get_next_match(test_case, pos=0)
+        if self.chunked:
+            return BinaryState.create(self.__count_instances(test_case), self.strategy)
+        return self.__get_next_match(test_case, pos=0, reread=True)
 
     def advance(self, test_case, state):
-        return self.__get_next_match(test_case, pos=state[0] + 1)
+        if self.chunked:
+            return state.advance()
+        return self.__get_next_match(test_case, pos=state[0] + 1, reread=False)
 
     def advance_on_success(self, test_case, state):
-        return self.__get_next_match(test_case, pos=state[0])
+        if self.chunked:
+            return state.advance_on_success(self.__count_instances(test_case))
+        return self.__get_next_match(test_case, pos=state[0], reread=True, accepted=state)
 
     def __get_config(self):
         config = {'search': None,
-                  'replace_fn': None,
+                  'edit_fn': None,
                   'prefix': '',
+                  'replacement': None,
                   }
 
-        def replace_all(string, match):
-            return string[0:match[0]] + string[match[1]:]
+        def replace_all(match):
+            return [(match[0], match[1], '')]
 
-        def replace_only(string, match):
-            return string[0:match[0]] + string[(match[0] + 1):(match[1] - 1)] + string[match[1]:]
+        def replace_only(match):
+            return [(match[0], match[0] + 1, ''), (match[1] - 1, match[1], '')]
 
-        def replace_inside(string, match):
-            return string[0:(match[0] + 1)] + string[(match[1] - 1):]
+        def replace_inside(match):
+            return [(match[0] + 1, match[1] - 1, '')]
 
         if self.arg == 'square-inside':
             config['search'] = nestedmatcher.BalancedExpr.squares
-            config['replace_fn'] = replace_inside
+            config['edit_fn'] = replace_inside
         elif self.arg == 'angles-inside':
             config['search'] = nestedmatcher.BalancedExpr.angles
-            config['replace_fn'] = replace_inside
+            config['edit_fn'] = replace_inside
         elif self.arg == 'parens-inside':
             config['search'] = nestedmatcher.BalancedExpr.parens
-            config['replace_fn'] = replace_inside
+            config['edit_fn'] = replace_inside
         elif self.arg == 'curly-inside':
             config['search'] = nestedmatcher.BalancedExpr.curlies
-            config['replace_fn'] = replace_inside
+            config['edit_fn'] = replace_inside
         elif self.arg == 'square':
             config['search'] = nestedmatcher.BalancedExpr.squares
-            config['replace_fn'] = replace_all
+            config['edit_fn'] = replace_all
+            config['replacement'] = ''
         elif self.arg == 'angles':
             config['search'] = nestedmatcher.BalancedExpr.angles
-            config['replace_fn'] = replace_all
+            config['edit_fn'] = replace_all
+            config['replacement'] = ''
         elif self.arg == 'parens-to-zero':
             config['search'] = nestedmatcher.BalancedExpr.parens
-            config['replace_fn'] = lambda string, match: string[0:match[0]] + '0' + string[match[1]:]
+            config['edit_fn'] = lambda match: [(match[0], match[1], '0')]
+            config['replacement'] = '0'
         elif self.arg == 'parens':
             config['search'] = nestedmatcher.BalancedExpr.parens
-            config['replace_fn'] = replace_all
+            config['edit_fn'] = replace_all
+            config['replacement'] = ''
         elif self.arg == 'curly':
             config['search'] = nestedmatcher.BalancedExpr.curlies
-            config['replace_fn'] = replace_all
+            config['edit_fn'] = replace_all
+            config['replacement'] = ''
         elif self.arg == 'curly2':
             config['search'] = nestedmatcher.BalancedExpr.curlies
-            config['replace_fn'] = lambda string, match: string[0:match[0]] + ';' + string[match[1]:]
+            config['edit_fn'] = lambda match: [(match[0], match[1], ';')]
+            config['replacement'] = ';'
         elif self.arg == 'curly3':
             config['search'] = nestedmatcher.BalancedExpr.curlies
-            config['replace_fn'] = replace_all
+            config['edit_fn'] = replace_all
             config['prefix'] = '=\\s*'
+            config['replacement'] = ''
         elif self.arg == 'parens-only':
             config['search'] = nestedmatcher.BalancedExpr.parens
-            config['replace_fn'] = replace_only
+            config['edit_fn'] = replace_only
         elif self.arg == 'curly-only':
             config['search'] = nestedmatcher.BalancedExpr.curlies
-            config['replace_fn'] = replace_only
+            config['edit_fn'] = replace_only
         elif self.arg == 'angles-only':
             config['search'] = nestedmatcher.BalancedExpr.angles
-            config['replace_fn'] = replace_only
+            config['edit_fn'] = replace_only
         elif self.arg == 'square-only':
             config['search'] = nestedmatcher.BalancedExpr.squares
-            config['replace_fn'] = replace_only
+            config['edit_fn'] = replace_only
         else:
             raise UnknownArgumentError(self.__class__.__name__, self.arg)
 
         return config
 
-    def transform(self, test_case, state, process_event_notifier):
-        with open(test_case, 'r') as in_file:
-            prog = in_file.read()
-            prog2 = prog
+    def __transform_chunk(self, prog, state):
+        config = self.__get_config()
+        matches = self.__get_matches(prog)
+        matches = [m for (start, end) in state.ranges() for m in matches[start:end]]
+
+        # matches nested in an already selected one are left for smaller chunks
+        patch = Patch()
+        pos = 0
+        for match in matches:
+            if match[0] < pos:
+                continue
+            for edit in config['edit_fn'](match):
+                patch.add(*edit)
+            pos = match[1]
+
+        if not patch.modifies(prog):
+            return (PassResult.INVALID, state, patch)
+
+        return (PassResult.OK, state, patch)
+
+    def transform_data(self, prog, state):
+        if self.chunked:
+            return self.__transform_chunk(prog, state)
 
         config = self.__get_config()
 
         while True:
             if state is None:
-                return (PassResult.STOP, state)
+                return (PassResult.STOP, state, Patch())
             else:
-                prog2 = config['replace_fn'](prog2, state)
-
-                if prog != prog2:
-                    with open(test_case, 'w') as out_file:
-                        out_file.write(prog2)
+                patch = Patch(config['edit_fn'](state))
 
-                    return (PassResult.OK, state)
+                if patch.modifies(prog):
+                    return (PassResult.OK, state, patch)
                 else:
-                    state = self.advance(test_case, state)
+                    state = nestedmatcher.find(config['search'], prog, pos=state[0] + 1, prefix=config['prefix'])
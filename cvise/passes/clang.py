@@ -1,16 +1,44 @@
 import logging
 import os
+import re
 import shutil
 import tempfile
 
-from cvise.passes.abstract import AbstractPass, PassResult
+from cvise.passes.abstract import AbstractPass, PassResult, ProcessEventNotifier
+from cvise.passes.clang_delta import run_clang_delta
+from cvise.utils.patch import Patch
 
 
 class ClangPass(AbstractPass):
+    # the variants of a window of counters, one per parallel test, are
+    # rendered from a single clang_delta parse in the main process
+    in_memory = True
+
+    def __init__(self, arg=None, external_programs=None):
+        super().__init__(arg, external_programs)
+        self.test_case = None
+        self.batch_unsupported = False
+        self.window_data = None
+        self.variants = {}
+
+    def __getstate__(self):
+        # the rendered variants only live in the main process
+        state = self.__dict__.copy()
+        state['window_data'] = None
+        state['variants'] = {}
+        return state
+
     def check_prerequisites(self):
         return self.check_external_program('clang_delta')
 
+    def get_query_standards(self, test_case):
+        # the standards the next run can use
+        return [self.clang_delta_std]
+
     def new(self, test_case, _=None):
+        self.test_case = test_case
+        self.window_data = None
+        self.variants = {}
         return 1
 
     def advance(self, test_case, state):
@@ -19,17 +47,68 @@ class ClangPass(AbstractPass):
     def advance_on_success(self, test_case, state):
         return state
 
+    def __render_window(self, data, counter):
+        # clang_delta parses the test case itself so that its includes are found
+        with open(self.test_case, 'r') as in_file:
+            if in_file.read() != data:
+                return {}
+
+        program = self.external_programs['clang_delta']
+        variants = {}
+        with tempfile.TemporaryDirectory(prefix='cvise-clang') as folder:
+            prefix = os.path.join(folder, 'variant')
+            args = ['--transformation={}'.format(self.arg),
+                    '--counters={}-{}'.format(counter, counter + self.parallel_tests - 1), '--output={}'.format(prefix)]
+            if self.clang_delta_std:
+                args.append('--std={}'.format(self.clang_delta_std))
+            args.append(self.test_case)
+
+            logging.debug(' '.join([program] + args))
+
+            stdout, stderr, returncode = run_clang_delta(program, args, ProcessEventNotifier(None))
+            for m in re.finditer(r'^counter ([0-9]+) exit (-?[0-9]+)$', stdout, flags=re.MULTILINE):
+                (counter, returncode) = (int(m.group(1)), int(m.group(2)))
+                variant = None
+                if returncode == 0:
+                    with open('{}.{}'.format(prefix, counter), 'r') as variant_file:
+                        variant = variant_file.read()
+                variants[counter] = (returncode, variant)
+
+        if not variants and 'Bad command line option' in stdout:
+            logging.debug('{} does not support --counters'.format(program))
+            self.batch_unsupported = True
+        return variants
+
+    def transform_data(self, data, state):
+        if self.batch_unsupported:
+            return (PassResult.OK, state, None)
+
+        if data != self.window_data or state not in self.variants:
+            self.window_data = data
+            self.variants = self.__render_window(data, state)
+
+        # the worker renders the variants without a batch result, it also
+        # reports the errors of clang_delta
+        (returncode, variant) = self.variants.get(state, (None, None))
+        if returncode == 0:
+            return (PassResult.OK, state, Patch([(0, len(data), variant)]))
+        elif returncode == 255 or returncode == 1:
+            return (PassResult.STOP, state, None)
+        else:
+            return (PassResult.OK, state, None)
+
     def transform(self, test_case, state, process_event_notifier):
         tmp = os.path.dirname(test_case)
         with tempfile.NamedTemporaryFile(mode='w', delete=False, dir=tmp) as tmp_file:
-            args = [self.external_programs['clang_delta'], '--transformation={}'.format(self.arg), '--counter={}'.format(state)]
+            args = ['--transformation={}'.format(self.arg), '--counter={}'.format(state)]
             if self.clang_delta_std:
                 args.append('--std={}'.format(self.clang_delta_std))
-            cmd = args + [test_case]
+            args.append(test_case)
 
-            logging.debug(' '.join(cmd))
+            logging.debug(' '.join([self.external_programs['clang_delta']] + args))
 
-            stdout, stderr, returncode = process_event_notifier.run_process(cmd)
+            stdout, stderr, returncode = run_clang_delta(self.external_programs['clang_delta'], args,
+                                                         process_event_notifier)
             if returncode == 0:
                 tmp_file.write(stdout)
                 shutil.move(tmp_file.name, test_case)
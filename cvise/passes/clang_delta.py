@@ -0,0 +1,144 @@
+import logging
+import os
+import re
+import subprocess
+import tempfile
+import threading
+
+from cvise.passes.abstract import ProcessEventNotifier
+
+
+class ClangDeltaServer:
+    """A clang_delta --server process running one request at a time."""
+
+    def __init__(self, program):
+        self.proc = subprocess.Popen([program, '--server'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, universal_newlines=True, encoding='utf8')
+        if self.proc.stdout.readline().strip() != 'ready':
+            self.close()
+            raise OSError('{} does not support --server'.format(program))
+
+    def close(self):
+        # the server exits at the end of its input
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        self.proc.stdout.close()
+        self.proc.wait()
+
+    def run(self, args, process_event_notifier):
+        assert all('\t' not in arg and '\n' not in arg for arg in args)
+        with tempfile.TemporaryDirectory(prefix='clang_delta') as folder:
+            stdout_path = os.path.join(folder, 'stdout')
+            stderr_path = os.path.join(folder, 'stderr')
+            self.proc.stdin.write('\t'.join([stdout_path, stderr_path] + args) + '\n')
+            self.proc.stdin.flush()
+
+            reply = self.__read_reply('pid')
+            process_event_notifier.register_pid(int(reply))
+            try:
+                returncode = int(self.__read_reply('exit'))
+            finally:
+                process_event_notifier.unregister_pid()
+
+            with open(stdout_path, encoding='utf8') as f:
+                stdout = f.read()
+            with open(stderr_path, encoding='utf8') as f:
+                stderr = f.read()
+        return (stdout, stderr, returncode)
+
+    def __read_reply(self, kind):
+        line = self.proc.stdout.readline()
+        if not line:
+            raise OSError('clang_delta server exited')
+        (reply_kind, _, value) = line.rstrip('\n').partition(' ')
+        if reply_kind != kind:
+            raise OSError('clang_delta server failed: {}'.format(line.strip()))
+        return value
+
+
+# idle servers of each clang_delta program in this process (each pool
+# worker has its own ones), and the programs without server mode
+servers = {}
+unsupported = set()
+lock = threading.Lock()
+
+
+def forget_servers():
+    # a forked process must not share the pipes of its parent's servers
+    global servers, lock
+    servers = {}
+    lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=forget_servers)
+
+
+def acquire_server(program):
+    with lock:
+        if program in unsupported:
+            return None
+        idle = servers.setdefault(program, [])
+        if idle:
+            return idle.pop()
+
+    try:
+        return ClangDeltaServer(program)
+    except OSError as e:
+        logging.debug('not using a clang_delta server: {}'.format(e))
+        with lock:
+            unsupported.add(program)
+        return None
+
+
+def release_server(program, server):
+    with lock:
+        servers[program].append(server)
+
+
+def close_idle_servers(program=None, keep=0):
+    """Close the idle servers of program (or of all programs) beyond the first keep ones."""
+    with lock:
+        closed = []
+        for (name, idle) in servers.items():
+            if program is None or name == program:
+                closed += idle[keep:]
+                del idle[keep:]
+
+    for server in closed:
+        server.close()
+
+
+def run_clang_delta(program, args, process_event_notifier):
+    """Run clang_delta with args, through a server unless the program has no server mode."""
+    server = acquire_server(program)
+    if server is not None:
+        try:
+            result = server.run(args, process_event_notifier)
+        except (OSError, ValueError) as e:
+            # the server died, the next call starts a new one
+            logging.debug('clang_delta server failed: {}'.format(e))
+            server.close()
+        else:
+            release_server(program, server)
+            return result
+
+    return process_event_notifier.run_process([program] + args)
+
+
+def query_all_instances(program, test_case, std=None):
+    """Count the instances of every transformation with a single parse; failed queries are missing."""
+    args = ['--query-instances=all']
+    if std:
+        args.append('--std={}'.format(std))
+    args.append(test_case)
+
+    try:
+        stdout, stderr, returncode = run_clang_delta(program, args, ProcessEventNotifier(None))
+    except (OSError, subprocess.SubprocessError) as e:
+        logging.debug('clang_delta --query-instances=all failed: {}'.format(e))
+        return {}
+
+    return {m.group(1): int(m.group(2)) for m in re.finditer(r'^(\S+): ([0-9]+)$', stdout, flags=re.MULTILINE)}
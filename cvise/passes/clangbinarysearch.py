@@ -1,3 +1,6 @@
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import logging
 import os
 import re
@@ -6,32 +9,78 @@ import subprocess
 import tempfile
 import time
 
-from cvise.passes.abstract import AbstractPass, BinaryState, PassResult
+from cvise.passes.abstract import AbstractPass, BinaryState, PassResult, ProcessEventNotifier
+from cvise.passes.clang_delta import close_idle_servers, run_clang_delta
 
 
 class ClangBinarySearchPass(AbstractPass):
+    strategy = 'binary'
+    # clang_delta transforms a single range of instances
+    strategies = ('binary', 'grow', 'reverse')
+
+    STANDARDS = ('c++98', 'c++11', 'c++14', 'c++17', 'c++20')
+    # the standard of a test case is detected again once it shrinks
+    # below this fraction of its size at the last detection
+    REDETECT_RATIO = 0.5
+    MAX_CACHED_COUNTS = 64
+
+    def __init__(self, arg=None, external_programs=None):
+        super().__init__(arg, external_programs)
+        # instance counts by (standard, content digest)
+        self.instance_counts = collections.OrderedDict()
+        # (size, standard) of the last detection by test case
+        self.detected_standards = {}
+        # seconds spent in the instance queries of new, by standard
+        self.probe_durations = {}
+
+    def __getstate__(self):
+        # the caches only live in the main process
+        state = self.__dict__.copy()
+        state['instance_counts'] = collections.OrderedDict()
+        state['detected_standards'] = {}
+        return state
+
     def check_prerequisites(self):
         return self.check_external_program('clang_delta')
 
+    def __get_detected_standard(self, test_case):
+        if test_case in self.detected_standards:
+            (detected_size, std) = self.detected_standards[test_case]
+            if os.path.getsize(test_case) >= detected_size * self.REDETECT_RATIO:
+                return std
+        return None
+
+    def get_query_standards(self, test_case):
+        # the standards the next run can use, any of them before a detection
+        std = self.__get_detected_standard(test_case)
+        return [std] if std else list(self.STANDARDS)
+
     def detect_best_standard(self, test_case):
-        best = None
-        best_count = -1
-        for std in ('c++98', 'c++11', 'c++14', 'c++17', 'c++20'):
+        std = self.__get_detected_standard(test_case)
+        if std:
             self.clang_delta_std = std
-            start = time.monotonic()
-            instances = self.count_instances(test_case)
-            took = time.monotonic() - start
+            return
 
+        size = os.path.getsize(test_case)
+        best = None
+        best_count = -1
+        counts = self.__count_instances(test_case, self.STANDARDS)
+        for std in self.STANDARDS:
+            instances = counts[std]
             if instances > best_count:
                 best = std
                 best_count = instances
-            logging.debug('available transformation opportunities for %s: %d, took: %.2f s' % (std, instances, took))
+            logging.debug('available transformation opportunities for %s: %d, took: %.2f s' %
+                          (std, instances, self.probe_durations.get(std, 0)))
         logging.info('using C++ standard: %s with %d transformation opportunities' % (best, best_count))
         self.clang_delta_std = best
+        self.detected_standards[test_case] = (size, best)
 
     def new(self, test_case, _=None):
+        # the test manager collects the durations of the queries
+        self.probe_durations = {}
         self.detect_best_standard(test_case)
-        return BinaryState.create(self.count_instances(test_case))
+        return BinaryState.create(self.count_instances(test_case), self.strategy)
 
     def advance(self, test_case, state):
         return state.advance()
@@ -44,21 +93,58 @@ class ClangBinarySearchPass(AbstractPass):
         return state
 
     def count_instances(self, test_case):
-        args = [self.external_programs['clang_delta'], '--query-instances={}'.format(self.arg)]
-        if self.clang_delta_std:
-            args.append('--std={}'.format(self.clang_delta_std))
-        cmd = args + [test_case]
+        return self.__count_instances(test_case, [self.clang_delta_std])[self.clang_delta_std]
+
+    def __count_instances(self, test_case, standards):
+        # the queries of the standards run concurrently, each in its own clang_delta
+        with open(test_case, 'rb') as in_file:
+            digest = hashlib.sha256(in_file.read()).hexdigest()
+
+        counts = {}
+        for std in standards:
+            if (std, digest) in self.instance_counts:
+                self.instance_counts.move_to_end((std, digest))
+                counts[std] = self.instance_counts[(std, digest)]
+        missing = [std for std in standards if std not in counts]
+        if not missing:
+            return counts
+
+        def query(std):
+            start = time.monotonic()
+            instances = self.__query_instances(test_case, std)
+            return (instances, time.monotonic() - start)
+
+        with ThreadPoolExecutor(max_workers=min(self.parallel_tests, len(missing))) as executor:
+            results = list(executor.map(query, missing))
+        # the concurrent probes started a server each, one is enough until the next probes
+        close_idle_servers(self.external_programs['clang_delta'], keep=1)
+
+        for (std, (instances, took)) in zip(missing, results):
+            self.probe_durations[std] = self.probe_durations.get(std, 0) + took
+            if instances is not None:
+                self.instance_counts[(std, digest)] = instances
+                if len(self.instance_counts) > self.MAX_CACHED_COUNTS:
+                    self.instance_counts.popitem(last=False)
+            counts[std] = instances or 0
+        return counts
+
+    def __query_instances(self, test_case, std):
+        args = ['--query-instances={}'.format(self.arg)]
+        if std:
+            args.append('--std={}'.format(std))
+        args.append(test_case)
 
         try:
-            proc = subprocess.run(cmd, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr, returncode = run_clang_delta(self.external_programs['clang_delta'], args,
+                                                         ProcessEventNotifier(None))
         except subprocess.SubprocessError as e:
             logging.warning(f'clang_delta --query-instances failed: {e}')
-            return 0
+            return None
 
-        if proc.returncode != 0:
-            logging.warning(f'clang_delta --query-instances failed with exit code {proc.returncode}: {proc.stderr.strip()}')
+        if returncode != 0:
+            logging.warning(f'clang_delta --query-instances failed with exit code {returncode}: {stderr.strip()}')
 
-        m = re.match('Available transformation instances: ([0-9]+)$', proc.stdout)
+        m = re.match('Available transformation instances: ([0-9]+)$', stdout)
 
         if m is None:
             return 0
@@ -83,10 +169,11 @@ class ClangBinarySearchPass(AbstractPass):
                     '--warn-on-counter-out-of-bounds', '--report-instances-count']
             if self.clang_delta_std:
                 args.append('--std={}'.format(self.clang_delta_std))
-            cmd = [self.external_programs['clang_delta']] + args + [test_case]
-            logging.debug(' '.join(cmd))
+            args.append(test_case)
+            logging.debug(' '.join([self.external_programs['clang_delta']] + args))
 
-            stdout, stderr, returncode = process_event_notifier.run_process(cmd)
+            stdout, stderr, returncode = run_clang_delta(self.external_programs['clang_delta'], args,
+                                                         process_event_notifier)
             self.parse_stderr(state, stderr)
             tmp_file.write(stdout)
             if returncode == 0:
@@ -1,9 +1,12 @@
 import re
 
 from cvise.passes.abstract import AbstractPass, PassResult
+from cvise.utils.patch import Patch
 
 
 class CommentsPass(AbstractPass):
+    in_memory = True
+
     def check_prerequisites(self):
         return True
 
@@ -16,27 +19,21 @@ class CommentsPass(AbstractPass):
     def advance_on_success(self, test_case, state):
         return state
 
-    def transform(self, test_case, state, process_event_notifier):
-        with open(test_case, 'r') as in_file:
-            prog = in_file.read()
-            prog2 = prog
-
+    def transform_data(self, prog, state):
         while True:
             # TODO: remove only the nth comment
             if state == -2:
                 # Remove all multiline comments
                 # Replace /* any number of * if not followed by / or anything but * */
-                prog2 = re.sub(r'/\*(?:\*(?!/)|[^*])*\*/', '', prog2, flags=re.DOTALL)
+                matches = re.finditer(r'/\*(?:\*(?!/)|[^*])*\*/', prog, flags=re.DOTALL)
             elif state == -1:
                 # Remove all single line comments
-                prog2 = re.sub(r'//.*$', '', prog2, flags=re.MULTILINE)
+                matches = re.finditer(r'//.*$', prog, flags=re.MULTILINE)
             else:
-                return (PassResult.STOP, state)
-
-            if prog != prog2:
-                with open(test_case, 'w') as out_file:
-                    out_file.write(prog2)
+                return (PassResult.STOP, state, Patch())
 
-                return (PassResult.OK, state)
+            patch = Patch((m.start(), m.end(), '') for m in matches)
+            if patch.modifies(prog):
+                return (PassResult.OK, state, patch)
             else:
-                state = self.advance(test_case, state)
+                state = self.advance(None, state)
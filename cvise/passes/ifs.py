@@ -2,10 +2,13 @@ import os
 import re
 import tempfile
 
-from cvise.passes.abstract import AbstractPass, BinaryState, PassResult
+from cvise.passes.abstract import AbstractPass, BinaryState, PassResult, STRATEGIES
 
 
 class IfPass(AbstractPass):
+    strategy = 'binary'
+    strategies = tuple(STRATEGIES)
+
     line_regex = re.compile('^\\s*#\\s*if')
 
     def check_prerequisites(self):
@@ -33,7 +36,7 @@ class IfPass(AbstractPass):
         return count
 
     def new(self, test_case, _=None):
-        bs = BinaryState.create(self.__count_instances(test_case))
+        bs = BinaryState.create(self.__count_instances(test_case), self.strategy)
         if bs:
             bs.value = 0
         return bs
@@ -49,12 +52,13 @@ class IfPass(AbstractPass):
         return state
 
     def advance_on_success(self, test_case, state):
-        return state.advance_on_success(self.__count_instances(test_case))
+        return state.advance_on_success(removed=state.removed)
 
     def transform(self, test_case, state, process_event_notifier):
         tmp = os.path.dirname(test_case)
         with tempfile.NamedTemporaryFile(mode='w+', delete=False, dir=tmp) as tmp_file:
             with open(test_case, 'r') as in_file:
+                ranges = state.ranges()
                 i = 0
                 in_multiline = False
                 for line in in_file.readlines():
@@ -65,7 +69,7 @@ class IfPass(AbstractPass):
                             in_multiline = False
 
                     if self.line_regex.search(line):
-                        if state.index <= i and i < state.end():
+                        if any(start <= i < end for (start, end) in ranges):
                             if self.__macro_continues(line):
                                 in_multiline = True
                             line = '#if {0}\n'.format(state.value)
@@ -77,4 +81,6 @@ class IfPass(AbstractPass):
         if returncode != 0:
             return (PassResult.ERROR, state)
         else:
+            # unifdef also drops the conditionals nested in removed code
+            state.removed = state.instances - self.__count_instances(test_case)
             return (PassResult.OK, state)
@@ -7,6 +7,8 @@ from cvise.passes.abstract import AbstractPass, PassResult
 
 
 class IncludesPass(AbstractPass):
+    mergeable = True
+
     def check_prerequisites(self):
         return True
 
@@ -19,6 +21,18 @@ class IncludesPass(AbstractPass):
     def advance_on_success(self, test_case, state):
         return state
 
+    def get_edits(self, test_case, state):
+        includes = 0
+        pos = 0
+        with open(test_case, 'rb') as in_file:
+            for line in in_file:
+                if re.match(rb'\s*#\s*include', line) is not None:
+                    includes += 1
+                    if includes == state:
+                        return [(pos, pos + len(line), '')]
+                pos += len(line)
+        return None
+
     def transform(self, test_case, state, process_event_notifier):
         tmp = os.path.dirname(test_case)
         with tempfile.NamedTemporaryFile(mode='w+', delete=False, dir=tmp) as tmp_file:
@@ -1,46 +1,73 @@
+import itertools
+import mmap
 import os
 import re
 import shutil
 import tempfile
 
-from cvise.passes.abstract import AbstractPass, BinaryState, PassResult
+from cvise.passes.abstract import AbstractPass, BinaryState, PassResult, STRATEGIES
+from cvise.utils.patch import Patch
 
 
 class LineMarkersPass(AbstractPass):
-    line_regex = re.compile('^\\s*#\\s*[0-9]+')
+    mergeable = True
+    strategy = 'binary'
+    strategies = tuple(STRATEGIES)
+
+    # a whole line starting with a line marker, the leading blanks cannot span lines
+    line_regex = re.compile(rb'^[^\S\n]*#[^\S\n]*[0-9]+.*\n?', flags=re.MULTILINE)
 
     def check_prerequisites(self):
         return True
 
+    def __iter_markers(self, data):
+        return (m.span() for m in self.line_regex.finditer(data))
+
+    def __select_markers(self, data, state):
+        markers = self.__iter_markers(data)
+        selected = []
+        pos = 0
+        for (start, end) in state.ranges():
+            selected += itertools.islice(markers, start - pos, end - pos)
+            pos = end
+        return selected
+
+    def __scan(self, test_case, fn):
+        with open(test_case, 'rb') as in_file:
+            if os.fstat(in_file.fileno()).st_size == 0:
+                return fn(b'')
+            with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return fn(data)
+
     def __count_instances(self, test_case):
-        count = 0
-        with open(test_case, 'r') as in_file:
-            for line in in_file.readlines():
-                if self.line_regex.search(line):
-                    count += 1
-        return count
+        return self.__scan(test_case, lambda data: sum(1 for _ in self.__iter_markers(data)))
 
     def new(self, test_case, _=None):
-        return BinaryState.create(self.__count_instances(test_case))
+        return BinaryState.create(self.__count_instances(test_case), self.strategy)
 
     def advance(self, test_case, state):
         return state.advance()
 
     def advance_on_success(self, test_case, state):
+        # a merged variant is smaller than the one of the state
+        if os.path.getsize(test_case) == state.variant_size:
+            return state.advance_on_success()
         return state.advance_on_success(self.__count_instances(test_case))
 
+    def rebase(self, state, accepted_state):
+        return state.rebase(accepted_state)
+
+    def get_edits(self, test_case, state):
+        markers = self.__scan(test_case, lambda data: self.__select_markers(data, state))
+        return [(start, end, '') for (start, end) in markers]
+
     def transform(self, test_case, state, process_event_notifier):
+        markers = self.__scan(test_case, lambda data: self.__select_markers(data, state))
+
         tmp = os.path.dirname(test_case)
-        with tempfile.NamedTemporaryFile(mode='w+', delete=False, dir=tmp) as tmp_file:
-            with open(test_case, 'r') as in_file:
-                i = 0
-                for line in in_file.readlines():
-                    if self.line_regex.search(line):
-                        if i < state.index or i >= state.end():
-                            tmp_file.write(line)
-                        i += 1
-                    else:
-                        tmp_file.write(line)
+        with tempfile.NamedTemporaryFile(delete=False, dir=tmp) as tmp_file:
+            Patch((start, end, '') for (start, end) in markers).splice(test_case, tmp_file)
 
         shutil.move(tmp_file.name, test_case)
+        state.variant_size = os.path.getsize(test_case)
         return (PassResult.OK, state)
@@ -1,14 +1,23 @@
+from array import array
 import logging
+import mmap
 import os
 import shutil
 import subprocess
 import tempfile
 
-from cvise.passes.abstract import AbstractPass, BinaryState, PassResult
+from cvise.passes.abstract import AbstractPass, BinaryState, PassResult, STRATEGIES
 from cvise.utils.error import InsaneTestCaseError
+from cvise.utils.patch import Patch
 
 
 class LinesPass(AbstractPass):
+    mergeable = True
+    strategy = 'binary'
+    strategies = tuple(STRATEGIES)
+    # start offsets of the lines of the current test case, followed by its size
+    line_offsets = None
+
     def check_prerequisites(self):
         return self.check_external_program('topformflat')
 
@@ -42,10 +51,59 @@ class LinesPass(AbstractPass):
         else:
             shutil.move(tmp_file.name, test_case)
 
+    def __getstate__(self):
+        # the line offsets only live in the main process
+        state = self.__dict__.copy()
+        state['line_offsets'] = None
+        return state
+
+    @staticmethod
+    def __get_line_offsets(test_case):
+        offsets = array('q')
+        with open(test_case, 'rb') as in_file:
+            size = os.fstat(in_file.fileno()).st_size
+            if size:
+                with mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    pos = 0
+                    while pos < size:
+                        offsets.append(pos)
+                        pos = data.find(b'\n', pos) + 1
+                        if not pos:
+                            break
+        offsets.append(size)
+        return offsets
+
+    @staticmethod
+    def __get_byte_ranges(offsets, state):
+        return [(offsets[start], offsets[end]) for (start, end) in state.ranges()]
+
+    def __locate(self, state):
+        # workers remove the byte ranges of the chunk without reading the lines;
+        # the size identifies the version as every accepted variant is smaller
+        if state is not None:
+            offsets = self.line_offsets
+            state.offsets = (self.__get_byte_ranges(offsets, state), offsets[-1])
+        return state
+
     def __count_instances(self, test_case):
-        with open(test_case, 'r') as in_file:
-            lines = in_file.readlines()
-            return len(lines)
+        self.line_offsets = self.__get_line_offsets(test_case)
+        return len(self.line_offsets) - 1
+
+    def __remove_lines(self, state):
+        # cut the lines removed by the state out of the index
+        offsets = self.line_offsets
+        shifted = array('q')
+        removed = 0
+        pos = 0
+        for (start, end) in state.ranges():
+            if removed:
+                shifted.extend(offset - removed for offset in offsets[pos:start])
+            else:
+                shifted.extend(offsets[pos:start])
+            removed += offsets[end] - offsets[start]
+            pos = end
+        shifted.extend(offset - removed for offset in offsets[pos:])
+        self.line_offsets = shifted
 
     def new(self, test_case, check_sanity=None):
         self.bailout = False
@@ -56,25 +114,46 @@ class LinesPass(AbstractPass):
                 logging.warning('Skipping pass as sanity check fails for topformflat output')
                 return None
         instances = self.__count_instances(test_case)
-        return BinaryState.create(instances)
+        return self.__locate(BinaryState.create(instances, self.strategy))
 
     def advance(self, test_case, state):
-        return state.advance()
+        # a rebased state continues on a version that was not counted here
+        if self.line_offsets is None or self.line_offsets[-1] != os.path.getsize(test_case):
+            self.__count_instances(test_case)
+        return self.__locate(state.advance())
 
     def advance_on_success(self, test_case, state):
-        return state.advance_on_success(self.__count_instances(test_case))
+        (ranges, size) = state.offsets
+        removed = sum(end - start for (start, end) in ranges)
+        offsets = self.line_offsets
+        if offsets is not None and offsets[-1] == size and os.path.getsize(test_case) == size - removed:
+            # the accepted variant is the transformation of the state (and
+            # not a merged one), so the removed lines can be cut from the index
+            self.__remove_lines(state)
+            return self.__locate(state.advance_on_success())
+        return self.__locate(state.advance_on_success(self.__count_instances(test_case)))
+
+    def rebase(self, state, accepted_state):
+        return state.rebase(accepted_state)
+
+    def get_edits(self, test_case, state):
+        (ranges, size) = state.offsets
+        if size != os.path.getsize(test_case):
+            return None
+        return [(start, end, '') for (start, end) in ranges]
 
     def transform(self, test_case, state, process_event_notifier):
-        with open(test_case, 'r') as in_file:
-            data = in_file.readlines()
-
-        old_len = len(data)
-        data = data[0:state.index] + data[state.end():]
-        assert len(data) < old_len
+        (ranges, size) = getattr(state, 'offsets', (None, None))
+        if size != os.path.getsize(test_case):
+            # a rebased state points into an older version
+            offsets = self.__get_line_offsets(test_case)
+            (ranges, size) = (self.__get_byte_ranges(offsets, state), offsets[-1])
+            state.offsets = (ranges, size)
+        assert ranges and all(start < end for (start, end) in ranges)
 
         tmp = os.path.dirname(test_case)
-        with tempfile.NamedTemporaryFile(mode='w+', delete=False, dir=tmp) as tmp_file:
-            tmp_file.writelines(data)
+        with tempfile.NamedTemporaryFile(delete=False, dir=tmp) as tmp_file:
+            Patch((start, end, '') for (start, end) in ranges).splice(test_case, tmp_file)
 
         shutil.move(tmp_file.name, test_case)
 
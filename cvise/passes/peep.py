@@ -1,8 +1,11 @@
+import heapq
+import os
 import re
 
 from cvise.passes.abstract import AbstractPass, PassResult
 from cvise.utils import nestedmatcher
 from cvise.utils.error import UnknownArgumentError
+from cvise.utils.patch import Patch
 
 
 class PeepPass(AbstractPass):
@@ -122,109 +125,178 @@ class PeepPass(AbstractPass):
         delimited_regexes_to_replace.append(([nestedmatcher.RegExPattern(r',\s*')] + x, '1'))
         delimited_regexes_to_replace.append(([nestedmatcher.RegExPattern(r',\s*')] + x, ''))
 
+    while_parts = [nestedmatcher.RegExPattern(r'^while\s*'),
+                   nestedmatcher.BalancedPattern(nestedmatcher.BalancedExpr.parens),
+                   nestedmatcher.RegExPattern(r'\s*'),
+                   (nestedmatcher.BalancedPattern(nestedmatcher.BalancedExpr.curlies), 'body')]
+
+    in_memory = True
+
+    # lazily merged candidates of all patterns, see __create_stream
+    stream = None
+
     def check_prerequisites(self):
         return True
 
-    def new(self, test_case, _=None):
-        return {'pos': 0, 'regex': 0}
-
-    def advance(self, test_case, state):
-        new_state = state.copy()
+    def __getstate__(self):
+        # the candidate stream only lives in the main process
+        state = self.__dict__.copy()
+        state['stream'] = None
+        return state
 
+    def __get_regex_count(self):
         if self.arg == 'a':
-            lim = len(self.regexes_to_replace)
+            return len(self.regexes_to_replace)
         elif self.arg == 'b':
-            lim = len(self.delimited_regexes_to_replace)
+            return len(self.delimited_regexes_to_replace)
         elif self.arg == 'c':
-            lim = 1
+            return 1
         else:
             raise UnknownArgumentError(self.__class__.__name__, self.arg)
 
-        new_state['regex'] += 1
-
-        if new_state['regex'] >= lim:
-            new_state['regex'] = 0
-            new_state['pos'] += 1
-
-        with open(test_case, 'r') as in_file:
-            length = len(in_file.read())
-            if new_state['pos'] >= length:
-                return None
-
-        return new_state
-
-    def advance_on_success(self, test_case, state):
-        return state
-
-    def transform(self, test_case, state, process_event_notifier):
-        with open(test_case, 'r') as in_file:
-            prog = in_file.read()
-            prog2 = prog
-
-        if state['pos'] > len(prog):
-            return (PassResult.STOP, state)
-
+    def __get_search(self, prog, regex):
         if self.arg == 'a':
-            item = self.regexes_to_replace[state['regex']]
-            search = item[0]
-            replace = item[1]
-
-            m = nestedmatcher.search(search, prog2, pos=state['pos'], search=False)
-
-            if m is not None:
-                prog2 = prog2[0:m['all'][0]] + replace + prog2[m['all'][1]:]
-
-                if prog != prog2:
-                    with open(test_case, 'w') as out_file:
-                        out_file.write(prog2)
-
-                    return (PassResult.OK, state)
+            return self.regexes_to_replace[regex]
         elif self.arg == 'b':
-            item = self.delimited_regexes_to_replace[state['regex']]
-            search = item[0]
-            replace = item[1]
+            (search, replace) = self.delimited_regexes_to_replace[regex]
 
-            if prog2.startswith(','):
+            if prog.startswith(','):
                 front = (self.border_or_space_optional_pattern, 'delim1')
             else:
                 front = (self.border_or_space_pattern, 'delim1')
 
-            if prog2.endswith(','):
+            if prog.endswith(','):
                 back = (self.border_or_space_optional_pattern, 'delim2')
             else:
                 back = (self.border_or_space_pattern, 'delim2')
 
-            search = [front] + search + [back]
+            return ([front] + search + [back], replace)
+        elif self.arg == 'c':
+            return (self.while_parts, None)
+        else:
+            raise UnknownArgumentError(self.__class__.__name__, self.arg)
+
+    def __get_replacement(self, prog, regex, m):
+        replace = self.__get_search(prog, regex)[1]
+
+        if self.arg == 'a':
+            return (m['all'][0], m['all'][1], replace)
+        elif self.arg == 'b':
+            return (m['delim1'][1], m['delim2'][0], replace)
+        else:
+            body = prog[m['body'][0]:m['body'][1]]
+            body = re.sub(r'break\s*;', '', body)
+            return (m['all'][0], m['all'][1], body)
+
+    @staticmethod
+    def __normalize_edit(prog, begin, end, text):
+        # the same variant can be reached through different edits, e.g. by
+        # removing any '-' of '--' or by replacing '+=' with '='
+        while begin < end and text and prog[begin] == text[0]:
+            begin += 1
+            text = text[1:]
+        while begin < end and text and prog[end - 1] == text[-1]:
+            end -= 1
+            text = text[:-1]
+        if not text:
+            while begin > 0 and prog[begin - 1] == prog[end - 1]:
+                begin -= 1
+                end -= 1
+        return (begin, end, text)
+
+    def __iter_candidates(self, prog, regex, pos):
+        search = self.__get_search(prog, regex)[0]
+        last = pos - 1
+
+        m = nestedmatcher.search(search, prog, pos=pos)
+        while m is not None:
+            start = m['all'][0]
+
+            # transform slides over positions where only the first part matches
+            first = start
+            while first - 1 > last and nestedmatcher.search(search[:1], prog, pos=first - 1, search=False):
+                first -= 1
+            for candidate in range(first, start + 1):
+                m = nestedmatcher.search(search, prog, pos=candidate, search=False)
+                if m is None:
+                    continue
+                # skip sites where the replacement does not change anything
+                (begin, end, text) = self.__get_replacement(prog, regex, m)
+                if prog[begin:end] != text:
+                    yield (candidate, self.__normalize_edit(prog, begin, end, text))
+
+            last = start
+            m = nestedmatcher.search(search, prog, pos=start + 1)
+
+    def __create_stream(self, test_case, prog, pos, regex):
+        # candidates ordered by (pos, regex), starting at the given state
+        heap = []
+        for r in range(self.__get_regex_count()):
+            candidates = self.__iter_candidates(prog, r, pos if r >= regex else pos + 1)
+            candidate = next(candidates, None)
+            if candidate is not None:
+                heap.append((candidate[0], r, candidate[1], candidates))
+        heapq.heapify(heap)
+        self.stream = {'test_case': test_case, 'size': os.path.getsize(test_case), 'heap': heap, 'edits': set(),
+                       'state': None}
+
+    def __next_candidate(self):
+        # several positions and patterns can lead to the same edit, only the
+        # first of them is worth a test
+        heap = self.stream['heap']
+        edits = self.stream['edits']
+        while heap:
+            (start, regex, edit, candidates) = heap[0]
+            following = next(candidates, None)
+            if following is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (following[0], regex, following[1], candidates))
+
+            if edit not in edits:
+                edits.add(edit)
+                self.stream['state'] = {'pos': start, 'regex': regex}
+                return self.stream['state']
+        return None
+
+    def __get_next_candidate(self, test_case, state, inclusive):
+        # the test case only changes with an accepted variant, a different size
+        # means that it was replaced in the meantime
+        stream = self.stream
+        if (not inclusive and stream is not None and stream['state'] == state and stream['test_case'] == test_case
+                and stream['size'] == os.path.getsize(test_case)):
+            return self.__next_candidate()
+
+        with open(test_case, 'r') as in_file:
+            prog = in_file.read()
 
-            m = nestedmatcher.search(search, prog2, pos=state['pos'], search=False)
+        if state is None:
+            self.__create_stream(test_case, prog, 0, 0)
+        elif inclusive:
+            self.__create_stream(test_case, prog, state['pos'], state['regex'])
+        else:
+            self.__create_stream(test_case, prog, state['pos'], state['regex'] + 1)
+        return self.__next_candidate()
 
-            if m is not None:
-                prog2 = prog2[0:m['delim1'][1]] + replace + prog2[m['delim2'][0]:]
+    def new(self, test_case, _=None):
+        return self.__get_next_candidate(test_case, None, True)
 
-                if prog != prog2:
-                    with open(test_case, 'w') as out_file:
-                        out_file.write(prog2)
+    def advance(self, test_case, state):
+        return self.__get_next_candidate(test_case, state, False)
 
-                    return (PassResult.OK, state)
-        elif self.arg == 'c':
-            search = [nestedmatcher.RegExPattern(r'^while\s*'),
-                      nestedmatcher.BalancedPattern(nestedmatcher.BalancedExpr.parens),
-                      nestedmatcher.RegExPattern(r'\s*'),
-                      (nestedmatcher.BalancedPattern(nestedmatcher.BalancedExpr.curlies), 'body')]
+    def advance_on_success(self, test_case, state):
+        return self.__get_next_candidate(test_case, state, True)
 
-            m = nestedmatcher.search(search, prog2, pos=state['pos'], search=False)
+    def transform_data(self, prog, state):
+        if state['pos'] > len(prog):
+            return (PassResult.STOP, state, Patch())
 
-            if m is not None:
-                body = prog2[m['body'][0]:m['body'][1]]
-                body = re.sub(r'break\s*;', '', body)
-                prog2 = prog2[0:m['all'][0]] + body + prog2[m['all'][1]:]
+        m = nestedmatcher.search(self.__get_search(prog, state['regex'])[0], prog, pos=state['pos'], search=False)
 
-                if prog != prog2:
-                    with open(test_case, 'w') as out_file:
-                        out_file.write(prog2)
+        if m is not None:
+            patch = Patch([self.__get_replacement(prog, state['regex'], m)])
 
-                    return (PassResult.OK, state)
-        else:
-            raise UnknownArgumentError(self.__class__.__name__, self.arg)
+            if patch.modifies(prog):
+                return (PassResult.OK, state, patch)
 
-        return (PassResult.INVALID, state)
+        return (PassResult.INVALID, state, Patch())
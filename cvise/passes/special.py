@@ -2,9 +2,12 @@ import re
 
 from cvise.passes.abstract import AbstractPass, PassResult
 from cvise.utils.error import UnknownArgumentError
+from cvise.utils.patch import Patch
 
 
 class SpecialPass(AbstractPass):
+    in_memory = True
+
     def check_prerequisites(self):
         return True
 
@@ -63,12 +66,7 @@ class SpecialPass(AbstractPass):
     def advance_on_success(self, test_case, state):
         return self.new(test_case)
 
-    def transform(self, test_case, state, process_event_notifier):
-        with open(test_case, 'r') as in_file:
-            data = in_file.read()
-            index = state['index']
-            ((start, end), replacement) = state['modifications'][index]
-            new_data = data[:start] + replacement + data[end:]
-            with open(test_case, 'w') as out_file:
-                out_file.write(new_data)
-                return (PassResult.OK, state)
+    def transform_data(self, data, state):
+        index = state['index']
+        ((start, end), replacement) = state['modifications'][index]
+        return (PassResult.OK, state, Patch([(start, end, replacement)]))
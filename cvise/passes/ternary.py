@@ -1,6 +1,7 @@
 from cvise.passes.abstract import AbstractPass, PassResult
 from cvise.utils import nestedmatcher
 from cvise.utils.error import UnknownArgumentError
+from cvise.utils.patch import Patch
 
 
 class TernaryPass(AbstractPass):
@@ -20,6 +21,8 @@ class TernaryPass(AbstractPass):
              (varnumexp_pattern, 'c'),
              (border_or_space_pattern, 'del2')]
 
+    in_memory = True
+
     def check_prerequisites(self):
         return True
 
@@ -27,9 +30,7 @@ class TernaryPass(AbstractPass):
         with open(test_case, 'r') as in_file:
             prog = in_file.read()
 
-        m = nestedmatcher.search(self.parts, prog, pos=pos)
-
-        return m
+        return nestedmatcher.search(self.parts, prog, pos=pos)
 
     def new(self, test_case, _=None):
         return self.__get_next_match(test_case, pos=0)
@@ -40,24 +41,17 @@ class TernaryPass(AbstractPass):
     def advance_on_success(self, test_case, state):
         return self.__get_next_match(test_case, pos=state['all'][0])
 
-    def transform(self, test_case, state, process_event_notifier):
-        with open(test_case, 'r') as in_file:
-            prog = in_file.read()
-            prog2 = prog
-
+    def transform_data(self, prog, state):
         while True:
             if state is None:
-                return (PassResult.STOP, state)
+                return (PassResult.STOP, state, Patch())
             else:
                 if self.arg not in ['b', 'c']:
                     raise UnknownArgumentError(self.__class__.__name__, self.arg)
 
-                prog2 = prog2[0:state['del1'][1]] + prog2[state[self.arg][0]:state[self.arg][1]] + prog2[state['del2'][0]:]
-
-                if prog != prog2:
-                    with open(test_case, 'w') as out_file:
-                        out_file.write(prog2)
+                patch = Patch([(state['del1'][1], state[self.arg][0], ''), (state[self.arg][1], state['del2'][0], '')])
 
-                    return (PassResult.OK, state)
+                if patch.modifies(prog):
+                    return (PassResult.OK, state, patch)
                 else:
-                    state = self.advance(test_case, state)
+                    state = nestedmatcher.search(self.parts, prog, pos=state['all'][0] + 1)
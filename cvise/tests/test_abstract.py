@@ -0,0 +1,147 @@
+import multiprocessing
+import signal
+import time
+import unittest
+
+from cvise.passes.abstract import BinaryState, ProcessEventNotifier
+from cvise.tests.testabstract import LockedTable
+
+
+class BinaryStateRebaseTestCase(unittest.TestCase):
+    def create(self, instances, chunk, index):
+        state = BinaryState.create(instances)
+        state.chunk = chunk
+        state.index = index
+        return state
+
+    def test_before(self):
+        state = self.create(10, 2, 0).rebase(self.create(10, 2, 4))
+        self.assertEqual((state.index, state.chunk, state.instances), (0, 2, 8))
+
+    def test_after(self):
+        state = self.create(10, 2, 6).rebase(self.create(10, 2, 2))
+        self.assertEqual((state.index, state.chunk, state.instances), (4, 2, 8))
+
+    def test_adjacent(self):
+        state = self.create(10, 2, 4).rebase(self.create(10, 2, 2))
+        self.assertEqual((state.index, state.chunk, state.instances), (2, 2, 8))
+
+    def test_overlap(self):
+        self.assertIsNone(self.create(10, 4, 2).rebase(self.create(10, 2, 4)))
+
+    def test_last_chunk(self):
+        # the removed chunk is shorter than the chunk size
+        state = self.create(9, 4, 0).rebase(self.create(9, 4, 8))
+        self.assertEqual((state.index, state.chunk, state.instances), (0, 4, 8))
+
+    def test_everything_removed(self):
+        self.assertIsNone(self.create(2, 2, 0).rebase(self.create(2, 2, 0)))
+
+
+class BinaryStateAdvanceOnSuccessTestCase(unittest.TestCase):
+    def create(self, instances, chunk, index):
+        state = BinaryState.create(instances)
+        state.chunk = chunk
+        state.index = index
+        return state
+
+    def test_count(self):
+        state = self.create(10, 2, 6).advance_on_success(5)
+        self.assertEqual((state.index, state.chunk, state.instances), (0, 1, 5))
+
+    def test_chunk_removed(self):
+        state = self.create(9, 4, 4).advance_on_success()
+        self.assertEqual((state.index, state.chunk, state.instances), (4, 4, 5))
+
+    def test_delta(self):
+        state = self.create(10, 2, 4).advance_on_success(removed=3)
+        self.assertEqual((state.index, state.chunk, state.instances), (4, 2, 7))
+
+    def test_everything_removed(self):
+        self.assertIsNone(self.create(4, 4, 0).advance_on_success())
+
+
+class BinaryStateStrategyTestCase(unittest.TestCase):
+    def walk(self, strategy, instances):
+        state = BinaryState.create(instances, strategy)
+        states = []
+        while state is not None:
+            states.append((state.ranges(), state.chunk))
+            state = state.advance()
+        return states
+
+    def test_binary(self):
+        self.assertEqual(self.walk('binary', 3), [([(0, 3)], 3), ([(0, 1)], 1), ([(1, 2)], 1), ([(2, 3)], 1)])
+
+    def test_reverse(self):
+        self.assertEqual(self.walk('reverse', 3), [([(0, 3)], 3), ([(2, 3)], 1), ([(1, 2)], 1), ([(0, 1)], 1)])
+
+    def test_reverse_success(self):
+        state = BinaryState.create(8, 'reverse').advance().advance()
+        self.assertEqual(state.ranges(), [(0, 4)])
+        state = BinaryState.create(8, 'reverse').advance().advance_on_success()
+        self.assertEqual((state.ranges(), state.instances), ([(0, 4)], 4))
+
+    def test_ddmin(self):
+        self.assertEqual(self.walk('ddmin', 5), [([(0, 5)], 5),
+                                                 ([(2, 5)], 2), ([(0, 2), (4, 5)], 2), ([(0, 4)], 2),
+                                                 ([(0, 2)], 2), ([(2, 4)], 2), ([(4, 5)], 2),
+                                                 ([(1, 5)], 1), ([(0, 1), (2, 5)], 1), ([(0, 2), (3, 5)], 1),
+                                                 ([(0, 3), (4, 5)], 1), ([(0, 4)], 1),
+                                                 ([(0, 1)], 1), ([(1, 2)], 1), ([(2, 3)], 1), ([(3, 4)], 1),
+                                                 ([(4, 5)], 1)])
+
+    def test_ddmin_subset(self):
+        state = BinaryState.create(10, 'ddmin').advance().advance().advance()
+        self.assertTrue(state.complement)
+        state = state.advance_on_success()
+        self.assertEqual((state.ranges(), state.instances), ([(0, 1)], 2))
+        self.assertIsNone(state.rebase(BinaryState.create(10, 'ddmin')))
+
+    def test_grow(self):
+        state = BinaryState.create(16, 'grow').advance().advance().advance()
+        self.assertEqual((state.index, state.chunk), (0, 4))
+        state = state.advance_on_success().advance_on_success()
+        self.assertEqual((state.index, state.chunk, state.instances), (0, 8, 8))
+        state = state.advance()
+        self.assertEqual((state.index, state.chunk, state.successes), (0, 4, 0))
+
+
+class ProcessEventNotifierTestCase(unittest.TestCase):
+    def test_register(self):
+        pid_table = multiprocessing.Array('q', [0, ProcessEventNotifier.pack(3, 0)])
+        notifier = ProcessEventNotifier(pid_table, 1, 3)
+        notifier.register_pid(1234)
+        self.assertEqual(ProcessEventNotifier.unpack(pid_table[1]), (3, 1234))
+        notifier.unregister_pid()
+        self.assertEqual(list(pid_table), [0, ProcessEventNotifier.pack(3, 0)])
+
+    def test_locked(self):
+        # the token check and the write happen under the lock of the table
+        pid_table = LockedTable([ProcessEventNotifier.pack(3, 0)])
+        ProcessEventNotifier(pid_table, 0, 3).register_pid(1234)
+        ProcessEventNotifier(pid_table, 0, 4).register_pid(5678)
+        self.assertEqual(list(pid_table), [ProcessEventNotifier.pack(3, 1234)])
+
+    def test_reused_slot(self):
+        # the slot belongs to the variant with token 4 now
+        pid_table = multiprocessing.Array('q', [ProcessEventNotifier.pack(4, 1234)])
+        notifier = ProcessEventNotifier(pid_table, 0, 3)
+        notifier.register_pid(5678)
+        notifier.unregister_pid()
+        self.assertEqual(ProcessEventNotifier.unpack(pid_table[0]), (4, 1234))
+
+    def test_owns_slot(self):
+        pid_table = multiprocessing.Array('q', [ProcessEventNotifier.pack(3, 0)])
+        self.assertTrue(ProcessEventNotifier(pid_table, 0, 3).owns_slot())
+        self.assertFalse(ProcessEventNotifier(pid_table, 0, 4).owns_slot())
+        self.assertTrue(ProcessEventNotifier(None).owns_slot())
+
+    def test_refused_process(self):
+        # the variant lost its slot while its process started
+        pid_table = multiprocessing.Array('q', [ProcessEventNotifier.pack(3, 0)])
+        start = time.monotonic()
+        (_, _, returncode) = ProcessEventNotifier(pid_table, 0, 4).run_process(['sleep', '30'])
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(returncode, -signal.SIGTERM)
+        self.assertEqual(ProcessEventNotifier.unpack(pid_table[0]), (3, 0))
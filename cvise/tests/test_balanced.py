@@ -1,7 +1,9 @@
 import os
 import tempfile
 import unittest
+from unittest import mock
 
+from cvise.passes import balanced
 from cvise.passes.abstract import PassResult
 from cvise.passes.balanced import BalancedPass
 
@@ -68,6 +70,28 @@ class BalancedParensTestCase(unittest.TestCase):
 
         self.assertEqual(variant, 'This (is a  test)!\n')
 
+    def test_advance_keeps_text(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('(This) (is a (simple)) (test)!\n')
+
+        state = self.pass_.new(tmp_file.name)
+        starts = [state[0]]
+        # the test case is only read again after a success
+        with mock.patch.object(balanced, 'open', create=True, side_effect=AssertionError):
+            while True:
+                state = self.pass_.advance(tmp_file.name, state)
+                if state is None:
+                    break
+                starts.append(state[0])
+        self.assertEqual(starts, [0, 7, 13, 23])
+
+        # a test case of a different size is read again
+        with open(tmp_file.name, 'w') as tmp_file:
+            tmp_file.write('(a) (b)\n')
+        self.assertEqual(self.pass_.advance(tmp_file.name, (0, 3)), (4, 7))
+
+        os.unlink(tmp_file.name)
+
 
 class BalancedParensOnlyTestCase(unittest.TestCase):
     def setUp(self):
@@ -311,3 +335,84 @@ class BalancedParensInsideTestCase(unittest.TestCase):
         os.unlink(tmp_file.name)
 
         self.assertEqual(iteration, 5)
+
+
+class BalancedChunkedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pass_ = BalancedPass('parens')
+        self.pass_.chunked = True
+
+    def test_all_at_once(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('(This) (is a (simple)) (test)!\n')
+
+        state = self.pass_.new(tmp_file.name)
+        self.assertEqual(state.instances, 4)
+        (result, state) = self.pass_.transform(tmp_file.name, state, None)
+
+        with open(tmp_file.name) as variant_file:
+            variant = variant_file.read()
+
+        os.unlink(tmp_file.name)
+
+        self.assertEqual(result, PassResult.OK)
+        self.assertEqual(variant, '  !\n')
+
+    def test_single_removals(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('(This) (is a (simple)) (test)!\n')
+
+        state = self.pass_.new(tmp_file.name)
+        variants = []
+
+        while state is not None:
+            if state.chunk == 1:
+                (_, state) = self.pass_.transform(tmp_file.name, state, None)
+
+                with open(tmp_file.name) as variant_file:
+                    variants.append(variant_file.read())
+
+                with open(tmp_file.name, 'w') as tmp_file:
+                    tmp_file.write('(This) (is a (simple)) (test)!\n')
+
+            state = self.pass_.advance(tmp_file.name, state)
+
+        os.unlink(tmp_file.name)
+
+        self.assertEqual(variants, [' (is a (simple)) (test)!\n', '(This)  (test)!\n',
+                                    '(This) (is a ) (test)!\n', '(This) (is a (simple)) !\n'])
+
+    def test_success(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('(This) (is a (simple)) (test)!\n')
+
+        state = self.pass_.new(tmp_file.name)
+        state = self.pass_.advance(tmp_file.name, state)
+        (_, state) = self.pass_.transform(tmp_file.name, state, None)
+        state = self.pass_.advance_on_success(tmp_file.name, state)
+
+        with open(tmp_file.name) as variant_file:
+            variant = variant_file.read()
+
+        os.unlink(tmp_file.name)
+
+        self.assertEqual(variant, '  (test)!\n')
+        self.assertEqual((state.index, state.chunk, state.instances), (0, 2, 1))
+
+    def test_matches_found_once(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('(This) (is a (simple)) (test)!\n')
+
+        state = self.pass_.new(tmp_file.name)
+        os.unlink(tmp_file.name)
+
+        # the test manager passes its own copy of the test case
+        prog = ''.join(['(This) (is a (simple))', ' (test)!\n'])
+        variants = []
+        with mock.patch.object(balanced.nestedmatcher, 'find', side_effect=AssertionError):
+            while state is not None:
+                (_, _, patch) = self.pass_.transform_data(prog, state)
+                variants.append(patch.apply(prog))
+                state = state.advance()
+        self.assertEqual(variants[-4:], [' (is a (simple)) (test)!\n', '(This)  (test)!\n',
+                                         '(This) (is a ) (test)!\n', '(This) (is a (simple)) !\n'])
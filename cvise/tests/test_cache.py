@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cvise.utils import cache
+
+
+class TestResultCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.script = os.path.join(self.folder, 'test.sh')
+        with open(self.script, 'w') as script_file:
+            script_file.write('#!/bin/sh\ngrep foo test.c\n')
+
+        self.test_case = os.path.join(self.folder, 'test.c')
+        with open(self.test_case, 'w') as test_case_file:
+            test_case_file.write('int foo;\n')
+
+        self.cache = cache.TestResultCache(self.script)
+
+    def tearDown(self):
+        self.cache.remove()
+        self.assertFalse(os.path.exists(self.cache.folder))
+
+    def test_miss(self):
+        key = self.cache.get_key([self.test_case])
+        self.assertIsNone(self.cache.lookup(key))
+
+    def test_hit(self):
+        key = self.cache.get_key([self.test_case])
+        self.cache.store(key, 1)
+        self.assertEqual(self.cache.lookup(self.cache.get_key([self.test_case])), 1)
+
+    def test_content_change(self):
+        key = self.cache.get_key([self.test_case])
+        self.cache.store(key, 0)
+
+        with open(self.test_case, 'w') as test_case_file:
+            test_case_file.write('int bar;\n')
+
+        self.assertIsNone(self.cache.lookup(self.cache.get_key([self.test_case])))
+
+    def test_script_change(self):
+        key = self.cache.get_key([self.test_case])
+        self.cache.store(key, 0)
+
+        with open(self.script, 'a') as script_file:
+            script_file.write('grep bar test.c\n')
+
+        other = cache.TestResultCache(self.script, self.cache.folder)
+        self.assertIsNone(other.lookup(other.get_key([self.test_case])))
+
+    def test_killed(self):
+        key = self.cache.get_key([self.test_case])
+        self.cache.store(key, -15)
+        self.assertIsNone(self.cache.lookup(key))
+
+    def test_persistent(self):
+        folder = os.path.join(self.folder, 'cache')
+        result_cache = cache.TestResultCache(self.script, folder)
+        result_cache.store(result_cache.get_key([self.test_case]), 0)
+        result_cache.remove()
+
+        result_cache = cache.TestResultCache(self.script, folder)
+        self.assertEqual(result_cache.lookup(result_cache.get_key([self.test_case])), 0)
+
+
+class PassCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = cache.PassCache(10)
+
+    def tearDown(self):
+        self.cache.remove()
+
+    def test_hit(self):
+        key = self.cache.get_key('LinesPass::0', b'int a;')
+        self.assertIsNone(self.cache.lookup(key))
+        self.cache.store(key, b'')
+        self.assertEqual(self.cache.lookup(key), b'')
+
+    def test_pass_key(self):
+        self.cache.store(self.cache.get_key('LinesPass::0', b'int a;'), b'')
+        self.assertIsNone(self.cache.lookup(self.cache.get_key('LinesPass::1', b'int a;')))
+
+    def test_spill(self):
+        keys = [self.cache.get_key('LinesPass::0', str(i).encode()) for i in range(3)]
+        for key in keys:
+            self.cache.store(key, b'12345')
+        self.assertEqual(self.cache.size, 10)
+        self.assertEqual(list(self.cache.disk_entries), keys[:1])
+
+        self.assertEqual(self.cache.lookup(keys[0]), b'12345')
+        self.assertEqual(list(self.cache.entries), keys[2:] + keys[:1])
+        self.assertEqual(list(self.cache.disk_entries), keys[1:2])
+
+    def test_disk_budget(self):
+        keys = [self.cache.get_key('LinesPass::0', str(i).encode()) for i in range(20)]
+        for key in keys:
+            self.cache.store(key, b'12345')
+        self.assertLessEqual(self.cache.disk_size, 40)
+        self.assertIsNone(self.cache.lookup(keys[0]))
+        self.assertEqual(self.cache.lookup(keys[-1]), b'12345')
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+
+from cvise.passes.abstract import PassResult
+from cvise.passes.clang import ClangPass
+from cvise.tests.testabstract import FakeClangDelta
+
+# renders --counters by removing the declaration of the counter, logs
+# every invocation
+BATCH = """
+import re
+import sys
+
+log_invocation()
+
+args = dict(arg[2:].split('=', 1) for arg in sys.argv[1:-1])
+if 'counters' not in args:
+    print('Error: Bad command line option `{}`'.format(sys.argv[1]))
+    sys.exit(255)
+
+with open(sys.argv[-1]) as in_file:
+    decls = in_file.read().split(';')[:-1]
+(first, last) = map(int, args['counters'].split('-'))
+for counter in range(first, last + 1):
+    if counter > len(decls):
+        print('counter {} exit 1'.format(counter))
+    elif re.search('crash', decls[counter - 1]):
+        print('counter {} exit 134'.format(counter))
+    else:
+        with open('{}.{}'.format(args['output'], counter), 'w') as out_file:
+            out_file.write(''.join(d + ';' for (i, d) in enumerate(decls) if i != counter - 1))
+        print('counter {} exit 0'.format(counter))
+"""
+
+# an old clang_delta without --counters
+PROGRAM = """
+import sys
+
+print('Error: Bad command line option `{}`'.format(sys.argv[1]))
+sys.exit(255)
+"""
+
+
+class ClangTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def create_pass(self, source):
+        self.clang_delta = FakeClangDelta(self.folder.name, source)
+        pass_ = ClangPass('remove-unused-var', {'clang_delta': self.clang_delta.path})
+        pass_.clang_delta_std = None
+        return pass_
+
+    def create_test_case(self, data):
+        test_case = os.path.join(self.folder.name, 'test.c')
+        with open(test_case, 'w') as out_file:
+            out_file.write(data)
+        return test_case
+
+    def get_invocations(self):
+        return [line for line in self.clang_delta.get_invocations() if '--server' not in line]
+
+    def test_window(self):
+        data = 'int a;int b;int crash;'
+        pass_ = self.create_pass(BATCH)
+        pass_.parallel_tests = 2
+        state = pass_.new(self.create_test_case(data))
+
+        variants = []
+        while True:
+            (result, state, patch) = pass_.transform_data(data, state)
+            if result == PassResult.STOP:
+                break
+            self.assertEqual(result, PassResult.OK)
+            variants.append(patch.apply(data) if patch is not None else None)
+            state = pass_.advance(None, state)
+
+        # the crash is left to a worker that reports it
+        self.assertEqual(variants, ['int b;int crash;', 'int a;int crash;', None])
+        self.assertEqual(len(self.get_invocations()), 2)
+
+    def test_no_counters(self):
+        data = 'int a;'
+        pass_ = self.create_pass(PROGRAM)
+        pass_.parallel_tests = 2
+        state = pass_.new(self.create_test_case(data))
+        self.assertEqual(pass_.transform_data(data, state), (PassResult.OK, state, None))
+        self.assertTrue(pass_.batch_unsupported)
@@ -0,0 +1,111 @@
+import multiprocessing
+import tempfile
+import unittest
+
+import pebble
+
+from cvise.passes import clang_delta
+from cvise.passes.abstract import ProcessEventNotifier
+from cvise.tests.testabstract import FakeClangDelta
+
+# answers like clang_delta --server, every request prints its arguments
+# and a request with missing outputs gets an error reply
+SERVER = """
+import sys
+
+if sys.argv[1:] != ['--server']:
+    print(' '.join(sys.argv[1:]))
+    sys.exit(0)
+
+print('ready', flush=True)
+for line in sys.stdin:
+    fields = line.rstrip('\\n').split('\\t')
+    if 'missing' in fields:
+        print('error No such file or directory', flush=True)
+        continue
+    with open(fields[0], 'w') as out_file:
+        out_file.write(' '.join(fields[2:]))
+    with open(fields[1], 'w') as err_file:
+        err_file.write('Available transformation instances: 3\\n')
+    print('pid 1234', flush=True)
+    print('exit 1' if 'fail' in fields else 'exit 0', flush=True)
+"""
+
+# does not know --server
+PROGRAM = """
+import sys
+
+print(' '.join(sys.argv[1:]))
+sys.exit(255 if sys.argv[1] == '--server' else 0)
+"""
+
+
+def run_in_worker(program, counter):
+    (stdout, _, _) = clang_delta.run_clang_delta(program, ['req{}'.format(counter)], ProcessEventNotifier(None))
+    return (stdout, [server.proc.pid for server in clang_delta.servers[program]])
+
+
+class ClangDeltaServerTestCase(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.folder = folder.name
+
+    def create_program(self, source):
+        return FakeClangDelta(self.folder, source).path
+
+    def test_server(self):
+        program = self.create_program(SERVER)
+        pid_table = multiprocessing.Array('q', 1)
+        notifier = ProcessEventNotifier(pid_table, 0)
+        for counter in range(1, 3):
+            result = clang_delta.run_clang_delta(program, ['--counter={}'.format(counter), 'a.c'], notifier)
+            self.assertEqual(result, ('--counter={} a.c'.format(counter), 'Available transformation instances: 3\n', 0))
+        self.assertEqual(clang_delta.run_clang_delta(program, ['fail'], notifier)[2], 1)
+        self.assertEqual(list(pid_table), [0])
+        # a single server answered all the requests
+        self.assertEqual(len(clang_delta.servers[program]), 1)
+        clang_delta.servers.pop(program)[0].close()
+
+    def test_close_idle_servers(self):
+        program = self.create_program(SERVER)
+        started = [clang_delta.acquire_server(program) for _ in range(3)]
+        for server in started:
+            clang_delta.release_server(program, server)
+
+        clang_delta.close_idle_servers(program, keep=1)
+        self.assertEqual(clang_delta.servers[program], started[:1])
+        self.assertTrue(all(server.proc.returncode == 0 for server in started[1:]))
+        clang_delta.close_idle_servers()
+        self.assertEqual(clang_delta.servers[program], [])
+        self.assertEqual(started[0].proc.returncode, 0)
+
+    def test_pool_workers(self):
+        program = self.create_program(SERVER)
+        clang_delta.run_clang_delta(program, ['a.c'], ProcessEventNotifier(None))
+        (parent_server, ) = clang_delta.servers[program]
+        self.addCleanup(clang_delta.close_idle_servers)
+
+        # the workers do not inherit the idle server of the main process
+        with pebble.ProcessPool(max_workers=4) as pool:
+            futures = [pool.schedule(run_in_worker, args=(program, counter)) for counter in range(8)]
+            results = [future.result() for future in futures]
+        for (counter, (stdout, server_pids)) in enumerate(results):
+            self.assertEqual(stdout, 'req{}'.format(counter))
+            self.assertNotIn(parent_server.proc.pid, server_pids)
+        self.assertEqual(clang_delta.servers[program], [parent_server])
+
+    def test_server_error(self):
+        program = self.create_program(SERVER)
+        # the request is run without the server and not reported as its exit code
+        result = clang_delta.run_clang_delta(program, ['missing', 'a.c'], ProcessEventNotifier(None))
+        self.assertEqual(result, ('missing a.c\n', '', 0))
+        # the server that failed is not reused
+        self.assertEqual(clang_delta.servers.get(program, []), [])
+        self.assertNotIn(program, clang_delta.unsupported)
+
+    def test_no_server(self):
+        program = self.create_program(PROGRAM)
+        result = clang_delta.run_clang_delta(program, ['--counter=1', 'a.c'], ProcessEventNotifier(None))
+        self.assertEqual(result, ('--counter=1 a.c\n', '', 0))
+        self.assertIn(program, clang_delta.unsupported)
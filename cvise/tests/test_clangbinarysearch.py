@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from cvise.passes.clangbinarysearch import ClangBinarySearchPass
+from cvise.tests.testabstract import FakeClangDelta
+
+# answers --query-instances with the number of declarations, one more
+# for c++11; logs every query
+PROGRAM = """
+import sys
+
+if '--server' in sys.argv:
+    sys.exit(255)
+
+log_invocation()
+
+with open(sys.argv[-1]) as in_file:
+    instances = in_file.read().count(';')
+if '--std=c++11' in sys.argv:
+    instances += 1
+print('Available transformation instances: {}'.format(instances))
+"""
+
+
+class ClangBinarySearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.clang_delta = FakeClangDelta(self.folder.name, PROGRAM)
+        self.pass_ = ClangBinarySearchPass('remove-unused-function', {'clang_delta': self.clang_delta.path})
+        self.pass_.clang_delta_std = None
+        self.test_case = os.path.join(self.folder.name, 'test.cc')
+
+    def write_test_case(self, data):
+        with open(self.test_case, 'w') as out_file:
+            out_file.write(data)
+
+    def get_queries(self):
+        queries = len(self.clang_delta.get_invocations())
+        self.clang_delta.clear_invocations()
+        return queries
+
+    def test_cached_counts(self):
+        self.write_test_case('int a; int b; int c; int d;')
+        state = self.pass_.new(self.test_case)
+        self.assertEqual(state.instances, 5)
+        self.assertEqual(self.pass_.clang_delta_std, 'c++11')
+        self.assertEqual(self.get_queries(), 5)
+
+        # nothing changed
+        state = self.pass_.new(self.test_case)
+        self.assertEqual(state.instances, 5)
+        self.assertEqual(self.get_queries(), 0)
+        self.assertEqual(self.pass_.probe_durations, {})
+
+    def test_concurrent_probes(self):
+        self.write_test_case('int a; int b;')
+        self.pass_.parallel_tests = 3
+        state = self.pass_.new(self.test_case)
+        self.assertEqual(state.instances, 3)
+        self.assertEqual(self.pass_.clang_delta_std, 'c++11')
+        self.assertEqual(self.get_queries(), 5)
+        self.assertEqual(sorted(self.pass_.probe_durations), sorted(ClangBinarySearchPass.STANDARDS))
+
+    def test_redetect_standard(self):
+        self.write_test_case('int a; int b; int c; int d;')
+        self.pass_.new(self.test_case)
+        self.get_queries()
+
+        # a small change only needs the count of the detected standard
+        self.write_test_case('int a; int b; int c;')
+        state = self.pass_.new(self.test_case)
+        self.assertEqual(state.instances, 4)
+        self.assertEqual(self.get_queries(), 1)
+
+        self.write_test_case('int a;')
+        self.pass_.new(self.test_case)
+        self.assertEqual(self.get_queries(), 5)
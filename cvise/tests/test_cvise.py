@@ -0,0 +1,139 @@
+import os
+import tempfile
+import unittest
+
+from cvise.cvise import CVise
+from cvise.passes.clang import ClangPass
+from cvise.passes.clangbinarysearch import ClangBinarySearchPass
+from cvise.passes.lines import LinesPass
+from cvise.tests.testabstract import FakeClangDelta
+from cvise.utils.error import CViseError
+from cvise.utils.statistics import PassStatistic
+
+
+class FakeTestManager:
+    def __init__(self):
+        self.pass_statistic = PassStatistic()
+        self.test_cases = set()
+
+
+# answers --query-instances=all, logs every query
+QUERY_ALL = """
+import sys
+
+if '--query-instances=all' not in sys.argv:
+    sys.exit(255)
+
+log_invocation()
+
+print('remove-unused-function: 0')
+print('rename-fun: 2')
+print('remove-namespace: error')
+"""
+
+
+class SchedulePassesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.reducer = CVise(FakeTestManager())
+        self.statistic = self.reducer.test_manager.pass_statistic
+        self.passes = [LinesPass(str(i)) for i in range(3)]
+
+    def add_run(self, pass_, cpu_seconds, bytes_removed, failed, seconds=1):
+        self.statistic.start(pass_)
+        self.statistic.stop(pass_)
+        self.statistic.stats[repr(pass_)].total_seconds += seconds
+        self.statistic.add_test_time(pass_, 0, seconds, cpu_seconds)
+        if bytes_removed:
+            self.statistic.add_success(pass_, bytes_removed)
+        for _ in range(failed):
+            self.statistic.add_failure(pass_)
+
+    def test_order(self):
+        self.add_run(self.passes[0], 10, 100, 5)
+        self.add_run(self.passes[1], 1, 100, 5)
+        self.assertEqual(self.reducer._schedule_passes(self.passes), [self.passes[2], self.passes[1], self.passes[0]])
+
+    def test_cpu_time(self):
+        # the wall-clock time of a pass does not matter
+        self.add_run(self.passes[0], 10, 100, 5, seconds=1)
+        self.add_run(self.passes[1], 1, 100, 5, seconds=10)
+        self.assertEqual(self.reducer._schedule_passes(self.passes), [self.passes[2], self.passes[1], self.passes[0]])
+
+    def test_success_ratio(self):
+        self.add_run(self.passes[0], 1, 0, 10)
+        self.add_run(self.passes[1], 1, 0, 1)
+        self.statistic.add_success(self.passes[1])
+        self.add_run(self.passes[2], 1, 100, 0)
+        self.assertEqual(self.reducer._schedule_passes(self.passes), [self.passes[2], self.passes[1], self.passes[0]])
+
+    def test_fruitless(self):
+        name = repr(self.passes[0])
+        self.reducer.fruitless_runs[name] = CVise.FRUITLESS_RUNS
+        for _ in range(CVise.MAX_SKIPPED_ITERATIONS):
+            self.assertNotIn(self.passes[0], self.reducer._schedule_passes(self.passes))
+        self.assertIn(self.passes[0], self.reducer._schedule_passes(self.passes))
+
+
+class LacksInstancesTestCase(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.clang_delta = FakeClangDelta(folder.name, QUERY_ALL)
+
+        self.reducer = CVise(FakeTestManager())
+        test_case = os.path.join(folder.name, 'test.c')
+        with open(test_case, 'w') as out_file:
+            out_file.write('int a;')
+        self.reducer.test_manager.test_cases.add(test_case)
+
+    def create_pass(self, pass_class, arg):
+        pass_ = pass_class(arg, {'clang_delta': self.clang_delta.path})
+        pass_.clang_delta_std = None
+        return pass_
+
+    def get_queries(self):
+        return len(self.clang_delta.get_invocations())
+
+    def test_lacks_instances(self):
+        instance_counts = {}
+        self.assertTrue(self.reducer._lacks_instances(self.create_pass(ClangPass, 'remove-unused-function'),
+                                                      instance_counts))
+        self.assertFalse(self.reducer._lacks_instances(self.create_pass(ClangPass, 'rename-fun'), instance_counts))
+        self.assertFalse(self.reducer._lacks_instances(self.create_pass(ClangPass, 'remove-namespace'),
+                                                       instance_counts))
+        self.assertFalse(self.reducer._lacks_instances(LinesPass('0'), instance_counts))
+        self.assertEqual(self.get_queries(), 1)
+
+    def test_undetected_standard(self):
+        # every standard is queried before the pass has detected one
+        pass_ = self.create_pass(ClangBinarySearchPass, 'remove-unused-function')
+        self.assertTrue(self.reducer._lacks_instances(pass_, {}))
+        self.assertEqual(self.get_queries(), len(ClangBinarySearchPass.STANDARDS))
+
+
+class PassGroupTestCase(unittest.TestCase):
+    def parse(self, pass_dict):
+        pass_group_dict = {'first': [], 'main': [pass_dict], 'last': []}
+        return CVise.parse_pass_group_dict(pass_group_dict, set(), {}, None, None, False, True)
+
+    def test_chunked(self):
+        pass_group = self.parse({'pass': 'balanced', 'arg': 'curly', 'chunked': True})
+        self.assertTrue(pass_group['main'][0].chunked)
+
+    def test_not_chunked(self):
+        pass_group = self.parse({'pass': 'balanced', 'arg': 'curly'})
+        self.assertFalse(pass_group['main'][0].chunked)
+
+    def test_chunked_unsupported(self):
+        with self.assertRaises(CViseError):
+            self.parse({'pass': 'ints', 'arg': 'a', 'chunked': True})
+
+    def test_strategy(self):
+        pass_group = self.parse({'pass': 'lines', 'arg': '0', 'strategy': 'ddmin'})
+        self.assertEqual(pass_group['main'][0].strategy, 'ddmin')
+
+    def test_strategy_unsupported(self):
+        with self.assertRaises(CViseError):
+            self.parse({'pass': 'ints', 'arg': 'a', 'strategy': 'grow'})
+        with self.assertRaises(CViseError):
+            self.parse({'pass': 'clang', 'arg': 'remove-unused-function', 'strategy': 'ddmin'})
@@ -24,6 +24,23 @@ class IntsATestCase(unittest.TestCase):
 
         self.assertEqual(variant, 'Compute 123L + 0x56 + 0789!\n')
 
+    def test_transform_data(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('Compute 123L + 0x456 + 0789!\n')
+
+        state = self.pass_.new(tmp_file.name)
+        (result, state, patch) = self.pass_.transform_data('Compute 123L + 0x456 + 0789!\n', state)
+
+        with open(tmp_file.name) as test_case_file:
+            test_case = test_case_file.read()
+
+        os.unlink(tmp_file.name)
+
+        self.assertEqual(result, PassResult.OK)
+        self.assertEqual(list(patch), [(14, 21, ' 0x56 ')])
+        self.assertEqual(patch.apply(test_case), 'Compute 123L + 0x56 + 0789!\n')
+        self.assertEqual(test_case, 'Compute 123L + 0x456 + 0789!\n')
+
     def test_success_a(self):
         with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
             tmp_file.write('Compute 123L + 0x456 + 0789!\n')
@@ -36,3 +36,47 @@ class LineMarkersTestCase(unittest.TestCase):
 
         os.unlink(tmp_file.name)
         self.assertEqual(variant, 'int x = 2;')
+
+    def test_blank_lines(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write("int x;\n\n  # 1 'foo.h'\n#\n2\n")
+
+        state = self.pass_.new(tmp_file.name)
+        self.assertEqual(state.instances, 1)
+        (_, state) = self.pass_.transform(tmp_file.name, state, None)
+
+        with open(tmp_file.name) as variant_file:
+            variant = variant_file.read()
+
+        os.unlink(tmp_file.name)
+        self.assertEqual(variant, 'int x;\n\n#\n2\n')
+
+    def test_success(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write("# 1 'foo.h'\nint x;\n# 2 'bar.h'\n# 3 'x.h'\n")
+
+        state = self.pass_.new(tmp_file.name)
+        state = self.pass_.advance(tmp_file.name, state)
+        (_, state) = self.pass_.transform(tmp_file.name, state, None)
+        state = self.pass_.advance_on_success(tmp_file.name, state)
+        self.assertEqual((state.index, state.chunk, state.instances), (0, 1, 2))
+
+        # a variant that is not the one of the state is counted again
+        with open(tmp_file.name, 'w') as variant_file:
+            variant_file.write('int x;\n')
+        state = self.pass_.advance_on_success(tmp_file.name, state)
+
+        os.unlink(tmp_file.name)
+        self.assertIsNone(state)
+
+    def test_edits(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write("# 1 'foo.h'\nint x;\n# 2 'bar.h'\n# 3 'x.h'\n")
+
+        state = self.pass_.new(tmp_file.name)
+        state = self.pass_.advance(tmp_file.name, state)
+        state = self.pass_.advance(tmp_file.name, state)
+        edits = self.pass_.get_edits(tmp_file.name, state)
+
+        os.unlink(tmp_file.name)
+        self.assertEqual(edits, [(19, 31, '')])
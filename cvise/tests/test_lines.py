@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+
+from cvise.passes.abstract import PassResult
+from cvise.passes.lines import LinesPass
+
+
+class LinesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pass_ = LinesPass('None')
+
+    def test_all(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('int a;\nint b;\nint c;')
+
+        state = self.pass_.new(tmp_file.name)
+        self.assertEqual(state.instances, 3)
+        (result, state) = self.pass_.transform(tmp_file.name, state, None)
+        self.assertEqual(result, PassResult.OK)
+
+        with open(tmp_file.name) as variant_file:
+            variant = variant_file.read()
+
+        os.unlink(tmp_file.name)
+        self.assertEqual(variant, '')
+
+    def test_success(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('int a;\nint b;\nint c;\n')
+
+        state = self.pass_.new(tmp_file.name)
+        state = self.pass_.advance(tmp_file.name, state)
+        self.assertEqual((state.index, state.chunk), (0, 1))
+        state = self.pass_.advance(tmp_file.name, state)
+        (_, state) = self.pass_.transform(tmp_file.name, state, None)
+        state = self.pass_.advance_on_success(tmp_file.name, state)
+        self.assertEqual((state.index, state.instances), (1, 2))
+        # the index of the lines follows the removal
+        self.assertEqual(list(self.pass_.line_offsets), [0, 7, 14])
+        (_, state) = self.pass_.transform(tmp_file.name, state, None)
+
+        with open(tmp_file.name) as variant_file:
+            variant = variant_file.read()
+
+        os.unlink(tmp_file.name)
+        self.assertEqual(variant, 'int a;\n')
+
+    def test_edits(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('int a;\nint b;\nint c;\n')
+
+        state = self.pass_.new(tmp_file.name)
+        state = self.pass_.advance(tmp_file.name, state)
+        state = self.pass_.advance(tmp_file.name, state)
+        self.assertEqual(self.pass_.get_edits(tmp_file.name, state), [(7, 14, '')])
+
+        # the edits of an older version are unknown
+        with open(tmp_file.name, 'w') as variant_file:
+            variant_file.write('int a;\n')
+        edits = self.pass_.get_edits(tmp_file.name, state)
+
+        os.unlink(tmp_file.name)
+        self.assertIsNone(edits)
+
+    def test_rebased(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('int a;\nint b;\nint c;\n')
+
+        first = self.pass_.advance(tmp_file.name, self.pass_.new(tmp_file.name))
+        last = self.pass_.advance(tmp_file.name, self.pass_.advance(tmp_file.name, first))
+        (_, first) = self.pass_.transform(tmp_file.name, first, None)
+        # the state still holds the byte range in the original test case
+        (_, state) = self.pass_.transform(tmp_file.name, last.rebase(first), None)
+
+        with open(tmp_file.name) as variant_file:
+            variant = variant_file.read()
+
+        os.unlink(tmp_file.name)
+        self.assertEqual(variant, 'int b;\n')
+
+    def test_complement(self):
+        self.pass_.strategy = 'ddmin'
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('int a;\nint b;\nint c;\nint d;\nint e;\n')
+
+        state = self.pass_.new(tmp_file.name)
+        state = self.pass_.advance(tmp_file.name, self.pass_.advance(tmp_file.name, state))
+        self.assertEqual(state.ranges(), [(0, 2), (4, 5)])
+        (_, state) = self.pass_.transform(tmp_file.name, state, None)
+        state = self.pass_.advance_on_success(tmp_file.name, state)
+        self.assertEqual((state.ranges(), state.instances), ([(0, 1)], 2))
+        self.assertEqual(list(self.pass_.line_offsets), [0, 7, 14])
+
+        with open(tmp_file.name) as variant_file:
+            variant = variant_file.read()
+
+        os.unlink(tmp_file.name)
+        self.assertEqual(variant, 'int c;\nint d;\n')
@@ -1,6 +1,7 @@
 import unittest
+from unittest import mock
 
-from cvise.utils.nestedmatcher import BalancedExpr, BalancedPattern, find, OrPattern, RegExPattern, search
+from cvise.utils.nestedmatcher import BalancedExpr, BalancedPattern, BracketIndex, find, OrPattern, RegExPattern, search
 
 
 class SimpleParensTest(unittest.TestCase):
@@ -86,3 +87,65 @@ class ComplexParensTest(unittest.TestCase):
                  (OrPattern(BalancedPattern(BalancedExpr.parens), RegExPattern('two')), 'nested2')]
         m = search(parts, '(This string this (contains)) two (nested) matches!')
         self.assertEqual(m, {'all': (13, 33), 'nested': (18, 28), 'nested2': (30, 33)})
+
+    def test_no_backtracking(self):
+        parts = [RegExPattern(r'a*'), RegExPattern(r'a')]
+        self.assertIsNone(search(parts, 'aaa'))
+
+    def test_regex_run(self):
+        parts = [(RegExPattern(r'x\s*'), 'x'), (OrPattern(RegExPattern(r'=+'), RegExPattern(r'[+-]=')), 'op'),
+                 (RegExPattern(r'\s*[0-9]+'), 'value')]
+        m = search(parts, 'y += 1; x == 2;')
+        self.assertEqual(m, {'all': (8, 14), 'x': (8, 10), 'op': (10, 12), 'value': (12, 14)})
+
+    def test_not_anchored(self):
+        parts = [RegExPattern(r'\s'), RegExPattern(r'b'), BalancedPattern(BalancedExpr.parens)]
+        self.assertEqual(search(parts, 'a   b()', pos=1, search=False), {'all': (3, 7)})
+        self.assertIsNone(search(parts, 'a x b()', pos=1, search=False))
+
+
+class BracketIndexTest(unittest.TestCase):
+    def test_match(self):
+        index = BracketIndex('f(a, (b)) { x[1]; }')
+        self.assertEqual(index.match(BalancedExpr.parens, 1), (1, 9))
+        self.assertEqual(index.match(BalancedExpr.parens, 5), (5, 8))
+        self.assertIsNone(index.match(BalancedExpr.parens, 2))
+        self.assertEqual(index.match(BalancedExpr.curlies, 10), (10, 19))
+        self.assertEqual(index.matches(BalancedExpr.squares), [(13, 16)])
+
+    def test_unmatched(self):
+        index = BracketIndex(') (a (b) c')
+        self.assertIsNone(index.match(BalancedExpr.parens, 2))
+        self.assertEqual(index.search(BalancedExpr.parens, 0), (5, 8))
+        self.assertIsNone(index.search(BalancedExpr.parens, 6))
+
+    def test_depth(self):
+        index = BracketIndex('{ { {} } {} }')
+        self.assertEqual(index.depth(BalancedExpr.curlies, 0), 0)
+        self.assertEqual(index.depth(BalancedExpr.curlies, 2), 1)
+        self.assertEqual(index.depth(BalancedExpr.curlies, 4), 2)
+        self.assertEqual(index.depth(BalancedExpr.curlies, 9), 1)
+
+    def test_edit(self):
+        string = '{ a(b) { (c) } [d] }'
+        index = BracketIndex(string)
+        for (start, end, replacement) in [(7, 14, ''), (7, 14, ';'), (3, 4, '(x)'), (2, 3, 'y'), (7, 8, '')]:
+            edited = index.edit(start, end, replacement)
+            expected = BracketIndex(string[:start] + replacement + string[end:])
+            self.assertEqual(edited.string, expected.string)
+            self.assertEqual(edited.pairs, expected.pairs)
+
+    def test_get_edit(self):
+        index = BracketIndex.get('a (b) (c)')
+        edited = BracketIndex.get('a  (c)', edit=(2, 5, ''))
+        self.assertIs(BracketIndex.get('a  (c)'), edited)
+        self.assertEqual(edited.matches(BalancedExpr.parens), [(3, 6)])
+        self.assertIsNot(edited, index)
+
+    def test_get_equal_string(self):
+        index = BracketIndex.get('a (b) (c)')
+        string = ''.join(['a (b)', ' (c)'])
+        self.assertIs(BracketIndex.get(string), index)
+        # an equal copy is then found without comparing the strings
+        with mock.patch.object(BracketIndex, 'cache', {}):
+            self.assertIs(BracketIndex.get(string), index)
@@ -0,0 +1,53 @@
+import unittest
+
+from cvise.utils.parallelism import ParallelismController
+
+
+class ParallelismControllerTestCase(unittest.TestCase):
+    def feed(self, controller, duration, cpu_load, available_memory=50):
+        while not controller.window_full:
+            controller.add_sample(duration)
+        controller.adjust(cpu_load, available_memory)
+
+    def test_window(self):
+        controller = ParallelismController(4)
+        controller.add_sample(1)
+        self.assertFalse(controller.window_full)
+
+    def test_low_memory(self):
+        controller = ParallelismController(4)
+        self.feed(controller, 1, 80, 5)
+        self.assertEqual(controller.limit, 2)
+        self.feed(controller, 1, 80, 5)
+        self.feed(controller, 1, 80, 5)
+        self.assertEqual(controller.limit, 1)
+
+    def test_ceiling(self):
+        controller = ParallelismController(4)
+        self.feed(controller, 1, 10)
+        self.assertEqual(controller.limit, 4)
+
+    def test_idle(self):
+        controller = ParallelismController(4)
+        self.feed(controller, 1, 80, 5)
+        self.feed(controller, 1, 10)
+        self.assertEqual(controller.limit, 3)
+
+    def test_saturated(self):
+        controller = ParallelismController(4)
+        # CPU bound test: the duration grows with the number of tests
+        self.feed(controller, 4, 100)
+        self.assertEqual(controller.limit, 3)
+        self.feed(controller, 3, 100)
+        self.assertEqual(controller.limit, 2)
+
+    def test_throughput_drop(self):
+        controller = ParallelismController(4)
+        self.feed(controller, 1, 100)
+        self.assertEqual(controller.limit, 3)
+        # fewer tests lowered throughput
+        self.feed(controller, 1, 100)
+        self.assertEqual(controller.limit, 4)
+        # more tests raised it, but the limit is at the ceiling
+        self.feed(controller, 1, 100)
+        self.assertEqual(controller.limit, 4)
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from cvise.utils.patch import Patch
+
+
+class PatchTestCase(unittest.TestCase):
+    def setUp(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('int a = (1 + 2);\n')
+        self.base = tmp_file.name
+        self.path = self.base + '.out'
+
+    def tearDown(self):
+        os.unlink(self.base)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def write(self, patch):
+        patch.write(self.base, self.path)
+        with open(self.path) as f:
+            return f.read()
+
+    def test_apply(self):
+        patch = Patch([(14, 15, ''), (8, 9, '')])
+        self.assertEqual(list(patch), [(8, 9, ''), (14, 15, '')])
+        self.assertEqual(patch.apply('int a = (1 + 2);\n'), 'int a = 1 + 2;\n')
+        self.assertEqual(patch.get_size_delta(), -2)
+
+    def test_write(self):
+        self.assertEqual(self.write(Patch([(8, 15, '3')])), 'int a = 3;\n')
+        self.assertEqual(self.write(Patch([(0, 0, 'static '), (17, 17, '\n')])), 'static int a = (1 + 2);\n\n')
+        self.assertEqual(self.write(Patch()), 'int a = (1 + 2);\n')
+
+    def test_write_many(self):
+        patch = Patch((i, i + 1, 'x') for i in range(0, 16, 2))
+        self.assertEqual(self.write(patch), patch.apply('int a = (1 + 2);\n'))
+
+    def test_write_empty(self):
+        open(self.base, 'w').close()
+        self.assertEqual(self.write(Patch([(0, 0, 'int a;\n')])), 'int a;\n')
+
+    def test_modifies(self):
+        self.assertTrue(Patch([(4, 5, 'b')]).modifies('int a = (1 + 2);\n'))
+        self.assertFalse(Patch([(4, 5, 'a'), (16, 16, '')]).modifies('int a = (1 + 2);\n'))
+
+    def test_overlap(self):
+        with self.assertRaises(AssertionError):
+            Patch([(0, 4, ''), (2, 6, '')])
@@ -1,6 +1,8 @@
 import os
+import pickle
 import tempfile
 import unittest
+from unittest import mock
 
 from cvise.passes.peep import PeepPass
 from cvise.tests.testabstract import iterate_pass
@@ -91,6 +93,66 @@ class PeepATestCase(unittest.TestCase):
 
         self.assertEqual(variant, ' foo \n')
 
+    def test_candidates_a(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('int a;  x += 1\n')
+
+        states = []
+        state = self.pass_.new(tmp_file.name)
+        while state is not None:
+            states.append((state['pos'], state['regex']))
+            state = self.pass_.advance(tmp_file.name, state)
+
+        os.unlink(tmp_file.name)
+
+        # ';' at 5, '+= 1' and '+=' at 10, '+' at 10 is the same edit as '+='
+        self.assertEqual(states, [(5, 6), (10, 9), (10, 16)])
+
+    def test_distinct_edits_a(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('a---b; c\n')
+
+        variants = []
+        state = self.pass_.new(tmp_file.name)
+        while state is not None:
+            (_, _, patch) = self.pass_.transform_data('a---b; c\n', state)
+            variants.append(patch.apply('a---b; c\n'))
+            state = self.pass_.advance(tmp_file.name, state)
+
+        os.unlink(tmp_file.name)
+
+        # removing any of the '-' gives the same variant
+        self.assertEqual(variants, ['a--b; c\n', 'a---b c\n'])
+
+    def test_stream_reused(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('int a;  x += 1\n')
+
+        state = self.pass_.new(tmp_file.name)
+        with mock.patch('builtins.open', side_effect=AssertionError('test case read again')):
+            state = self.pass_.advance(tmp_file.name, state)
+        self.assertEqual((state['pos'], state['regex']), (10, 9))
+
+        # a test case of a different size is read again
+        with open(tmp_file.name, 'w') as f:
+            f.write('int a;   x += 1\n')
+        state = self.pass_.advance(tmp_file.name, state)
+
+        os.unlink(tmp_file.name)
+
+        self.assertEqual((state['pos'], state['regex']), (11, 9))
+
+    def test_pickle(self):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as tmp_file:
+            tmp_file.write('int a;\n')
+
+        self.pass_.new(tmp_file.name)
+        pass_ = pickle.loads(pickle.dumps(self.pass_))
+
+        os.unlink(tmp_file.name)
+
+        self.assertIsNone(pass_.stream)
+
 
 class PeepBTestCase(unittest.TestCase):
     def setUp(self):
@@ -0,0 +1,42 @@
+import unittest
+
+from cvise.passes.lines import LinesPass
+from cvise.utils.statistics import PassStatistic
+
+
+class PassStatisticTestCase(unittest.TestCase):
+    def setUp(self):
+        self.statistic = PassStatistic()
+        self.pass_ = LinesPass('0')
+        self.statistic.start(self.pass_)
+        self.statistic.stop(self.pass_)
+
+    def test_efficiency(self):
+        pass_data = self.statistic.stats['LinesPass::0']
+        pass_data.total_seconds = 2
+        self.statistic.add_success(self.pass_, 100, 3)
+        self.statistic.add_failure(self.pass_)
+        self.statistic.add_failure(self.pass_)
+        self.statistic.add_failure(self.pass_)
+        self.assertEqual(pass_data.bytes_per_second, 50)
+        self.statistic.add_test_time(self.pass_, 1, 8, 3)
+        self.statistic.add_probe_times(self.pass_, {'c++11': 1})
+        self.assertEqual(pass_data.cpu_seconds, 5)
+        self.assertEqual(pass_data.bytes_per_cpu_second, 20)
+        self.assertEqual(pass_data.success_ratio, 0.25)
+        self.assertEqual(pass_data.lines_removed, 3)
+
+    def test_json(self):
+        self.statistic.add_timeout(self.pass_)
+        self.statistic.add_test_time(self.pass_, 1, 2, 3)
+        (pass_data, ) = self.statistic.as_json()
+        self.assertEqual(pass_data['pass_name'], 'LinesPass::0')
+        self.assertEqual(pass_data['timeouts'], 1)
+        self.assertEqual((pass_data['transform_seconds'], pass_data['test_seconds'], pass_data['test_cpu_seconds']), (1, 2, 3))
+        self.assertEqual(pass_data['success_ratio'], 0)
+
+    def test_probe_times(self):
+        self.statistic.add_probe_times(self.pass_, {'c++11': 1, 'c++14': 2})
+        self.statistic.add_probe_times(self.pass_, {'c++11': 3})
+        (pass_data, ) = self.statistic.as_json()
+        self.assertEqual(pass_data['probe_seconds'], {'c++11': 4, 'c++14': 2})
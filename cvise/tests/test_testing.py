@@ -0,0 +1,568 @@
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from cvise.passes.abstract import AbstractPass, BinaryState, PassResult, ProcessEventNotifier
+from cvise.tests.testabstract import LockedTable
+from cvise.utils import testing
+from cvise.utils.error import InvalidFileError, PassBugError
+from cvise.utils.patch import Patch
+from cvise.utils.statistics import PassStatistic
+import psutil
+
+
+class MergeEditsTestCase(unittest.TestCase):
+    base = 'a\nb\nc\nd\ne\n'
+
+    def merge(self, variants):
+        (merged, patch) = testing.TestManager.merge_edits(variants)
+        return (merged, patch.apply(self.base))
+
+    def test_independent(self):
+        self.assertEqual(self.merge([[(2, 4, '')], [(6, 8, '')]]), (2, 'a\nc\ne\n'))
+
+    def test_adjacent(self):
+        self.assertEqual(self.merge([[(2, 4, '')], [(4, 6, '')]]), (2, 'a\nd\ne\n'))
+
+    def test_conflict(self):
+        self.assertEqual(self.merge([[(2, 6, '')], [(4, 6, '')], [(8, 10, '')]]), (2, 'a\nd\n'))
+
+    def test_replace(self):
+        self.assertEqual(self.merge([[(2, 3, 'B')], [(6, 7, 'D')]]), (2, 'a\nB\nc\nD\ne\n'))
+
+    def test_insertion(self):
+        self.assertEqual(self.merge([[(4, 4, 'x\n')], [(2, 4, '')]]), (1, 'a\nb\nx\nc\nd\ne\n'))
+
+
+class LinkFileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.sandbox = tempfile.mkdtemp()
+        self.src = os.path.join(self.folder, 'a.h')
+        with open(self.src, 'w') as f:
+            f.write('int a;\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        shutil.rmtree(self.sandbox)
+
+    def test_link(self):
+        testing.link_file(self.src, self.sandbox)
+        self.assertTrue(os.path.samefile(self.src, os.path.join(self.sandbox, 'a.h')))
+
+    def test_stale_copy(self):
+        dst = os.path.join(self.sandbox, 'a.h')
+        with open(dst, 'w') as f:
+            f.write('int b;\n')
+        testing.link_file(self.src, self.sandbox)
+        with open(dst) as f:
+            self.assertEqual(f.read(), 'int a;\n')
+        with open(self.src) as f:
+            self.assertEqual(f.read(), 'int a;\n')
+
+
+class TestEnvironmentTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.sandbox = tempfile.mkdtemp()
+        self.test_case = os.path.join(self.folder, 'test.c')
+        with open(self.test_case, 'w') as f:
+            f.write('int a;\n')
+        self.script = os.path.join(self.folder, 'test.sh')
+        with open(self.script, 'w') as f:
+            f.write('#!/bin/sh\ngrep -q b test.c\n')
+        os.chmod(self.script, 0o755)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        shutil.rmtree(self.sandbox)
+
+    def test_data(self):
+        test_env = testing.TestEnvironment(None, 1, self.script, self.sandbox, self.test_case, set(), None,
+                                           data='int b;\n')
+        test_env.run()
+        self.assertTrue(test_env.success)
+        self.assertIsNone(test_env.data)
+        with open(test_env.test_case_path) as f:
+            self.assertEqual(f.read(), 'int b;\n')
+        with open(self.test_case) as f:
+            self.assertEqual(f.read(), 'int a;\n')
+
+    def test_patch(self):
+        test_env = testing.TestEnvironment(None, 1, self.script, self.sandbox, self.test_case, set(), None,
+                                           patch=Patch([(4, 5, 'bc')]), base=self.test_case)
+        test_env.run()
+        self.assertTrue(test_env.success)
+        self.assertIsNone(test_env.patch)
+        with open(test_env.test_case_path) as f:
+            self.assertEqual(f.read(), 'int bc;\n')
+        with open(self.test_case) as f:
+            self.assertEqual(f.read(), 'int a;\n')
+
+    def test_dropped(self):
+        # the test manager gave the slot to another variant
+        pid_table = multiprocessing.Array('q', [ProcessEventNotifier.pack(4, 0)])
+        test_env = testing.TestEnvironment(None, 1, self.script, self.sandbox, self.test_case, set(), None,
+                                           pid_slot=(0, 3), data='int b;\n')
+        with mock.patch.object(testing, 'pid_table', pid_table):
+            test_env.run()
+        self.assertFalse(test_env.success)
+        self.assertFalse(os.path.exists(test_env.test_case_path))
+
+
+class FakeFsTestManager(testing.TestManager):
+    # the file system types of the paths, the others are on disk
+    fs_types = {}
+
+    def get_fs_type(self, path):
+        return self.fs_types.get(path, 'ext4')
+
+
+class WorkRootTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.test_case = os.path.join(self.folder, 'test.c')
+        with open(self.test_case, 'w') as f:
+            f.write('int a;\n')
+        self.script = os.path.join(self.folder, 'test.sh')
+        with open(self.script, 'w') as f:
+            f.write('#!/bin/sh\ntrue\n')
+        os.chmod(self.script, 0o755)
+        self.ram = os.path.join(self.folder, 'ram')
+        os.mkdir(self.ram)
+
+    def create_manager(self, work_root=None):
+        manager = FakeFsTestManager(PassStatistic(), self.script, 100, False, [self.test_case], 1, True, True, True,
+                                    False, False, None, False, None, None, None, 1024, False, work_root, False)
+        self.addCleanup(manager.cleanup)
+        manager.RAM_WORK_ROOTS = (self.ram, )
+        manager.fs_types = {self.ram: 'tmpfs'}
+        return manager
+
+    def test_explicit(self):
+        manager = self.create_manager(os.path.relpath(self.folder))
+        self.assertEqual((manager.work_root, manager.work_root_type), (self.folder, 'disk'))
+        self.assertEqual(manager.select_work_root(self.ram), (self.ram, 'RAM'))
+        with self.assertRaises(InvalidFileError):
+            manager.select_work_root(os.path.join(self.folder, 'missing'))
+
+    def test_ram(self):
+        manager = self.create_manager()
+        self.assertEqual(manager.select_work_root(None), (self.ram, 'RAM'))
+
+    def test_budget(self):
+        # the RAM file system cannot hold a copy of the test cases for every variant
+        manager = self.create_manager()
+        manager.orig_total_file_size = shutil.disk_usage(self.ram).free
+        self.assertEqual(manager.select_work_root(None), (tempfile.gettempdir(), 'disk'))
+
+    def test_fs_type(self):
+        partition = collections.namedtuple('partition', ['mountpoint', 'fstype'])
+        partitions = [partition('/', 'ext4'), partition('/cvise-ram', 'tmpfs'), partition('/cvise-ram/disk', 'xfs')]
+        with mock.patch.object(testing.psutil, 'disk_partitions', return_value=partitions):
+            self.assertEqual(testing.TestManager.get_fs_type('/cvise-ram/a'), 'tmpfs')
+            self.assertEqual(testing.TestManager.get_fs_type('/cvise-ram/disk/a'), 'xfs')
+            self.assertEqual(testing.TestManager.get_fs_type('/cvise-ramdisk'), 'ext4')
+
+
+class FailingDataPass(AbstractPass):
+    # creates no variant in memory, with the result of its arg
+    in_memory = True
+
+    def new(self, test_case, _=None):
+        return 0
+
+    def advance(self, test_case, state):
+        return state + 1 if state < 100 else None
+
+    def transform_data(self, data, state):
+        return (self.arg, state, None)
+
+
+class RaisingDataPass(FailingDataPass):
+    # fails with an exception while creating the variant in memory
+    def transform_data(self, data, state):
+        raise ValueError('no variant')
+
+
+class RemoveLinePass(AbstractPass):
+    # removes the line of the state
+    in_memory = True
+
+    def new(self, test_case, _=None):
+        return 0
+
+    def advance(self, test_case, state):
+        return state + 1
+
+    def advance_on_success(self, test_case, state):
+        return state
+
+    def transform_data(self, data, state):
+        lines = data.splitlines(keepends=True)
+        if state >= len(lines):
+            return (PassResult.STOP, state, None)
+        start = sum(len(line) for line in lines[:state])
+        return (PassResult.OK, state, Patch([(start, start + len(lines[state]), '')]))
+
+
+class RemoveLinesPass(AbstractPass):
+    # removes the lines of a BinaryState
+    in_memory = True
+    mergeable = True
+
+    @staticmethod
+    def count_lines(test_case):
+        with open(test_case) as f:
+            return len(f.readlines())
+
+    def new(self, test_case, _=None):
+        return BinaryState.create(self.count_lines(test_case))
+
+    def advance(self, test_case, state):
+        return state.advance()
+
+    def advance_on_success(self, test_case, state):
+        return state.advance_on_success(self.count_lines(test_case))
+
+    def rebase(self, state, accepted_state):
+        return state.rebase(accepted_state)
+
+    def transform_data(self, data, state):
+        offsets = [0]
+        for line in data.splitlines(keepends=True):
+            offsets.append(offsets[-1] + len(line))
+        return (PassResult.OK, state, Patch((offsets[start], offsets[end], '') for (start, end) in state.ranges()))
+
+
+class HeldFuture(concurrent.futures.Future):
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+
+    def result(self, timeout=None):
+        if not self.done():
+            self.pool.release([self])
+        return super().result(timeout)
+
+
+class FakePool:
+    """Runs the tests in this process, a held variant only completes when
+    the test manager waits for it, oldest first."""
+
+    def __init__(self, hold):
+        self.hold = hold
+        self.held = []
+        # (variant, future) of every scheduled test
+        self.variants = []
+
+    def schedule(self, fn, timeout=None):
+        future = HeldFuture(self)
+        test_env = fn()
+        with open(test_env.test_case_path) as f:
+            variant = f.read()
+        self.variants.append((variant, future))
+        if self.hold(variant):
+            self.held.append((future, test_env))
+        else:
+            future.set_result(test_env)
+        return future
+
+    def release(self, futures):
+        for (i, (future, test_env)) in enumerate(self.held):
+            if future in futures:
+                del self.held[i]
+                future.set_result(test_env)
+                return
+
+    def wait(self, futures, return_when):
+        if not any(future.done() for future in futures):
+            self.release(futures)
+        return concurrent.futures.wait(futures, return_when=return_when)
+
+    def wait_all(self, futures, return_when):
+        while self.held:
+            self.release([future for (future, _) in self.held])
+        return concurrent.futures.wait(futures, return_when=return_when)
+
+    def stop(self):
+        pass
+
+    def join(self):
+        pass
+
+
+class ShrinkingController:
+    # lowers the limit after a number of finished tests
+    window_full = False
+
+    def __init__(self, limit, shrink_after, shrunk_limit):
+        self.limit = limit
+        self.shrink_after = shrink_after
+        self.shrunk_limit = shrunk_limit
+        self.samples = 0
+
+    def add_sample(self, duration):
+        self.samples += 1
+        if self.samples == self.shrink_after:
+            self.limit = self.shrunk_limit
+
+
+def is_running(pid):
+    try:
+        return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return False
+
+
+class TestManagerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        # the bug reports are created in the working directory
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.folder)
+        self.test_case = os.path.join(self.folder, 'test.c')
+        self.script = os.path.join(self.folder, 'test.sh')
+
+    def create_manager(self, data, test, parallel_tests=2, silent_pass_bug=False, die_on_pass_bug=False,
+                       speculative=False):
+        with open(self.test_case, 'w') as f:
+            f.write(data)
+        with open(self.script, 'w') as f:
+            f.write('#!/bin/sh\n{}\n'.format(test))
+        os.chmod(self.script, 0o755)
+        manager = testing.TestManager(PassStatistic(), self.script, 100, False, [self.test_case], parallel_tests, True,
+                                      True, silent_pass_bug, die_on_pass_bug, False, None, False, None, None, None,
+                                      1024 * 1024, speculative, None, False)
+        self.addCleanup(manager.cleanup)
+        return manager
+
+    def get_test_case(self):
+        with open(self.test_case) as f:
+            return f.read()
+
+    def get_statistic(self, manager, pass_):
+        return manager.pass_statistic.stats[repr(pass_)]
+
+    def test_data_error(self):
+        manager = self.create_manager('int a;\n', 'true')
+        pass_ = FailingDataPass(PassResult.ERROR)
+        manager.run_pass(pass_)
+        self.assertEqual(self.get_statistic(manager, pass_).totally_executed, 1)
+        self.assertTrue(os.path.exists(os.path.join('cvise_bug_0', 'test.c')))
+
+    def test_data_error_die(self):
+        manager = self.create_manager('int a;\n', 'true', die_on_pass_bug=True)
+        with self.assertRaises(PassBugError):
+            manager.run_pass(FailingDataPass(PassResult.ERROR))
+
+    def test_data_error_silent(self):
+        manager = self.create_manager('int a;\n', 'true', silent_pass_bug=True)
+        pass_ = FailingDataPass(PassResult.ERROR)
+        manager.run_pass(pass_)
+        self.assertEqual(self.get_statistic(manager, pass_).totally_executed, 101)
+        self.assertFalse(os.path.exists('cvise_bug_0'))
+
+    def test_data_give_up(self):
+        manager = self.create_manager('int a;\n', 'true')
+        manager.GIVEUP_CONSTANT = 5
+        pass_ = FailingDataPass(PassResult.INVALID)
+        manager.run_pass(pass_)
+        self.assertEqual(self.get_statistic(manager, pass_).totally_executed, 6)
+        self.assertTrue(os.path.exists('cvise_bug_0'))
+
+    def test_data_exception(self):
+        manager = self.create_manager('int a;\n', 'true')
+        pass_ = RaisingDataPass()
+        manager.run_pass(pass_)
+        self.assertEqual(self.get_statistic(manager, pass_).totally_executed, 1)
+        with open(os.path.join('cvise_bug_0', 'PASS_BUG_INFO.TXT')) as f:
+            self.assertIn('no variant', f.read())
+
+    def test_data_exception_silent(self):
+        manager = self.create_manager('int a;\n', 'true', silent_pass_bug=True)
+        pass_ = RaisingDataPass()
+        manager.run_pass(pass_)
+        self.assertEqual(self.get_statistic(manager, pass_).totally_executed, 101)
+        self.assertFalse(os.path.exists('cvise_bug_0'))
+
+    def test_undecodable_data(self):
+        manager = self.create_manager('', 'true')
+        with open(self.test_case, 'wb') as f:
+            f.write(b'int \xff;\n')
+        pass_ = FailingDataPass(PassResult.OK)
+        manager.run_pass(pass_)
+        self.assertEqual(self.get_statistic(manager, pass_).totally_executed, 1)
+        self.assertTrue(os.path.exists(os.path.join('cvise_bug_0', 'test.c')))
+
+    def start_process(self):
+        proc = subprocess.Popen(['sleep', '30'], start_new_session=True)
+        self.addCleanup(proc.wait)
+        self.addCleanup(proc.kill)
+        return proc
+
+    def test_kill_slot(self):
+        manager = self.create_manager('int a;\n', 'true')
+        (slot, token) = manager.acquire_slot()
+        proc = self.start_process()
+        ProcessEventNotifier(manager.pid_table, slot, token).register_pid(proc.pid)
+        manager.kill_slot(slot, token)
+        self.assertEqual(proc.wait(timeout=10), -signal.SIGTERM)
+        self.assertEqual(manager.pid_table[slot], 0)
+
+    def test_slots_locked(self):
+        manager = self.create_manager('int a;\n', 'true')
+        manager.pid_table = LockedTable([0] * len(manager.pid_table))
+        (slot, token) = manager.acquire_slot()
+        proc = self.start_process()
+        ProcessEventNotifier(manager.pid_table, slot, token).register_pid(proc.pid)
+        manager.kill_slot(slot, token)
+        self.assertEqual(proc.wait(timeout=10), -signal.SIGTERM)
+        self.assertEqual(list(manager.pid_table), [0] * len(manager.pid_table))
+
+    def test_kill_reused_slot(self):
+        manager = self.create_manager('int a;\n', 'true')
+        (slot, token) = manager.acquire_slot()
+        old = ProcessEventNotifier(manager.pid_table, slot, token)
+        manager.kill_slot(slot, token)
+        manager.free_slots.append(slot)
+        (new_slot, new_token) = manager.acquire_slot()
+        self.assertEqual(new_slot, slot)
+        self.assertNotEqual(new_token, token)
+
+        # the worker of the old variant cannot replace or clear the pid of the new one
+        proc = self.start_process()
+        ProcessEventNotifier(manager.pid_table, slot, new_token).register_pid(proc.pid)
+        old.register_pid(1)
+        old.unregister_pid()
+        self.assertEqual(ProcessEventNotifier.unpack(manager.pid_table[slot]), (new_token, proc.pid))
+
+        # and the pid of the old variant is not killed for the new one
+        manager.pid_table[slot] = ProcessEventNotifier.pack(token, proc.pid)
+        manager.kill_slot(slot, new_token)
+        self.assertTrue(is_running(proc.pid))
+        self.assertEqual(manager.pid_table[slot], 0)
+
+    def test_kill_cancelled_test(self):
+        pids = os.path.join(self.folder, 'pids')
+        # the success waits until the other variant runs a test that would take long
+        test = """echo $$ >> {0}
+if grep -q y test.c; then
+    while [ $(wc -l < {0}) -lt 2 ]; do sleep 0.01; done
+    exit 0
+fi
+grep -q x test.c && exec sleep 30
+exit 1""".format(pids)
+        manager = self.create_manager('x\ny\n', test)
+        start = time.monotonic()
+        manager.run_pass(RemoveLinePass())
+        self.assertLess(time.monotonic() - start, 20)
+        self.assertEqual(self.get_test_case(), 'y\n')
+
+        with open(pids) as f:
+            pids = [int(line) for line in f]
+        deadline = time.monotonic() + 10
+        while any(is_running(pid) for pid in pids) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(any(is_running(pid) for pid in pids))
+        self.assertEqual(list(manager.pid_table), [0] * len(manager.pid_table))
+
+    def run_speculative(self, data, test, parallel_tests):
+        # all tests but the one of the empty variant are held
+        manager = self.create_manager(data, test, parallel_tests=parallel_tests, speculative=True)
+        pool = FakePool(lambda variant: variant != '')
+        manager.create_pool = lambda: pool
+        accepted = []
+        carried = {}
+
+        def process_result(test_env):
+            accepted.append(self.get_variant(test_env))
+            process_result.wrapped(test_env)
+
+        def process_carried_future(future):
+            carried[self.get_variant(future.result())] = future.result().success
+            process_carried_future.wrapped(future)
+
+        process_result.wrapped = manager.process_result
+        process_carried_future.wrapped = manager.process_carried_future
+        with mock.patch.object(testing, 'wait', pool.wait), \
+                mock.patch.object(manager, 'process_result', process_result), \
+                mock.patch.object(manager, 'process_carried_future', process_carried_future):
+            manager.run_pass(RemoveLinesPass())
+        variants = [(variant.replace('\n', ''), future) for (variant, future) in pool.variants]
+        # the tasks of the shared pool are never cancelled
+        self.assertFalse(any(future.cancelled() for (_, future) in variants))
+        dropped = [variant for (variant, future) in variants if not future.done()]
+        return (accepted, carried, dropped, [variant for (variant, _) in variants])
+
+    @staticmethod
+    def get_variant(test_env):
+        with open(test_env.test_case_path) as f:
+            return f.read().replace('\n', '')
+
+    def test_speculative(self):
+        # the first round tests 7 variants at once and accepts 'def'
+        (accepted, carried, dropped, variants) = self.run_speculative('a\nb\nc\nd\ne\nf\n', 'grep -q f test.c', 7)
+        self.assertEqual(self.get_test_case(), 'f\n')
+
+        # the variants that overlap the removed lines are dropped
+        self.assertEqual(dropped[:3], ['bcdef', 'acdef', 'abdef'])
+        # the other ones keep running, and those that succeed on the old test
+        # case are tested again as 'ef' and 'df' on the new one
+        self.assertEqual(carried, {'abc': False, 'abcef': True, 'abcdf': True})
+        self.assertIn('ef', variants)
+        self.assertIn('df', variants)
+        self.assertEqual(accepted, ['def', 'ef', 'f'])
+
+    def run_merge(self, test):
+        # the 7 variants of the pass are tested in one batch, 'acd' and 'abd' succeed
+        manager = self.create_manager('a\nb\nc\nd\n', test, parallel_tests=7)
+        pool = FakePool(lambda variant: True)
+        manager.create_pool = lambda: pool
+        with mock.patch.object(testing, 'wait', pool.wait_all):
+            manager.run_pass(RemoveLinesPass())
+        return [variant.replace('\n', '') for (variant, _) in pool.variants]
+
+    def test_merge(self):
+        variants = self.run_merge('grep -q a test.c && grep -q d test.c')
+        # the combination of both successes is confirmed with one more test
+        self.assertEqual(variants[7], 'ad')
+        self.assertEqual(self.get_test_case(), 'a\nd\n')
+
+    def test_merge_rejected(self):
+        variants = self.run_merge('grep -q a test.c && grep -q d test.c && grep -q "[bc]" test.c')
+        self.assertEqual(variants[7], 'ad')
+        # the first success is kept and the pass goes on from it
+        self.assertEqual(variants[8:], ['ad', 'ac'])
+        self.assertEqual(self.get_test_case(), 'a\nc\nd\n')
+
+    def test_shrinking_limit(self):
+        manager = self.create_manager('a\nb\nc\nd\ne\nf\ng\nh\n', 'false', parallel_tests=4)
+        manager.parallelism_controller = ShrinkingController(4, 2, 2)
+        pool = FakePool(lambda variant: True)
+        manager.create_pool = lambda: pool
+        # (limit, tests in flight) when a test is scheduled
+        scheduled = []
+
+        def schedule(fn, timeout=None):
+            scheduled.append((manager.parallel_limit, len(manager.futures)))
+            return FakePool.schedule(pool, fn, timeout)
+
+        pool.schedule = schedule
+        with mock.patch.object(testing, 'wait', pool.wait):
+            manager.run_pass(RemoveLinesPass())
+
+        self.assertEqual(scheduled[:4], [(4, 0), (4, 1), (4, 2), (4, 3)])
+        self.assertIn((2, 1), scheduled)
+        # the tests in flight drain below the lowered limit before new ones start
+        self.assertTrue(all(in_flight < limit for (limit, in_flight) in scheduled))
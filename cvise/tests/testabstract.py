@@ -1,3 +1,8 @@
+import contextlib
+import os
+import stat
+import sys
+
 from cvise.passes.abstract import PassResult, ProcessEventNotifier
 
 
@@ -9,3 +14,62 @@ def iterate_pass(current_pass, path):
             state = current_pass.advance_on_success(path, state)
         else:
             state = current_pass.advance(path, state)
+
+
+class LockedTable(list):
+    """A pid table that checks that every access holds its lock."""
+
+    def __init__(self, entries):
+        super().__init__(entries)
+        self.locked = False
+
+    @contextlib.contextmanager
+    def get_lock(self):
+        self.locked = True
+        try:
+            yield
+        finally:
+            self.locked = False
+
+    def __getitem__(self, slot):
+        assert self.locked
+        return super().__getitem__(slot)
+
+    def __setitem__(self, slot, entry):
+        assert self.locked
+        super().__setitem__(slot, entry)
+
+
+class FakeClangDelta:
+    """A clang_delta executable that runs the given Python source.
+
+    The source can call log_invocation() to record its arguments, which
+    get_invocations() returns in order.
+    """
+
+    PREAMBLE = """
+import sys
+
+
+def log_invocation():
+    with open({log!r}, 'a') as log:
+        log.write(' '.join(sys.argv[1:]) + '\\n')
+
+"""
+
+    def __init__(self, folder, source, name='clang_delta'):
+        self.path = os.path.join(folder, name)
+        self.log = os.path.join(folder, name + '.log')
+        with open(self.path, 'w') as out_file:
+            out_file.write('#!{}\n'.format(sys.executable) + self.PREAMBLE.format(log=self.log) + source)
+        os.chmod(self.path, os.stat(self.path).st_mode | stat.S_IEXEC)
+
+    def get_invocations(self):
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as in_file:
+            return [line.rstrip('\n') for line in in_file]
+
+    def clear_invocations(self):
+        if os.path.exists(self.log):
+            os.unlink(self.log)
@@ -0,0 +1,150 @@
+import collections
+import hashlib
+import os
+import shutil
+import tempfile
+
+
+class TestResultCache:
+    TEMP_PREFIX = 'cvise-cache-'
+
+    def __init__(self, test_script, folder=None):
+        self.persistent = folder is not None
+        if self.persistent:
+            self.folder = os.path.abspath(folder)
+            os.makedirs(self.folder, exist_ok=True)
+        else:
+            self.folder = tempfile.mkdtemp(prefix=self.TEMP_PREFIX)
+
+        # the script content (not its path) is part of every key so that
+        # a persistent cache survives temporary --commands scripts
+        with open(test_script, 'rb') as script_file:
+            self.script_digest = hashlib.sha256(script_file.read()).hexdigest()
+
+    def get_key(self, files):
+        digest = hashlib.sha256(self.script_digest.encode())
+        for path in sorted(files, key=os.path.basename):
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest.update(os.path.basename(path).encode() + b'\0')
+            digest.update(str(len(data)).encode() + b'\0')
+            digest.update(data)
+        return digest.hexdigest()
+
+    def __get_entry_path(self, key):
+        return os.path.join(self.folder, key[:2], key)
+
+    def lookup(self, key):
+        try:
+            with open(self.__get_entry_path(key)) as entry:
+                return int(entry.read())
+        except (OSError, ValueError):
+            return None
+
+    def store(self, key, exitcode):
+        # negative codes mean the test was killed by a signal (e.g. because
+        # the variant was cancelled) and do not describe the variant
+        if exitcode is None or exitcode < 0:
+            return
+
+        path = self.__get_entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'w') as tmp_file:
+                tmp_file.write(str(exitcode))
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def remove(self):
+        if not self.persistent:
+            shutil.rmtree(self.folder, ignore_errors=True)
+
+
+class PassCache:
+    TEMP_PREFIX = 'cvise-pass-cache-'
+    # spilled entries may use this many times more space than the memory budget
+    DISK_FACTOR = 4
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.disk_size = 0
+        self.disk_entries = collections.OrderedDict()
+        self.folder = None
+
+    @staticmethod
+    def get_key(pass_key, data):
+        return hashlib.sha256(pass_key.encode() + b'\0' + data).hexdigest()
+
+    def lookup(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        if key in self.disk_entries:
+            try:
+                with open(self.__get_spill_path(key), 'rb') as spill_file:
+                    data = spill_file.read()
+            except OSError:
+                data = None
+            self.__remove_spilled(key)
+            if data is not None:
+                self.store(key, data)
+                return data
+
+        return None
+
+    def store(self, key, data):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+
+        self.entries[key] = data
+        self.size += len(data)
+
+        while self.size > self.max_size:
+            (evicted_key, evicted_data) = self.entries.popitem(last=False)
+            self.size -= len(evicted_data)
+            self.__spill(evicted_key, evicted_data)
+
+    def __get_spill_path(self, key):
+        return os.path.join(self.folder, key)
+
+    def __spill(self, key, data):
+        if len(data) > self.max_size * self.DISK_FACTOR:
+            return
+
+        if self.folder is None:
+            self.folder = tempfile.mkdtemp(prefix=self.TEMP_PREFIX)
+        elif key in self.disk_entries:
+            self.__remove_spilled(key)
+
+        try:
+            with open(self.__get_spill_path(key), 'wb') as spill_file:
+                spill_file.write(data)
+        except OSError:
+            return
+
+        self.disk_entries[key] = len(data)
+        self.disk_size += len(data)
+
+        while self.disk_size > self.max_size * self.DISK_FACTOR:
+            self.__remove_spilled(next(iter(self.disk_entries)))
+
+    def __remove_spilled(self, key):
+        self.disk_size -= self.disk_entries.pop(key)
+        try:
+            os.unlink(self.__get_spill_path(key))
+        except OSError:
+            pass
+
+    def remove(self):
+        if self.folder is not None:
+            shutil.rmtree(self.folder, ignore_errors=True)
+            self.folder = None
+        self.entries.clear()
+        self.disk_entries.clear()
+        self.size = 0
+        self.disk_size = 0
@@ -1,4 +1,7 @@
+import bisect
+import collections
 import enum
+import functools
 import re
 
 
@@ -10,6 +13,135 @@ class BalancedExpr(enum.Enum):
     squares = ('[', ']')
 
 
+class BracketIndex:
+    """Matching brackets of every BalancedExpr, found in a single scan."""
+
+    brackets = re.compile(r'[()<>\[\]{}]')
+    cache = collections.OrderedDict()
+    cache_size = 4
+    last = None
+    # the string object last asked for, it can be an equal copy of last.string
+    last_string = None
+
+    def __init__(self, string, pairs=None):
+        self.string = string
+        if pairs is None:
+            pairs = self.__scan(string)
+        # for each expr: sorted start positions and start -> (end, depth)
+        self.starts = {expr: [p[0] for p in pairs[expr]] for expr in BalancedExpr}
+        self.pairs = {expr: {p[0]: (p[1], p[2]) for p in pairs[expr]} for expr in BalancedExpr}
+
+    @classmethod
+    def __scan(cls, string):
+        kinds = {}
+        for expr in BalancedExpr:
+            kinds[expr.value[0]] = (expr, True)
+            kinds[expr.value[1]] = (expr, False)
+
+        stacks = {expr: [] for expr in BalancedExpr}
+        pairs = {expr: [] for expr in BalancedExpr}
+        for m in cls.brackets.finditer(string):
+            (expr, opening) = kinds[m.group()]
+            stack = stacks[expr]
+            if opening:
+                stack.append(m.start())
+            elif stack:
+                start = stack.pop()
+                pairs[expr].append((start, m.end(), len(stack)))
+
+        for expr in BalancedExpr:
+            pairs[expr].sort()
+        return pairs
+
+    @classmethod
+    def get(cls, string, edit=None):
+        """Return the index of string, derived from a cached one if edit=(start, end, replacement) produced string."""
+        # matchers ask for the same string object over and over
+        if cls.last is not None and cls.last_string is string:
+            return cls.last
+
+        index = cls.cache.get(string)
+        if index is None:
+            if edit is not None:
+                index = cls.__derive(string, *edit)
+            if index is None:
+                index = BracketIndex(string)
+            cls.cache[string] = index
+            while len(cls.cache) > cls.cache_size:
+                cls.cache.popitem(last=False)
+        else:
+            cls.cache.move_to_end(string)
+        cls.last = index
+        cls.last_string = string
+        return index
+
+    @classmethod
+    def __derive(cls, string, start, end, replacement):
+        for index in reversed(cls.cache.values()):
+            old = index.string
+            if (len(old) - (end - start) + len(replacement) == len(string) and old[:start] == string[:start]
+                    and string[start:start + len(replacement)] == replacement
+                    and old[end:] == string[start + len(replacement):]):
+                return index.edit(start, end, replacement)
+        return None
+
+    def edit(self, start, end, replacement):
+        """Return the index of the string with [start, end) replaced."""
+        string = self.string[:start] + replacement + self.string[end:]
+        if self.brackets.search(replacement):
+            return BracketIndex(string)
+
+        # pairs outside of the edited range stay as they are if the range is
+        # balanced on its own, otherwise the pairing can change anywhere
+        delta = len(replacement) - (end - start)
+        removed = len(self.brackets.findall(self.string, start, end))
+        pairs = {}
+        for expr in BalancedExpr:
+            pairs[expr] = []
+            for s in self.starts[expr]:
+                (e, depth) = self.pairs[expr][s]
+                if s >= start and e <= end:
+                    removed -= 2
+                elif e <= start:
+                    pairs[expr].append((s, e, depth))
+                elif s >= end:
+                    pairs[expr].append((s + delta, e + delta, depth))
+                elif s < start and e > end:
+                    pairs[expr].append((s, e + delta, depth))
+                else:
+                    return BracketIndex(string)
+
+        if removed:
+            return BracketIndex(string)
+        return BracketIndex(string, pairs)
+
+    def match(self, expr, pos):
+        pair = self.pairs[expr].get(pos)
+        if pair is None:
+            return None
+        return (pos, pair[0])
+
+    def search(self, expr, pos):
+        starts = self.starts[expr]
+        i = bisect.bisect_left(starts, pos)
+        if i == len(starts):
+            return None
+        return self.match(expr, starts[i])
+
+    def depth(self, expr, pos):
+        pair = self.pairs[expr].get(pos)
+        if pair is None:
+            return None
+        return pair[1]
+
+    def matches(self, expr):
+        return [self.match(expr, s) for s in self.starts[expr]]
+
+
+def get_bracket_index(string, edit=None):
+    return BracketIndex.get(string, edit=edit)
+
+
 class Pattern:
     pass
 
@@ -17,6 +149,7 @@ class Pattern:
 class RegExPattern(Pattern):
     def __init__(self, expr):
         self.expr = expr
+        self.regex = re.compile(expr, flags=re.DOTALL)
 
     def __repr__(self):
         return '(expr={})'.format(self.expr)
@@ -24,6 +157,7 @@ class RegExPattern(Pattern):
 
 class BalancedPattern(Pattern):
     def __init__(self, expr):
+        self.expr = expr
         self.start = expr.value[0]
         self.end = expr.value[1]
 
@@ -41,12 +175,10 @@ class OrPattern(Pattern):
 
 
 def __get_regex_match(pattern, string, pos=0, search=False):
-    regex = re.compile(pattern.expr, flags=re.DOTALL)
-
     if search:
-        m = regex.search(string, pos=pos)
+        m = pattern.regex.search(string, pos=pos)
     else:
-        m = regex.match(string, pos=pos)
+        m = pattern.regex.match(string, pos=pos)
 
     if m is not None:
         return (m.start(), m.end())
@@ -58,46 +190,12 @@ def __get_balanced_match(pattern, string, pos=0, search=False):
     if pos < 0 or pos >= len(string):
         return None
 
-    def __match_helper(pattern, string, pos):
-        start_pos = pos
-        depth = 1
-        pos += len(pattern.start)
-
-        while pos < len(string) and depth > 0:
-            if string[pos].startswith(pattern.start):
-                depth += 1
-                pos += len(pattern.start)
-            elif string[pos].startswith(pattern.end):
-                depth -= 1
-                pos += len(pattern.end)
-            else:
-                pos += 1
-
-        if depth != 0:
-            return None
-
-        return (start_pos, pos)
-
     if search:
-        while pos < len(string):
-            pos = string.find(pattern.start, pos)
-
-            if pos == -1:
-                return None
-
-            m = __match_helper(pattern, string, pos)
-
-            if m is not None:
-                return m
-
-            pos += 1
-
-        return None
+        return get_bracket_index(string).search(pattern.expr, pos)
+    elif string.startswith(pattern.start, pos):
+        return get_bracket_index(string).match(pattern.expr, pos)
     else:
-        if not string[pos].startswith(pattern.start):
-            return None
-
-        return __match_helper(pattern, string, pos)
+        return None
 
 
 def __get_leftmost_match(matches):
@@ -113,9 +211,21 @@ def __get_leftmost_match(matches):
         return leftmost
 
 
-def __match_pattern(pattern, string, pos=0, search=False):
+def __match_pattern(pattern, string, pos=0, search=False, memo=None):
+    # anchored results only depend on the pattern and the position
+    if memo is not None and not search:
+        key = (id(pattern), pos)
+        if key not in memo:
+            memo[key] = __match_pattern(pattern, string, pos=pos)
+        return memo[key]
+
     if isinstance(pattern, OrPattern):
         left_match = __match_pattern(pattern.left, string, pos=pos, search=search)
+
+        # nothing can start before pos and the left branch wins ties
+        if left_match is not None and left_match[0] == pos:
+            return left_match
+
         right_match = __match_pattern(pattern.right, string, pos=pos, search=search)
 
         return __get_leftmost_match([left_match, right_match])
@@ -136,7 +246,104 @@ def __unify_part(part):
     return part
 
 
-def find(expr, string, pos=0, prefix=''):
+def __is_plain(pattern):
+    if isinstance(pattern, RegExPattern):
+        return pattern.regex.groups == 0
+    elif isinstance(pattern, OrPattern):
+        return __is_plain(pattern.left) and __is_plain(pattern.right)
+    else:
+        return False
+
+
+def __get_regex_source(pattern):
+    if isinstance(pattern, RegExPattern):
+        return '(?:{})'.format(pattern.expr)
+    else:
+        return '(?:{}|{})'.format(__get_regex_source(pattern.left), __get_regex_source(pattern.right))
+
+
+def __get_lookahead_source(pattern):
+    # a condition that holds wherever the pattern can match
+    if isinstance(pattern, BalancedPattern):
+        return '(?={})'.format(re.escape(pattern.start))
+    elif __is_plain(pattern):
+        return '(?={})'.format(__get_regex_source(pattern))
+    elif isinstance(pattern, OrPattern):
+        left = __get_lookahead_source(pattern.left)
+        right = __get_lookahead_source(pattern.right)
+        if left and right:
+            return '(?:{}|{})'.format(left, right)
+    return ''
+
+
+def __get_run_source(run):
+    # a lookahead followed by a backreference matches like an atomic group,
+    # so the parts do not backtrack into each other, just like in search()
+    expr = ''
+    names = []
+    for (i, (pattern, name)) in enumerate(run):
+        expr += '(?=(?P<p{0}>{1}))(?P=p{0})'.format(i, __get_regex_source(pattern))
+        if name is not None:
+            names.append((name, 'p{}'.format(i)))
+
+    return (expr, names)
+
+
+def __compile_segment(run):
+    (expr, names) = __get_run_source(run)
+    return (None, None, re.compile(expr, flags=re.DOTALL), names)
+
+
+@functools.lru_cache(maxsize=256)
+def __compile_parts(parts):
+    """Return the first part, the parts with runs of regular expressions merged
+    into single regexes and a regex to find where a match can start."""
+    parts = [__unify_part(part) for part in parts]
+    segments = []
+    run = []
+    prefilter = None
+
+    for (pattern, name) in parts:
+        if __is_plain(pattern):
+            run.append((pattern, name))
+        else:
+            if run:
+                if not segments:
+                    expr = __get_run_source(run)[0] + __get_lookahead_source(pattern)
+                    prefilter = re.compile(expr, flags=re.DOTALL)
+                segments.append(__compile_segment(run))
+                run = []
+            segments.append((pattern, name, None, None))
+
+    if run:
+        segments.append(__compile_segment(run))
+        if len(segments) == 1:
+            prefilter = segments[0][2]
+
+    return (parts[0][0], tuple(segments), prefilter)
+
+
+def __match_segment(segment, string, pos=0, search=False, memo=None):
+    (pattern, name, regex, names) = segment
+
+    if regex is None:
+        match = __match_pattern(pattern, string, pos=pos, search=search, memo=memo)
+        if match is None or name is None:
+            return (match, [])
+        return (match, [(name, match)])
+
+    if search:
+        m = regex.search(string, pos=pos)
+    else:
+        m = regex.match(string, pos=pos)
+
+    if m is None:
+        return (None, [])
+    return ((m.start(), m.end()), [(name, m.span(group)) for (name, group) in names])
+
+
+@functools.lru_cache(maxsize=64)
+def __get_find_parts(expr, prefix):
     parts = []
 
     if prefix:
@@ -144,7 +351,11 @@ def find(expr, string, pos=0, prefix=''):
 
     parts.append(BalancedPattern(expr))
 
-    matches = search(parts, string, pos)
+    return parts
+
+
+def find(expr, string, pos=0, prefix=''):
+    matches = search(__get_find_parts(expr, prefix), string, pos)
 
     if matches:
         return matches['all']
@@ -156,13 +367,22 @@ def search(parts, string, pos=0, search=True):
     if not parts or pos < 0 or pos >= len(string):
         return None
 
+    (first, segments, prefilter) = __compile_parts(tuple(parts))
     start_pos = pos
     found_complete_match = False
+    # a failed attempt is retried from the next position and
+    # often evaluates the same parts at the same positions again
+    memo = {}
 
     while not found_complete_match and start_pos < len(string):
-        (pattern, _) = __unify_part(parts[0])
-
-        match = __match_pattern(pattern, string, pos=start_pos, search=search)
+        if prefilter is not None and search:
+            m = prefilter.search(string, pos=start_pos)
+            match = None if m is None else (m.start(), m.end())
+        elif search:
+            (match, _) = __match_segment(segments[0], string, pos=start_pos, search=True)
+        else:
+            # only the first part decides whether to try the next position
+            match = __match_pattern(first, string, pos=start_pos)
 
         if match is None:
             return None
@@ -173,19 +393,15 @@ def search(parts, string, pos=0, search=True):
         pos = start_pos
         found_complete_match = True
 
-        for part in parts:
-            (pattern, name) = __unify_part(part)
-
-            match = __match_pattern(pattern, string, pos=pos, search=False)
+        for segment in segments:
+            (match, named) = __match_segment(segment, string, pos=pos, memo=memo)
 
             if match is None:
                 start_pos += 1
                 found_complete_match = False
                 break
 
-            if name is not None:
-                matches[name] = match
-
+            matches.update(named)
             pos += match[1] - match[0]
 
     if found_complete_match:
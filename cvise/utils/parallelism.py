@@ -0,0 +1,63 @@
+import logging
+
+
+class ParallelismController:
+    # tests between two adjustments, relative to the current limit
+    WINDOW_FACTOR = 2
+    HIGH_CPU_LOAD = 90
+    LOW_CPU_LOAD = 70
+    MIN_AVAILABLE_MEMORY = 10
+    # relative throughput change that is not considered noise
+    TOLERANCE = 0.1
+
+    def __init__(self, ceiling):
+        self.ceiling = ceiling
+        self.limit = ceiling
+        self.durations = []
+        self.throughput = None
+        self.last_change = 0
+
+    def add_sample(self, duration):
+        self.durations.append(duration)
+
+    @property
+    def window_full(self):
+        return len(self.durations) >= self.WINDOW_FACTOR * self.limit
+
+    def adjust(self, cpu_load, available_memory):
+        mean = sum(self.durations) / len(self.durations)
+        self.durations = []
+        # tests finished per second with the current limit
+        throughput = self.limit / mean if mean else float('inf')
+
+        if available_memory < self.MIN_AVAILABLE_MEMORY:
+            limit = self.limit // 2
+            reason = 'low memory'
+        elif cpu_load < self.LOW_CPU_LOAD:
+            limit = self.limit + 1
+            reason = 'idle CPU'
+        elif cpu_load > self.HIGH_CPU_LOAD:
+            # the machine is saturated, look for the smallest limit
+            # that keeps the throughput
+            if self.last_change > 0 and throughput <= self.throughput * (1 + self.TOLERANCE):
+                limit = self.limit - 1
+                reason = 'more tests did not help'
+            elif self.last_change < 0 and throughput < self.throughput * (1 - self.TOLERANCE):
+                limit = self.limit + 1
+                reason = 'fewer tests lowered throughput'
+            elif self.last_change > 0:
+                limit = self.limit + 1
+                reason = 'more tests raised throughput'
+            else:
+                limit = self.limit - 1
+                reason = 'CPU saturated'
+        else:
+            limit = self.limit
+        limit = max(1, min(limit, self.ceiling))
+
+        self.last_change = limit - self.limit
+        self.throughput = throughput
+        if limit != self.limit:
+            logging.info('parallel tests: {} -> {} ({}, {:.0f}% CPU, {:.2f}s per test)'.format(
+                         self.limit, limit, reason, cpu_load, mean))
+            self.limit = limit
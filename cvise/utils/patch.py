@@ -0,0 +1,97 @@
+from array import array
+import mmap
+import os
+
+
+class Patch:
+    """Sorted, non-overlapping (start, end, replacement) edits of a base text."""
+
+    # os.writev accepts a limited number of buffers per call (IOV_MAX)
+    MAX_BUFFERS = 512
+
+    def __init__(self, edits=()):
+        self.starts = array('q')
+        self.ends = array('q')
+        self.replacements = []
+        for (start, end, replacement) in sorted(edits):
+            self.add(start, end, replacement)
+
+    def __repr__(self):
+        return 'Patch({})'.format(list(self))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends, self.replacements)
+
+    def add(self, start, end, replacement):
+        assert start <= end
+        assert not self.ends or self.ends[-1] <= start
+        self.starts.append(start)
+        self.ends.append(end)
+        self.replacements.append(replacement)
+
+    def modifies(self, data):
+        return any(data[start:end] != replacement for (start, end, replacement) in self)
+
+    def get_size_delta(self):
+        return sum(len(replacement) - (end - start) for (start, end, replacement) in self)
+
+    def apply(self, data):
+        parts = []
+        pos = 0
+        for (start, end, replacement) in self:
+            parts.append(data[pos:start])
+            parts.append(replacement)
+            pos = end
+        parts.append(data[pos:])
+        return data[:0].join(parts)
+
+    def write(self, base, path):
+        with open(path, 'wb') as out_file:
+            self.splice(base, out_file)
+
+    def splice(self, base, out_file):
+        """Write the patched content of file base to a binary file; the offsets must be byte offsets."""
+        with open(base, 'rb') as base_file:
+            if os.fstat(base_file.fileno()).st_size == 0:
+                # an empty file cannot be mapped
+                out_file.write(''.join(self.replacements).encode())
+                return
+
+            with mmap.mmap(base_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                out_file.flush()
+                self.__write_buffers(out_file.fileno(), self.__get_buffers(data))
+
+    def __get_buffers(self, data):
+        pos = 0
+        for (start, end, replacement) in self:
+            yield (data, pos, start)
+            yield (replacement.encode(), 0, None)
+            pos = end
+        yield (data, pos, None)
+
+    @classmethod
+    def __write_buffers(cls, fd, buffers):
+        pending = []
+        for (buffer, start, end) in buffers:
+            view = memoryview(buffer)[start:end]
+            if len(view):
+                pending.append(view)
+            if len(pending) == cls.MAX_BUFFERS:
+                cls.__flush(fd, pending)
+        cls.__flush(fd, pending)
+
+    @staticmethod
+    def __flush(fd, pending):
+        while pending:
+            if hasattr(os, 'writev'):
+                written = os.writev(fd, pending)
+            else:
+                written = os.write(fd, pending[0])
+            # a short write can stop in the middle of a buffer
+            while pending and written >= len(pending[0]):
+                written -= len(pending.pop(0))
+            if written:
+                pending[0] = pending[0][written:]
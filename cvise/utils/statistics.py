@@ -8,6 +8,42 @@ class SinglePassStatistic:
         self.worked = 0
         self.failed = 0
         self.totally_executed = 0
+        self.bytes_removed = 0
+        self.lines_removed = 0
+        self.timeouts = 0
+        self.transform_seconds = 0
+        self.test_seconds = 0
+        self.test_cpu_seconds = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # seconds spent in the probes of new (e.g. the C++ standard detection), by probe
+        self.probe_seconds = {}
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes_removed / self.total_seconds if self.total_seconds else 0
+
+    @property
+    def cpu_seconds(self):
+        # the transformations (and probes) run in a single thread each
+        return self.transform_seconds + self.test_cpu_seconds + sum(self.probe_seconds.values())
+
+    @property
+    def bytes_per_cpu_second(self):
+        return self.bytes_removed / self.cpu_seconds if self.cpu_seconds else 0
+
+    @property
+    def success_ratio(self):
+        executed = self.worked + self.failed
+        return self.worked / executed if executed else 0
+
+    def as_dict(self):
+        result = dict(vars(self))
+        result['bytes_per_second'] = self.bytes_per_second
+        result['cpu_seconds'] = self.cpu_seconds
+        result['bytes_per_cpu_second'] = self.bytes_per_cpu_second
+        result['success_ratio'] = self.success_ratio
+        return result
 
 
 class PassStatistic:
@@ -35,14 +71,39 @@ class PassStatistic:
         pass_name = repr(pass_)
         self.stats[pass_name].totally_executed += 1
 
-    def add_success(self, pass_):
+    def add_success(self, pass_, bytes_removed=0, lines_removed=0):
         pass_name = repr(pass_)
         self.stats[pass_name].worked += 1
+        self.stats[pass_name].bytes_removed += bytes_removed
+        self.stats[pass_name].lines_removed += lines_removed
+
+    def add_timeout(self, pass_):
+        pass_name = repr(pass_)
+        self.stats[pass_name].timeouts += 1
+
+    def add_test_time(self, pass_, transform_seconds, test_seconds, test_cpu_seconds):
+        pass_name = repr(pass_)
+        self.stats[pass_name].transform_seconds += transform_seconds
+        self.stats[pass_name].test_seconds += test_seconds
+        self.stats[pass_name].test_cpu_seconds += test_cpu_seconds
+
+    def add_probe_times(self, pass_, durations):
+        probe_seconds = self.stats[repr(pass_)].probe_seconds
+        for (probe, seconds) in durations.items():
+            probe_seconds[probe] = probe_seconds.get(probe, 0) + seconds
 
     def add_failure(self, pass_):
         pass_name = repr(pass_)
         self.stats[pass_name].failed += 1
 
+    def add_cache_hit(self, pass_):
+        pass_name = repr(pass_)
+        self.stats[pass_name].cache_hits += 1
+
+    def add_cache_miss(self, pass_):
+        pass_name = repr(pass_)
+        self.stats[pass_name].cache_misses += 1
+
     @property
     def sorted_results(self):
         def sort_statistics(item):
@@ -50,3 +111,6 @@ class PassStatistic:
             return (-pass_data.total_seconds, pass_name)
 
         return sorted(self.stats.items(), key=sort_statistics)
+
+    def as_json(self):
+        return [pass_data.as_dict() for _, pass_data in self.sorted_results]
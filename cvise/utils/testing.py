@@ -1,31 +1,86 @@
 from concurrent.futures import FIRST_COMPLETED, TimeoutError, wait
 import difflib
 import filecmp
+import itertools
 import logging
 import math
-from multiprocessing import Manager
+import multiprocessing
 import os
 import os.path
 import platform
 import shutil
+import signal
+import sys
 import tempfile
+import time
 import traceback
 
 from cvise.cvise import CVise
-from cvise.passes.abstract import PassResult, ProcessEventNotifier, ProcessEventType
+from cvise.passes.abstract import PassResult, ProcessEventNotifier
+from cvise.passes.clang_delta import close_idle_servers
+from cvise.utils.cache import PassCache, TestResultCache
 from cvise.utils.error import InsaneTestCaseError
+from cvise.utils.error import InvalidFileError
 from cvise.utils.error import InvalidInterestingnessTestError
 from cvise.utils.error import InvalidTestCaseError
 from cvise.utils.error import PassBugError
 from cvise.utils.error import ZeroSizeError
+from cvise.utils.parallelism import ParallelismController
+from cvise.utils.patch import Patch
 from cvise.utils.readkey import KeyLogger
 import pebble
 import psutil
 
+if sys.platform != 'win32':
+    import resource
+
 # change default Pebble sleep unit for faster response
 pebble.common.SLEEP_UNIT = 0.01
 
 
+# pids of the running processes of the variants (0 if none), indexed by
+# the slot of the variant; set in the pool workers by init_worker
+pid_table = None
+
+
+def init_worker(table):
+    global pid_table
+    pid_table = table
+
+
+def kill_process_group(pid):
+    if hasattr(os, 'killpg'):
+        try:
+            os.killpg(pid, signal.SIGTERM)
+        except OSError:
+            pass
+        return
+
+    try:
+        process = psutil.Process(pid)
+        children = process.children(recursive=True)
+        children.append(process)
+        for child in children:
+            try:
+                child.terminate()
+            except psutil.NoSuchProcess:
+                pass
+    except psutil.NoSuchProcess:
+        pass
+
+
+def get_children_cpu_time():
+    if sys.platform == 'win32':
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def keep_variant(test_case, state, process_event_notifier):
+    # the variant is written before the test is scheduled
+    return (PassResult.OK, state)
+
+
 def rmfolder(name):
     assert 'cvise' in name
     try:
@@ -34,9 +89,26 @@ def rmfolder(name):
         pass
 
 
+def link_file(src, folder):
+    dst = os.path.join(folder, os.path.basename(src))
+    if os.path.lexists(dst):
+        src_stat = os.stat(src)
+        dst_stat = os.lstat(dst)
+        # a hard link or an unchanged copy (when linking is not possible)
+        if (os.path.samestat(src_stat, dst_stat) or
+                (src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns)):
+            return
+        os.unlink(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
 class TestEnvironment:
     def __init__(self, state, order, test_script, folder, test_case,
-                 additional_files, transform, pid_queue=None):
+                 additional_files, transform, pid_slot=None, test_result_cache=None, data=None, patch=None,
+                 base=None, transform_duration=None):
         self.test_case = None
         self.additional_files = set()
         self.state = state
@@ -45,21 +117,38 @@ class TestEnvironment:
         self.test_script = test_script
         self.exitcode = None
         self.result = None
+        self.duration = None
+        # the time the test manager spent on an in-memory variant
+        self.transform_duration = transform_duration
+        self.cpu_time = None
         self.order = order
         self.transform = transform
-        self.pid_queue = pid_queue
+        # the variant when it was created in memory by the test manager,
+        # either in full or as a patch of the base file
+        self.data = data
+        self.patch = patch
+        self.base = base
+        # (slot, token) of the pid table entry of the variant
+        self.pid_slot = pid_slot
+        self.test_result_cache = test_result_cache
+        self.cached = False
         self.copy_files(test_case, additional_files)
         self.pwd = os.getcwd()
 
     def copy_files(self, test_case, additional_files):
         if test_case is not None:
             self.test_case = os.path.basename(test_case)
-            shutil.copy(test_case, self.folder)
+            # a reused folder can hold a hard link to the original file
+            if os.path.lexists(self.test_case_path):
+                os.unlink(self.test_case_path)
+            if self.data is None and self.patch is None:
+                shutil.copy(test_case, self.folder)
             self.base_size = os.path.getsize(test_case)
 
+        # the other files are not modified by the pass
         for f in additional_files:
             self.additional_files.add(os.path.basename(f))
-            shutil.copy(f, self.folder)
+            link_file(f, self.folder)
 
     @property
     def size_improvement(self):
@@ -76,6 +165,14 @@ class TestEnvironment:
     def additional_files_paths(self):
         return [os.path.join(self.folder, f) for f in self.additional_files]
 
+    @property
+    def process_event_notifier(self):
+        # the pid table is only available in the pool workers
+        if self.pid_slot is None:
+            return ProcessEventNotifier(None)
+        (slot, token) = self.pid_slot
+        return ProcessEventNotifier(pid_table, slot, token)
+
     @property
     def success(self):
         return self.result == PassResult.OK and self.exitcode == 0
@@ -91,15 +188,49 @@ class TestEnvironment:
 
     def run(self):
         try:
+            # the test manager does not need a variant that it gave up on
+            # before a worker picked it up
+            if not self.process_event_notifier.owns_slot():
+                return self
+
             # transform by state
-            (result, self.state) = self.transform(self.test_case_path, self.state,
-                                                  ProcessEventNotifier(self.pid_queue))
+            start = time.monotonic()
+            if self.data is not None or self.patch is not None:
+                if self.patch is not None:
+                    self.patch.write(self.base, self.test_case_path)
+                else:
+                    with open(self.test_case_path, 'w') as out_file:
+                        out_file.write(self.data)
+                # do not send the variant back
+                self.data = None
+                self.patch = None
+                result = PassResult.OK
+                self.transform_duration = (self.transform_duration or 0) + time.monotonic() - start
+            else:
+                (result, self.state) = self.transform(self.test_case_path, self.state,
+                                                      self.process_event_notifier)
+                self.transform_duration = time.monotonic() - start
             self.result = result
             if self.result != PassResult.OK:
                 return self
 
+            # reuse the exit code of an identical variant tested before
+            if self.test_result_cache is not None:
+                key = self.test_result_cache.get_key([self.test_case_path] + self.additional_files_paths)
+                self.exitcode = self.test_result_cache.lookup(key)
+                if self.exitcode is not None:
+                    self.cached = True
+                    return self
+
             # run test script
+            start = time.monotonic()
+            cpu_time = get_children_cpu_time()
             self.exitcode = self.run_test(False)
+            self.duration = time.monotonic() - start
+            self.cpu_time = get_children_cpu_time() - cpu_time
+
+            if self.test_result_cache is not None:
+                self.test_result_cache.store(key, self.exitcode)
             return self
         except OSError:
             # this can happen when we clean up temporary files for cancelled processes
@@ -112,7 +243,7 @@ class TestEnvironment:
     def run_test(self, verbose):
         try:
             os.chdir(self.folder)
-            stdout, stderr, returncode = ProcessEventNotifier(self.pid_queue).run_process(self.test_script, shell=True)
+            stdout, stderr, returncode = self.process_event_notifier.run_process(self.test_script, shell=True)
             if verbose and returncode != 0:
                 logging.debug('stdout:\n' + stdout)
                 logging.debug('stderr:\n' + stderr)
@@ -127,10 +258,13 @@ class TestManager:
     MAX_CRASH_DIRS = 10
     MAX_EXTRA_DIRS = 25000
     TEMP_PREFIX = 'cvise-'
+    RAM_FS_TYPES = ('tmpfs', 'ramfs')
+    RAM_WORK_ROOTS = ('/dev/shm',)
 
     def __init__(self, pass_statistic, test_script, timeout, save_temps, test_cases, parallel_tests,
                  no_cache, skip_key_off, silent_pass_bug, die_on_pass_bug, print_diff, max_improvement,
-                 no_give_up, also_interesting, start_with_pass):
+                 no_give_up, also_interesting, start_with_pass, test_cache_dir, pass_cache_size, speculative,
+                 work_root, adaptive):
         self.test_script = os.path.abspath(test_script)
         self.timeout = timeout
         self.save_temps = save_temps
@@ -147,6 +281,25 @@ class TestManager:
         self.no_give_up = no_give_up
         self.also_interesting = also_interesting
         self.start_with_pass = start_with_pass
+        self.speculative = speculative
+        self.current_data = None
+        self.current_base = None
+        self.bases = []
+        self.base_counter = itertools.count()
+        self.pool = None
+        if adaptive:
+            self.parallelism_controller = ParallelismController(self.parallel_tests)
+            # the first call only starts the measurement
+            psutil.cpu_percent()
+        else:
+            self.parallelism_controller = None
+        self.sandbox_root = None
+        self.free_folders = []
+        # one slot per in-flight variant (including a merged one), see ProcessEventNotifier
+        self.pid_table = multiprocessing.Array('q', self.parallel_tests + 1)
+        self.free_slots = list(range(len(self.pid_table)))
+        self.slot_tokens = itertools.count()
+        self.pid_slots = {}
 
         for test_case in test_cases:
             self.check_file_permissions(test_case, [os.F_OK, os.R_OK, os.W_OK], InvalidTestCaseError)
@@ -155,14 +308,70 @@ class TestManager:
             self.test_cases_modes[fullpath] = os.stat(fullpath).st_mode
 
         self.orig_total_file_size = self.total_file_size
-        self.cache = {}
+        (self.work_root, self.work_root_type) = self.select_work_root(work_root)
+        self.cache = PassCache(pass_cache_size)
         self.root = None
 
         if not self.is_valid_test(self.test_script):
             raise InvalidInterestingnessTestError(self.test_script)
 
+        if self.no_cache:
+            self.test_result_cache = None
+        else:
+            self.test_result_cache = TestResultCache(self.test_script, test_cache_dir)
+
+    def cleanup(self):
+        if self.pool is not None:
+            self.terminate_all(self.pool)
+            self.pool = None
+        for slot in range(len(self.pid_table)):
+            self.kill_slot(slot)
+        if self.sandbox_root is not None:
+            rmfolder(self.sandbox_root)
+            self.sandbox_root = None
+            self.free_folders = []
+        self.cache.remove()
+        if self.test_result_cache is not None:
+            self.test_result_cache.remove()
+        # the clang_delta servers started by the passes in this process
+        close_idle_servers()
+
+    @staticmethod
+    def get_fs_type(path):
+        path = os.path.realpath(path)
+        fs_type = None
+        mountpoint = ''
+        for partition in psutil.disk_partitions(all=True):
+            if (os.path.commonpath([path, partition.mountpoint]) == partition.mountpoint
+                    and len(partition.mountpoint) > len(mountpoint)):
+                mountpoint = partition.mountpoint
+                fs_type = partition.fstype
+        return fs_type
+
+    def get_work_root_type(self, path):
+        return 'RAM' if self.get_fs_type(path) in self.RAM_FS_TYPES else 'disk'
+
+    def select_work_root(self, work_root):
+        if work_root is not None:
+            self.check_file_permissions(work_root, [os.F_OK, os.W_OK, os.X_OK], InvalidFileError)
+            return (os.path.abspath(work_root), self.get_work_root_type(work_root))
+
+        # each variant folder may hold a full copy of the test cases
+        # when hard links to the originals are not possible
+        budget = self.orig_total_file_size * (self.parallel_tests + 2)
+        default = tempfile.gettempdir()
+        for path in (default, ) + self.RAM_WORK_ROOTS:
+            if (not os.path.isdir(path) or not self.check_file_permissions(path, [os.W_OK, os.X_OK], None)
+                    or self.get_work_root_type(path) != 'RAM'):
+                continue
+            available = min(shutil.disk_usage(path).free, psutil.virtual_memory().available)
+            if available >= budget:
+                return (path, 'RAM')
+            logging.debug('not using {}: {} bytes needed, {} available'.format(path, budget, available))
+        return (default, self.get_work_root_type(default))
+
     def create_root(self):
-        self.root = tempfile.mkdtemp(prefix=self.TEMP_PREFIX)
+        self.root = tempfile.mkdtemp(prefix=self.TEMP_PREFIX, dir=self.work_root)
         logging.debug('Creating pass root folder: %s' % self.root)
 
     def remove_root(self):
@@ -279,7 +488,7 @@ class TestManager:
     def check_sanity(self, verbose=False):
         logging.debug('perform sanity check... ')
 
-        folder = tempfile.mkdtemp(prefix=self.TEMP_PREFIX)
+        folder = tempfile.mkdtemp(prefix=self.TEMP_PREFIX, dir=self.work_root)
         test_env = TestEnvironment(None, 0, self.test_script, folder, None, self.test_cases, None)
         logging.debug('sanity check tmpdir = {}'.format(test_env.folder))
 
@@ -292,41 +501,115 @@ class TestManager:
                 rmfolder(folder)
             raise InsaneTestCaseError(self.test_cases, self.test_script)
 
-    def release_folder(self, future):
+    def acquire_folder(self):
+        if self.save_temps:
+            return tempfile.mkdtemp(prefix=self.TEMP_PREFIX, dir=self.root)
+
+        # folders are reused across variants and passes
+        if self.free_folders:
+            return self.free_folders.pop()
+        if self.sandbox_root is None:
+            self.sandbox_root = tempfile.mkdtemp(prefix=self.TEMP_PREFIX + 'sandbox-', dir=self.work_root)
+        return tempfile.mkdtemp(prefix=self.TEMP_PREFIX, dir=self.sandbox_root)
+
+    def recycle_folder(self, name):
+        # remove what the test left behind, the test case files
+        # are refreshed by the next variant
+        names = {os.path.basename(f) for f in self.test_cases}
+        try:
+            for entry in os.scandir(name):
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                elif entry.name not in names or entry.is_symlink():
+                    os.unlink(entry.path)
+        except OSError:
+            rmfolder(name)
+            return
+        self.free_folders.append(name)
+
+    @property
+    def parallel_limit(self):
+        if self.parallelism_controller is None:
+            return self.parallel_tests
+        return self.parallelism_controller.limit
+
+    def add_duration_sample(self, duration):
+        controller = self.parallelism_controller
+        if controller is not None:
+            controller.add_sample(duration)
+            if controller.window_full:
+                memory = psutil.virtual_memory()
+                controller.adjust(psutil.cpu_percent(), memory.available * 100 / memory.total)
+
+    def acquire_slot(self):
+        # every variant gets a new token for its slot
+        slot = self.free_slots.pop()
+        token = next(self.slot_tokens) % ProcessEventNotifier.MAX_TOKEN + 1
+        with ProcessEventNotifier.lock_table(self.pid_table):
+            self.pid_table[slot] = ProcessEventNotifier.pack(token, 0)
+        return (slot, token)
+
+    def kill_slot(self, slot, token=None):
+        # a pid tagged with another token was registered by the worker of an
+        # older variant after its slot was reused and is left alone; once the
+        # entry is cleared, no worker can register a pid in it
+        with ProcessEventNotifier.lock_table(self.pid_table):
+            (owner, pid) = ProcessEventNotifier.unpack(self.pid_table[slot])
+            self.pid_table[slot] = 0
+        if pid and (token is None or owner == token):
+            kill_process_group(pid)
+
+    def add_test_statistics(self, future):
+        if not future.done() or future.cancelled():
+            return
+        if future.exception() is not None:
+            if type(future.exception()) is TimeoutError:
+                self.pass_statistic.add_timeout(self.current_pass)
+            return
+
+        test_env = future.result()
+        if test_env.transform_duration is not None:
+            self.pass_statistic.add_test_time(self.current_pass, test_env.transform_duration,
+                                              test_env.duration or 0, test_env.cpu_time or 0)
+
+    def release_folder(self, future, reuse=False):
+        # every variant is released exactly once
+        self.add_test_statistics(future)
         name = self.temporary_folders.pop(future)
-        if not self.save_temps:
+        del self.future_states[future]
+        self.future_patches.pop(future, None)
+        (slot, token) = self.pid_slots.pop(future)
+        self.kill_slot(slot, token)
+        self.free_slots.append(slot)
+        if self.save_temps:
+            return
+
+        # a cancelled or timed out variant may still be using its folder
+        if reuse or (future.done() and not future.cancelled() and future.exception() is None):
+            self.recycle_folder(name)
+        else:
             rmfolder(name)
 
     def release_folders(self):
         for future in self.futures:
-            self.release_folder(future)
-        assert not self.temporary_folders
+            if future not in self.carried:
+                # without speculation, the pool is stopped and the test processes
+                # are killed at this point
+                self.release_folder(future, reuse=not self.speculative)
+        self.futures = [f for f in self.futures if f in self.carried]
+        assert len(self.temporary_folders) == len(self.futures)
+
+        # older snapshots are no longer read once no variant is in flight
+        if not self.futures:
+            for base in self.bases:
+                if base != self.current_base:
+                    os.unlink(base)
+            self.bases = [base for base in self.bases if base == self.current_base]
 
     @classmethod
     def log_key_event(cls, event):
         logging.info('****** %s  ******' % event)
 
-    def kill_pid_queue(self):
-        active_pids = set()
-        while not self.pid_queue.empty():
-            event = self.pid_queue.get()
-            if event.type == ProcessEventType.FINISHED:
-                active_pids.discard(event.pid)
-            else:
-                active_pids.add(event.pid)
-        for pid in active_pids:
-            try:
-                process = psutil.Process(pid)
-                children = process.children(recursive=True)
-                children.append(process)
-                for child in children:
-                    try:
-                        child.terminate()
-                    except psutil.NoSuchProcess:
-                        pass
-            except psutil.NoSuchProcess:
-                pass
-
     def release_future(self, future):
         self.futures.remove(future)
         self.release_folder(future)
@@ -344,12 +627,21 @@ class TestManager:
         for future in self.futures:
             # all items after first successfull (or STOP) should be cancelled
             if quit_loop:
-                future.cancel()
+                # carry_futures or merge_successes decide once the round is over
+                # and the folders are released after the pool is stopped
+                if not self.speculative:
+                    future.cancel()
+                new_futures.add(future)
                 continue
 
             if future.done():
+                if future in self.carried:
+                    self.process_carried_future(future)
+                    continue
+
                 if future.exception():
                     if type(future.exception()) is TimeoutError:
+                        self.add_duration_sample(self.timeout)
                         self.timeout_count += 1
                         logging.warning('Test timed out.')
                         self.save_extra_dir(self.temporary_folders[future])
@@ -361,6 +653,10 @@ class TestManager:
                         raise future.exception()
 
                 test_env = future.result()
+                if test_env.duration is not None:
+                    self.add_duration_sample(test_env.duration)
+                if test_env.cached:
+                    logging.debug('cached interestingness test result: {}'.format(test_env.exitcode))
                 if test_env.success:
                     if (self.max_improvement is not None and
                             test_env.size_improvement > self.max_improvement):
@@ -398,8 +694,57 @@ class TestManager:
 
         return quit_loop
 
+    def process_carried_future(self, future):
+        # the variant was created from an older version of the test case,
+        # its success only says that the rebased state is worth testing
+        state = self.carried.pop(future)
+        if future.exception() is None and future.result().success:
+            self.retest_states.append(state)
+        else:
+            self.pass_statistic.add_failure(self.current_pass)
+
+    def carry_futures(self, success_env):
+        if success_env is not None and self.state is not None:
+            self.rebased_state = self.current_pass.rebase(self.state, success_env.state)
+        else:
+            self.rebased_state = None
+
+        def rebase(state):
+            if self.rebased_state is None:
+                return None
+            return self.current_pass.rebase(state, success_env.state)
+
+        self.retest_states = [state for state in map(rebase, self.retest_states) if state is not None]
+        carried = {}
+        for future in self.futures:
+            if future.done() and future.exception() is None and future.result() is success_env:
+                continue
+
+            # a variant that is not carried is not cancelled either: pebble
+            # stops the worker of a cancelled task and loses the next task
+            # when the worker already took it; release_folders kills the test
+            state = rebase(self.future_states[future])
+            if state is None:
+                continue
+            if not future.done():
+                carried[future] = state
+                self.future_states[future] = state
+            elif future.exception() is None and future.result().success:
+                self.retest_states.append(state)
+        self.carried = carried
+
+        if carried:
+            logging.debug('{} variants continue speculatively'.format(len(carried)))
+
+    def cancel_carried_futures(self):
+        self.carried = {}
+        self.retest_states = []
+        self.release_folders()
+
     def wait_for_first_success(self):
         for future in self.futures:
+            if future in self.carried or future.cancelled():
+                continue
             try:
                 test_env = future.result()
                 if test_env.success:
@@ -408,45 +753,244 @@ class TestManager:
                 pass
         return None
 
+    @staticmethod
+    def edits_overlap(edit, other):
+        (i1, i2, _) = edit
+        (k1, k2, _) = other
+        # insertions conflict with anything that touches them
+        if i1 == i2 or k1 == k2:
+            return i1 <= k2 and k1 <= i2
+        return i1 < k2 and k1 < i2
+
+    @classmethod
+    def merge_edits(cls, variants):
+        edits = []
+        merged = 0
+        for variant_edits in variants:
+            if not any(cls.edits_overlap(e, o) for e in variant_edits for o in edits):
+                edits += variant_edits
+                merged += 1
+        return (merged, Patch(edits))
+
+    def get_variant_edits(self, future):
+        # the test manager keeps the patches of the in-memory variants, the
+        # other passes know the edits of their states
+        if self.current_pass.in_memory:
+            patch = self.future_patches.get(future)
+            return None if patch is None else list(patch)
+        return self.current_pass.get_edits(self.current_test_case, future.result().state)
+
+    def merge_successes(self, pool, success_env):
+        success_future = None
+        others = []
+        for future in self.futures:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                test_env = future.result()
+                if test_env is success_env:
+                    success_future = future
+                elif test_env.success and not filecmp.cmp(self.current_test_case, test_env.test_case_path):
+                    others.append(future)
+        if not others:
+            return success_env
+
+        # the confirming test should not wait for a worker
+        for future in self.futures:
+            if not future.done():
+                future.cancel()
+
+        # the passes know the edits of their variants, diffing the files
+        # would take seconds on large test cases
+        success_edits = self.get_variant_edits(success_future)
+        if success_edits is None:
+            return success_env
+        variants = [edits for edits in map(self.get_variant_edits, others) if edits is not None]
+        (merged, patch) = self.merge_edits([success_edits] + variants)
+        if merged == 1:
+            return success_env
+        if self.max_improvement is not None and -patch.get_size_delta() > self.max_improvement:
+            return success_env
+
+        # in-memory patches use character offsets, they are byte offsets of
+        # the snapshot of the current test case when it has one
+        (data, base) = (None, self.current_test_case)
+        if self.current_pass.in_memory:
+            base = self.get_current_base()
+            if base is None:
+                (data, patch) = (patch.apply(self.get_current_data()), None)
+
+        # confirm the combination with a single interestingness test
+        folder = self.acquire_folder()
+        slot = self.acquire_slot()
+        test_env = TestEnvironment(success_env.state, success_env.order, self.test_script, folder,
+                                   self.current_test_case, self.test_cases ^ {self.current_test_case},
+                                   keep_variant, slot, self.test_result_cache, data, patch, base)
+        future = pool.schedule(test_env.run, timeout=self.timeout)
+        self.temporary_folders[future] = folder
+        self.pid_slots[future] = slot
+        self.future_states[future] = success_env.state
+        self.futures.append(future)
+        self.pass_statistic.add_executed(self.current_pass)
+
+        try:
+            merged_env = future.result()
+        except TimeoutError:
+            return success_env
+        if not merged_env.success:
+            self.pass_statistic.add_failure(self.current_pass)
+            return success_env
+
+        logging.debug('merged {} successful variants'.format(merged))
+        return merged_env
+
     @classmethod
     def terminate_all(cls, pool):
         pool.stop()
         pool.join()
 
+    def create_pool(self):
+        return pebble.ProcessPool(max_workers=self.parallel_tests, initializer=init_worker,
+                                  initargs=(self.pid_table, ))
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = self.create_pool()
+        return self.pool
+
     def run_parallel_tests(self):
+        if self.speculative:
+            return self.schedule_tests(self.get_pool())
+
         assert not self.futures
         assert not self.temporary_folders
-        with pebble.ProcessPool(max_workers=self.parallel_tests) as pool:
-            order = 1
-            self.timeout_count = 0
-            while self.state is not None:
-                # do not create too many states
-                if len(self.futures) >= self.parallel_tests:
-                    wait(self.futures, return_when=FIRST_COMPLETED)
-
-                quit_loop = self.process_done_futures()
-                if quit_loop:
-                    success = self.wait_for_first_success()
-                    self.terminate_all(pool)
-                    return success
-
-                folder = tempfile.mkdtemp(prefix=self.TEMP_PREFIX, dir=self.root)
-                test_env = TestEnvironment(self.state, order, self.test_script, folder,
-                                           self.current_test_case, self.test_cases ^ {self.current_test_case},
-                                           self.current_pass.transform, self.pid_queue)
-                future = pool.schedule(test_env.run, timeout=self.timeout)
-                self.temporary_folders[future] = folder
-                self.futures.append(future)
-                self.pass_statistic.add_executed(self.current_pass)
-                order += 1
-                state = self.current_pass.advance(self.current_test_case, self.state)
+        pool = self.create_pool()
+        try:
+            success_env = self.schedule_tests(pool)
+            if success_env and self.current_pass.mergeable:
+                success_env = self.merge_successes(pool, success_env)
+            return success_env
+        finally:
+            self.terminate_all(pool)
+
+    def schedule_tests(self, pool):
+        order = 1
+        self.timeout_count = 0
+        while True:
+            quit_loop = self.process_done_futures()
+            if quit_loop:
+                return self.wait_for_first_success()
+
+            # do not create too many states, the limit can drop below
+            # the number of tests in flight
+            if len(self.futures) >= self.parallel_limit:
+                wait(self.futures, return_when=FIRST_COMPLETED)
+                continue
+
+            if self.retest_states:
+                state = self.retest_states.pop(0)
+            elif self.state is not None:
+                state = self.state
+                self.state = self.current_pass.advance(self.current_test_case, state)
+            elif self.carried:
+                # speculative variants can still bring new states
+                wait(self.futures, return_when=FIRST_COMPLETED)
+                continue
+            else:
                 # we are at the end of enumeration
-                if state is None:
-                    success = self.wait_for_first_success()
-                    self.terminate_all(pool)
-                    return success
-                else:
-                    self.state = state
+                return self.wait_for_first_success()
+
+            (data, patch, base, transform_duration) = (None, None, None, None)
+            variant_patch = None
+            if self.current_pass.in_memory:
+                start = time.monotonic()
+                problem = 'pass error'
+                try:
+                    (result, state, patch) = self.current_pass.transform_data(self.get_current_data(), state)
+                    variant_patch = patch
+                    if result == PassResult.OK and patch is not None:
+                        base = self.get_current_base()
+                        if base is None:
+                            (data, patch) = (patch.apply(self.get_current_data()), None)
+                except Exception as e:
+                    # a pass that fails in this process must not abort the
+                    # whole reduction, the same as a failure in a worker
+                    logging.debug(traceback.format_exc())
+                    (result, patch) = (PassResult.ERROR, None)
+                    problem = 'pass error: {}'.format(e)
+                transform_duration = time.monotonic() - start
+                if result == PassResult.STOP:
+                    self.state = None
+                    continue
+                elif result != PassResult.OK:
+                    # nothing to test
+                    self.pass_statistic.add_executed(self.current_pass)
+                    self.pass_statistic.add_failure(self.current_pass)
+                    if self.process_data_failure(result, state, order, problem):
+                        return self.wait_for_first_success()
+                    order += 1
+                    continue
+
+            folder = self.acquire_folder()
+            slot = self.acquire_slot()
+            test_env = TestEnvironment(state, order, self.test_script, folder,
+                                       self.current_test_case, self.test_cases ^ {self.current_test_case},
+                                       self.current_pass.transform, slot, self.test_result_cache, data, patch, base,
+                                       transform_duration)
+            future = pool.schedule(test_env.run, timeout=self.timeout)
+            self.temporary_folders[future] = folder
+            self.pid_slots[future] = slot
+            self.future_states[future] = state
+            if variant_patch is not None:
+                self.future_patches[future] = variant_patch
+            self.futures.append(future)
+            self.pass_statistic.add_executed(self.current_pass)
+            order += 1
+
+    def process_data_failure(self, result, state, order, problem='pass error'):
+        # the same checks as in process_done_futures for a variant that the
+        # pass failed to create in this process
+        quit_loop = False
+        if result == PassResult.ERROR:
+            if not self.silent_pass_bug:
+                self.report_data_pass_bug(state, order, problem)
+                quit_loop = True
+        if not self.no_give_up and order > self.GIVEUP_CONSTANT:
+            self.report_data_pass_bug(state, order, 'pass got stuck')
+            quit_loop = True
+        return quit_loop
+
+    def report_data_pass_bug(self, state, order, problem):
+        # the bug reproduces with the current test case and the state
+        folder = tempfile.mkdtemp(prefix=self.TEMP_PREFIX, dir=self.root)
+        test_env = TestEnvironment(state, order, self.test_script, folder, self.current_test_case,
+                                   self.test_cases ^ {self.current_test_case}, None)
+        self.report_pass_bug(test_env, problem)
+
+    def get_current_data(self):
+        # read the current test case once for all in-memory transformations
+        if self.current_data is None:
+            with open(self.current_test_case, 'r') as in_file:
+                self.current_data = in_file.read()
+        return self.current_data
+
+    def get_current_base(self):
+        # workers patch a snapshot of the current test case because the test
+        # case itself changes while speculative variants are still running;
+        # patch offsets are only byte offsets in ASCII data
+        if self.current_base is None:
+            try:
+                data = self.get_current_data().encode('ascii')
+            except UnicodeEncodeError:
+                self.current_base = False
+                return None
+            self.current_base = os.path.join(self.root, 'base-{}'.format(next(self.base_counter)))
+            with open(self.current_base, 'wb') as out_file:
+                out_file.write(data)
+            self.bases.append(self.current_base)
+        return self.current_base or None
+
+    def set_current_data(self, data):
+        self.current_data = data
+        self.current_base = None
 
     def run_pass(self, pass_):
         if self.start_with_pass:
@@ -456,10 +1000,16 @@ class TestManager:
                 return
 
         self.current_pass = pass_
+        pass_.parallel_tests = self.parallel_tests
         self.futures = []
         self.temporary_folders = {}
-        m = Manager()
-        self.pid_queue = m.Queue()
+        self.future_states = {}
+        self.future_patches = {}
+        self.carried = {}
+        self.retest_states = []
+        self.rebased_state = None
+        self.bases = []
+        self.base_counter = itertools.count()
         self.create_root()
         pass_key = repr(self.current_pass)
 
@@ -474,24 +1024,29 @@ class TestManager:
 
         for test_case in self.sorted_test_cases:
             self.current_test_case = test_case
+            self.set_current_data(None)
 
             if self.get_file_size([test_case]) == 0:
                 continue
 
             if not self.no_cache:
-                with open(test_case, mode='r+') as tmp_file:
-                    test_case_before_pass = tmp_file.read()
+                with open(test_case, mode='rb+') as tmp_file:
+                    cache_key = self.cache.get_key(pass_key, tmp_file.read())
+                    test_case_after_pass = self.cache.lookup(cache_key)
 
-                    if (pass_key in self.cache and
-                            test_case_before_pass in self.cache[pass_key]):
+                    if test_case_after_pass is not None:
                         tmp_file.seek(0)
                         tmp_file.truncate(0)
-                        tmp_file.write(self.cache[pass_key][test_case_before_pass])
+                        tmp_file.write(test_case_after_pass)
+                        self.pass_statistic.add_cache_hit(self.current_pass)
                         logging.info('cache hit for {}'.format(test_case))
                         continue
 
+                self.pass_statistic.add_cache_miss(self.current_pass)
+
             # create initial state
             self.state = self.current_pass.new(self.current_test_case, self.check_sanity)
+            self.pass_statistic.add_probe_times(self.current_pass, getattr(self.current_pass, 'probe_durations', {}))
             self.skip = False
 
             while self.state is not None and not self.skip:
@@ -506,22 +1061,23 @@ class TestManager:
                         self.print_diff = not self.print_diff
 
                 success_env = self.run_parallel_tests()
-                self.kill_pid_queue()
+                if self.speculative:
+                    self.carry_futures(success_env)
 
                 if success_env:
                     self.process_result(success_env)
                 self.release_folders()
-                self.futures.clear()
                 if not success_env:
                     break
 
+            # speculative variants are only valid for the current test case
+            if self.carried:
+                self.cancel_carried_futures()
+
             # Cache result of this pass
             if not self.no_cache:
-                with open(test_case, mode='r') as tmp_file:
-                    if pass_key not in self.cache:
-                        self.cache[pass_key] = {}
-
-                    self.cache[pass_key][test_case_before_pass] = tmp_file.read()
+                with open(test_case, mode='rb') as tmp_file:
+                    self.cache.store(cache_key, tmp_file.read())
 
         self.restore_mode()
         self.remove_root()
@@ -532,10 +1088,18 @@ class TestManager:
             diff_str = self.diff_files(self.current_test_case, test_env.test_case_path)
             logging.info(diff_str)
 
+        bytes_removed = os.path.getsize(self.current_test_case) - os.path.getsize(test_env.test_case_path)
+        lines_removed = self.get_line_count([self.current_test_case]) - self.get_line_count([test_env.test_case_path])
         shutil.copy(test_env.test_case_path, self.current_test_case)
+        self.set_current_data(None)
 
-        self.state = self.current_pass.advance_on_success(test_env.test_case_path, test_env.state)
-        self.pass_statistic.add_success(self.current_pass)
+        if self.rebased_state is not None:
+            # continue the enumeration where it was, this skips
+            # advance_on_success so a GrowingBinaryState keeps its chunk
+            self.state = self.rebased_state
+        else:
+            self.state = self.current_pass.advance_on_success(test_env.test_case_path, test_env.state)
+        self.pass_statistic.add_success(self.current_pass, bytes_removed, lines_removed)
 
         pct = 100 - (self.total_file_size * 100.0 / self.orig_total_file_size)
         logging.info('({}%, {} bytes, {} lines)'.format(round(pct, 1), self.total_file_size, self.total_line_count))
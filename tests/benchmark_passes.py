@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+"""Time the transformations of the pattern-based passes on a large input.
+
+Every variant is rejected, so the measured work is what the reducer pays
+for the states of a pass that never succeeds.  Pass a preprocessed file
+to benchmark something realistic; by default a test source is replicated.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cvise.passes.abstract import ProcessEventNotifier  # noqa: E402
+from cvise.passes.balanced import BalancedPass  # noqa: E402
+from cvise.passes.peep import PeepPass  # noqa: E402
+from cvise.passes.ternary import TernaryPass  # noqa: E402
+
+PASSES = [BalancedPass('parens'), BalancedPass('curly'), PeepPass('a'), PeepPass('b'), PeepPass('c'),
+          TernaryPass('b'), TernaryPass('c')]
+
+
+def benchmark(pass_, source, max_states):
+    with tempfile.TemporaryDirectory() as folder:
+        test_case = os.path.join(folder, os.path.basename(source))
+        shutil.copy(source, test_case)
+        notifier = ProcessEventNotifier(None)
+
+        start = time.monotonic()
+        states = 0
+        state = pass_.new(test_case)
+        while state is not None and states < max_states:
+            pass_.transform(test_case, state, notifier)
+            shutil.copy(source, test_case)
+            state = pass_.advance(test_case, state)
+            states += 1
+        return (states, time.monotonic() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Balanced, Peep and Ternary passes')
+    parser.add_argument('source', nargs='?', help='Input file (e.g. a preprocessed translation unit)')
+    parser.add_argument('--copies', type=int, default=20, help='Replicate the default source this many times')
+    parser.add_argument('--states', type=int, default=2000, help='Maximum number of states per pass')
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.c') as tmp:
+        source = args.source
+        if source is None:
+            with open(os.path.join(os.path.dirname(__file__), 'sources', 'blocksort-part.c')) as f:
+                tmp.write(f.read() * args.copies)
+            tmp.flush()
+            source = tmp.name
+
+        print('input: {} bytes'.format(os.path.getsize(source)))
+        for pass_ in PASSES:
+            states, seconds = benchmark(pass_, source, args.states)
+            print('{:20} {:6} states {:8.2f}s {:10.2f} ms/state'.format(repr(pass_), states, seconds,
+                                                                        1000 * seconds / max(states, 1)))
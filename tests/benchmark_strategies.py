@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""Count the interestingness tests the BinaryState strategies need.
+
+The lines pass is run sequentially, until it makes no more progress,
+on a test source with an interestingness test that compiles the variant
+and looks for a token.  When every test is an expensive compilation,
+the number of tests is what matters, not the time taken here.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cvise.passes.abstract import PassResult, STRATEGIES  # noqa: E402
+from cvise.passes.lines import LinesPass  # noqa: E402
+
+
+def is_interesting(test_case, token):
+    proc = subprocess.run(['gcc', '-c', '-o', os.devnull, test_case], stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL)
+    if proc.returncode != 0:
+        return False
+    with open(test_case) as f:
+        return token in f.read()
+
+
+def reduce(strategy, source, token):
+    pass_ = LinesPass('None')
+    pass_.strategy = strategy
+    with tempfile.TemporaryDirectory() as folder:
+        test_case = os.path.join(folder, os.path.basename(source))
+        variant = os.path.join(folder, 'variant.c')
+        shutil.copy(source, test_case)
+
+        tests = 0
+        progress = True
+        while progress:
+            progress = False
+            state = pass_.new(test_case)
+            while state is not None:
+                shutil.copy(test_case, variant)
+                (result, state) = pass_.transform(variant, state, None)
+                tests += 1
+                if result == PassResult.OK and is_interesting(variant, token):
+                    shutil.copy(variant, test_case)
+                    state = pass_.advance_on_success(test_case, state)
+                    progress = True
+                else:
+                    state = pass_.advance(test_case, state)
+
+        with open(test_case) as f:
+            return (tests, len(f.read()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the BinaryState strategies of the lines pass')
+    parser.add_argument('source', nargs='?', default=os.path.join(os.path.dirname(__file__), 'sources',
+                                                                  'blocksort-part.c'))
+    parser.add_argument('--token', default='nextHi', help='Token that has to stay in the reduced file')
+    parser.add_argument('--strategies', nargs='+', default=list(STRATEGIES), choices=list(STRATEGIES))
+    args = parser.parse_args()
+
+    for strategy in args.strategies:
+        tests, size = reduce(strategy, args.source, args.token)
+        print('{:10} {:6} tests {:8} bytes left'.format(strategy, tests, size))